@@ -1,21 +1,59 @@
 from flask import Flask, request
 from flask_cors import CORS
-import os, psutil, time, threading,gc
+import os, gc
 from dotenv import load_dotenv
 from .auth import auth_bp
 from .cloth import bp as cloth_bp
 from .recommendation import bp as rec_bp
+from .cloth.embedding_jobs import EMBEDDING_JOBS
+from .embedding_memo import EMBEDDING_MEMO
+from .recommendation.embedding_service import EMBED_CACHE, SHARED_EMBEDDINGS
+from .recommendation.result_cache import RECOMMENDATION_CACHE
+from .memory_logger import log_memory, rss_bytes
+from . import memory_profiler, tracing
 
 # Force garbage collection more frequently
 gc.set_threshold(700, 10, 10)
 
-def monitor_memory_during_startup():
-    process = psutil.Process(os.getpid())
-    for i in range(10):  # check 10 times (~10 seconds)
-        mem = process.memory_info().rss / 1024 / 1024  # in MB
-        print(f"[MEMORY DEBUG] Flask using: {mem:.2f} MB")
-        time.sleep(1)
-        
+# CORS: these origins plus any *.vercel.app preview URL
+ALLOWED_ORIGINS = [
+    "http://localhost:3000",
+    "https://my-ootd.vercel.app",  # Production domain
+]
+
+
+def cors_headers(origin):
+    """Headers for an allowed Origin ({} otherwise); shared by the Flask and ASGI routes."""
+    if not origin or not (origin.endswith(".vercel.app") or origin in ALLOWED_ORIGINS):
+        return {}
+    return {
+        "Access-Control-Allow-Origin": origin,
+        "Access-Control-Allow-Credentials": "true",
+        "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
+        "Access-Control-Allow-Headers": "Content-Type, Authorization",
+        "Vary": "Origin",
+    }
+
+
+# Cache stats that only ever go up (since the worker started): exported as counters
+COUNTER_STATS = frozenset({"hits", "misses", "evictions", "expirations", "writes", "lru_hits", "disk_hits"})
+
+
+def runtime_metrics():
+    """(gauges, counters) of the caches, memo and job queue, exported next to the latency histograms."""
+    gauges = {"process_rss_bytes": rss_bytes(), "embedding_jobs_pending": EMBEDDING_JOBS.pending_count(),
+              "embedding_jobs_failed": EMBEDDING_JOBS.failed_count()}
+    counters = {}
+    for prefix, stats in (
+        ("embedding_cache", EMBED_CACHE.stats()),
+        ("shared_embedding_cache", SHARED_EMBEDDINGS.stats()),
+        ("recommendation_cache", RECOMMENDATION_CACHE.stats()),
+        ("embedding_memo", EMBEDDING_MEMO.stats()),
+    ):
+        for key, value in stats.items():
+            (counters if key in COUNTER_STATS else gauges)[f"{prefix}_{key}"] = value
+    return gauges, counters
+
 
 def create_app():
     # Load .env only in development
@@ -37,15 +75,10 @@ def create_app():
     app.register_blueprint(rec_bp, url_prefix="/api/recommendations", strict_slashes=False)
 
     # --- ✅ FIXED CORS Configuration ---
-    # Define allowed origins
-    allowed_origins = [
-        "http://localhost:3000",
-        "https://my-ootd.vercel.app",  # Production domain
-    ]
     # CORS for specific origins
     CORS(
         app,
-        resources={r"/api/*": {"origins": allowed_origins}},
+        resources={r"/api/*": {"origins": ALLOWED_ORIGINS}},
         supports_credentials=True,
         methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
         allow_headers=["Content-Type", "Authorization"],
@@ -54,23 +87,21 @@ def create_app():
     # Dynamic CORS for Vercel preview URLs
     @app.after_request
     def apply_dynamic_cors(response):
-        origin = request.headers.get("Origin")
-        
         # Allow any *.vercel.app subdomain
-        if origin and (origin.endswith(".vercel.app") or origin in allowed_origins):
-            response.headers["Access-Control-Allow-Origin"] = origin
-            response.headers["Access-Control-Allow-Credentials"] = "true"
-            response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
-            response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization"
-            response.headers["Vary"] = "Origin"
-        
+        response.headers.update(cors_headers(request.headers.get("Origin")))
         return response
     
+    # Background embedding jobs (re-queues jobs left over from a previous run)
+    EMBEDDING_JOBS.init_app(app)
+
     # Health check endpoint for Render
     @app.route("/health")
     def health():
         return {"status": "ok"}, 200
-    
-    # After initializing blueprints, models, etc.
-    threading.Thread(target=monitor_memory_during_startup, daemon=True).start()
+
+    # Prometheus /metrics (ADMIN_TOKEN): per-route stage histograms + runtime gauges and counters
+    tracing.init_app(app, runtime=runtime_metrics)
+    # GET /admin/memory (ADMIN_TOKEN) + per-route tracemalloc when MEMORY_PROFILING=1
+    memory_profiler.init_app(app)
+    log_memory("After create_app")
     return app
\ No newline at end of file
@@ -0,0 +1,52 @@
+import os
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.routing import Mount
+
+from app import cors_headers, create_app
+from app.async_web import json_response
+from app.cloth.async_routes import routes as cloth_routes
+from app.http_client import close_async_http_client
+from app.recommendation.async_routes import routes as rec_routes
+
+# Threads for the routes still served by Flask (auth, bulk import, /metrics, ...)
+WSGI_THREADS = int(os.getenv("WSGI_THREADS", 2))
+
+
+@asynccontextmanager
+async def _lifespan(app):
+    yield
+    await close_async_http_client()
+
+
+async def _http_error(request, exc):
+    return json_response({"message": exc.detail}, exc.status_code)
+
+
+async def _server_error(request, exc):
+    # Answered here rather than by the server, so the 500 still carries the CORS headers
+    print(f"❌ Unhandled error in {request.url.path}: {exc!r}", flush=True)
+    response = json_response({"message": "Internal server error"}, 500)
+    response.headers.update(cors_headers(request.headers.get("origin")))
+    return response
+
+
+def create_asgi_app(flask_app=None):
+    """
+    ASGI entry point (SERVER_MODE=asgi). Recommendation and closet CRUD routes
+    run as Starlette coroutines, so requests waiting on Supabase or the LLM cost
+    a coroutine each instead of a thread. Everything else (other methods and
+    paths, trailing-slash variants, CORS preflights) falls through to the Flask
+    app, mounted with a2wsgi on WSGI_THREADS threads.
+    """
+    flask_app = flask_app or create_app()
+    app = Starlette(
+        routes=[*cloth_routes, *rec_routes, Mount("/", app=WSGIMiddleware(flask_app, workers=WSGI_THREADS))],
+        exception_handlers={HTTPException: _http_error, Exception: _server_error},
+        lifespan=_lifespan,
+    )
+    app.state.flask_app = flask_app
+    return app
@@ -0,0 +1,93 @@
+import json
+from functools import wraps
+
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse, StreamingResponse  # noqa: F401 (re-exported for the routes)
+from starlette.routing import Route
+
+from app import cors_headers, tracing
+from app.auth.auth_utils import authenticate
+from app.memory_profiler import MEMORY_PROFILER
+from app.utils import CURRENT_USER_ID
+
+# Starlette glue for the ASGI routes: JSON bodies and responses shaped like the
+# Flask routes', token auth, and per-route hooks standing in for the Flask app's
+# before/after_request ones (tracing, memory profiling, CORS).
+
+
+class _JSONResponse(JSONResponse):
+    def render(self, content):
+        return json.dumps(content, default=str).encode("utf-8")  # datetimes etc., like jsonify
+
+
+def json_response(data, status=200):
+    return _JSONResponse(data, status)
+
+
+async def read_json(request):
+    """Parsed JSON body (None when empty); 400 when it isn't JSON, like Flask's request.json."""
+    body = await request.body()
+    if not body:
+        return None
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise HTTPException(400, "Failed to decode JSON object")
+
+
+def token_required(handler):
+    """Async twin of auth_utils.token_required: same 401 bodies, user id in CURRENT_USER_ID."""
+    @wraps(handler)
+    async def decorated(request):
+        user_id, error = authenticate(request.headers.get("authorization"))
+        if error:
+            return json_response({"message": error}, 401)
+        CURRENT_USER_ID.set(user_id)  # reset by RouteHooks when the request ends
+        return await handler(request)
+
+    return decorated
+
+
+class RouteHooks:
+    """
+    ASGI middleware around one async route: labels its spans, records the
+    request's latency, status and memory growth once the body (streamed or
+    not) has been sent, and adds the CORS headers Flask's after_request adds.
+    """
+
+    def __init__(self, app, endpoint):
+        self.app = app
+        self.endpoint = endpoint
+
+    async def __call__(self, scope, receive, send):
+        cors = [(k.lower().encode("latin-1"), v.encode("latin-1"))
+                for k, v in cors_headers(Headers(scope=scope).get("origin")).items()]
+        status = 500
+
+        async def send_with_cors(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), *cors]}
+            await send(message)
+
+        user_token = CURRENT_USER_ID.set(None)
+        trace = tracing.start_async_request(self.endpoint)
+        memory_start = MEMORY_PROFILER.start_async_request()
+        try:
+            await self.app(scope, receive, send_with_cors)
+        finally:
+            tracing.finish_async_request(trace, status)
+            CURRENT_USER_ID.reset(user_token)
+            await MEMORY_PROFILER.finish_async_request(self.endpoint, memory_start)  # last: may await a snapshot
+
+
+def route(blueprint, path, handler, methods):
+    """
+    Route for an async handler, named "<blueprint>.<handler>" like the Flask
+    endpoint it replaces so metrics line up across modes.
+    """
+    endpoint = f"{blueprint}.{handler.__name__}"
+    return Route(path, handler, methods=methods, name=endpoint, middleware=[Middleware(RouteHooks, endpoint=endpoint)])
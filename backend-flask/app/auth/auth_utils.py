@@ -1,3 +1,4 @@
+import hmac
 import traceback
 from functools import wraps
 from flask import request, jsonify, g
@@ -6,34 +7,60 @@ import os
 
 SECRET_KEY = os.getenv("SECRET_KEY_BACKEND", "dev-secret")
 
+
+def bearer_token(authorization):
+    """Token from an 'Authorization: Bearer <token>' header value, or None."""
+    parts = (authorization or "").split(" ")
+    return parts[1] if len(parts) == 2 else None
+
+
+def authenticate(authorization):
+    """
+    (user_id, None) for a valid token, else (None, error message) for the 401 body.
+    Shared by the Flask decorator and the async routes.
+    """
+    token = bearer_token(authorization)
+    if not token:
+        return None, "Token is missing"
+
+    # Decode token
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        return payload.get("sub"), None
+    except jwt.ExpiredSignatureError:
+        print("JWT expired!")
+        return None, "Token expired"
+    except jwt.InvalidTokenError:
+        traceback.print_exc()
+        return None, "Invalid token"
+    except Exception:
+        return None, "Invalid token"
+
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        if 'Authorization' in request.headers:
-            parts = request.headers['Authorization'].split(" ")
+        user_id, error = authenticate(request.headers.get('Authorization'))
+        if error:
+            return jsonify({"message": error}), 401
+        g.user_id = user_id  # save into request context
+
+        return f(*args, **kwargs)
+        # return f(user_id=user_id, *args, **kwargs)
 
-            if len(parts) == 2:
-                token = parts[1]
+    return decorated
 
-        if not token:
-            return jsonify({"message": "Token is missing"}), 401
-        
-        # Decode token
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            g.user_id = payload.get("sub")  # save into request context
-
-        except jwt.ExpiredSignatureError:
-            print("JWT expired!")
-            return jsonify({"message": "Token expired"}), 401
-        except jwt.InvalidTokenError as e:
-            traceback.print_exc()
-            return jsonify({"message": "Invalid token"}), 401
-        except Exception:
-            return jsonify({"message": "Invalid token"}), 401
 
+def admin_required(f):
+    """Ops routes: X-Admin-Token must match ADMIN_TOKEN (404 while ADMIN_TOKEN is unset, 401 on mismatch)."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = os.getenv("ADMIN_TOKEN")
+        if not token:
+            return jsonify({"error": "Not found"}), 404
+        supplied = request.headers.get("X-Admin-Token", "")
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            return jsonify({"error": "Unauthorized"}), 401
         return f(*args, **kwargs)
-        # return f(user_id=user_id, *args, **kwargs)
 
-    return decorated
\ No newline at end of file
+    return decorated
@@ -0,0 +1,233 @@
+import asyncio
+import os
+
+import anyio
+from supabase import acreate_client
+
+from app.memory_logger import log_memory
+from app.tracing import span
+from app.utils import get_current_user_id, generate_embedding, cached_embedding
+from .db_service import (
+    MAX_PAGE_SIZE,
+    IMAGE_BUCKET,
+    InvalidClothError,
+    build_embedding_text,
+    cloth_count_query,
+    cloth_embedding_query,
+    cloth_ids_query,
+    cloth_upsert_params,
+    clothes_by_type_query,
+    clothes_page_query,
+    clothes_page_result,
+    details_query,
+    finish_cloth_save,
+    format_cloth_row,
+    format_details,
+    legacy_embedding_ids,
+    legacy_embedding_query,
+    merge_legacy_embeddings,
+    parse_cloth_input,
+    similar_clothes_query,
+    storage_image_path,
+)
+from .embedding_jobs import embedding_mode
+
+# Async twins of the db_service functions used by the ASGI routes. Query
+# building and result shaping are shared with db_service; only the awaits differ.
+
+_async_supabase = None
+_async_supabase_lock = None
+
+
+async def get_async_supabase():
+    """AsyncClient on the worker's event loop (no Flask app, so config comes from the env)."""
+    global _async_supabase, _async_supabase_lock
+    if _async_supabase is None:
+        if _async_supabase_lock is None:
+            _async_supabase_lock = asyncio.Lock()
+        async with _async_supabase_lock:
+            if _async_supabase is None:
+                _async_supabase = await acreate_client(
+                    os.getenv("SUPABASE_URL"),
+                    os.getenv("SUPABASE_SERVICE_ROLE_KEY"),
+                )
+    return _async_supabase
+
+
+async def get_clothes_by_type_async(category: str | None, limit: int, offset: int):
+    user_id = get_current_user_id()
+    if not user_id:
+        return []
+
+    query = clothes_by_type_query(await get_async_supabase(), user_id, category, limit, offset)
+    data = await query.execute()
+    return [format_cloth_row(row) for row in data.data]
+
+
+async def get_clothes_page_async(category: str | None, limit: int, cursor: str | None = None, with_counts: bool = False):
+    user_id = get_current_user_id()
+    if not user_id:
+        return {"items": [], "next_cursor": None}
+
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = clothes_page_query(await get_async_supabase(), user_id, category, limit, cursor)
+    if with_counts:
+        # Both round trips in flight at once
+        rows, counts = await asyncio.gather(_execute_rows(query), count_clothes_by_category_async())
+    else:
+        rows, counts = await _execute_rows(query), None
+    result = clothes_page_result(rows, limit)
+    if with_counts:
+        result["counts"] = counts
+    return result
+
+
+async def _execute_rows(query):
+    with span("supabase.clothes_page"):
+        return (await query.execute()).data or []
+
+
+async def count_clothes_by_category_async():
+    user_id = get_current_user_id()
+    if not user_id:
+        return {}
+    try:
+        supabase = await get_async_supabase()
+        response = await supabase.rpc("count_clothes_by_category", {"p_user_id": user_id}).execute()
+        return {row["category"]: row["count"] for row in response.data or []}
+    except Exception as e:
+        print("Error counting clothes by category:", e)
+        return {}
+
+
+async def insert_cloth_with_styles_embedding_async(cloth_data):
+    """insert_cloth_with_styles_embedding(); a sync-mode embedding runs in a worker thread."""
+    user_id = get_current_user_id()
+    if not user_id:
+        return {"success": False, "error": "Unauthorized"}
+
+    supabase = await get_async_supabase()
+
+    try:
+        cloth = parse_cloth_input(cloth_data)  # InvalidClothError reaches the route as a 400
+        embedding_text = build_embedding_text(cloth)
+        embedding_vector = cached_embedding(embedding_text)
+        if embedding_vector is None and embedding_mode() == "sync":
+            embedding_vector = await anyio.to_thread.run_sync(generate_embedding, embedding_text)
+            log_memory("After single item embedding generation")
+
+        params = cloth_upsert_params(user_id, cloth, embedding_vector)
+        with span("supabase.upsert_cloth"):
+            response = await supabase.rpc("upsert_cloth_with_styles", params).execute()
+        return finish_cloth_save(user_id, response.data, embedding_text, embedding_vector)
+
+    except InvalidClothError:
+        raise
+    except Exception as e:
+        print("Error inserting cloth with styles:", e)
+        return {"success": False, "error": str(e)}
+
+
+async def delete_cloth_in_db_async(cloth_id: int) -> bool:
+    from app.recommendation.embedding_service import remove_user_embedding
+    from app.recommendation.result_cache import bump_wardrobe_version
+
+    user_id = get_current_user_id()
+    if not user_id:
+        return False
+
+    supabase = await get_async_supabase()
+    try:
+        cloth_res = await supabase.table("clothes").select("image_url")\
+            .eq("id", cloth_id).eq("user_id", user_id).execute()
+        if not cloth_res.data:
+            return False  # cloth not found
+
+        delete_res = await supabase.table("clothes").delete()\
+            .eq("id", cloth_id).eq("user_id", user_id).execute()
+        if not delete_res.data:
+            return False  # deletion failed
+        remove_user_embedding(user_id, cloth_id)
+        bump_wardrobe_version(user_id)
+
+        file_path = storage_image_path(cloth_res.data[0].get("image_url"))
+        if file_path:
+            try:
+                await supabase.storage.from_(IMAGE_BUCKET).remove([file_path])
+            except Exception as storage_error:
+                # Log the error but do not fail the whole operation
+                print(f"Warning:Failed to delete image from storage: {storage_error}")
+        return True
+    except Exception as e:
+        print(f"Error deleting cloth item: {e}")
+        return False
+
+
+async def get_all_cloth_embedding_async():
+    supabase = await get_async_supabase()
+    user_id = get_current_user_id()
+
+    try:
+        data = (await cloth_embedding_query(supabase, user_id).execute()).data or []
+        missing_ids = legacy_embedding_ids(data)
+        if missing_ids:
+            legacy = await legacy_embedding_query(supabase, user_id, missing_ids).execute()
+            merge_legacy_embeddings(data, legacy.data)
+        return data
+    except Exception as e:
+        print("Error fetching all items embedding:", e)
+        return None
+
+
+async def get_cloth_embedding_changes_async(since: float):
+    """get_cloth_embedding_changes(); the delta and the count are fetched concurrently."""
+    supabase = await get_async_supabase()
+    user_id = get_current_user_id()
+
+    try:
+        changed, counted = await asyncio.gather(
+            cloth_embedding_query(supabase, user_id, since).execute(),
+            cloth_count_query(supabase, user_id).execute(),
+        )
+        data = changed.data or []
+        missing_ids = legacy_embedding_ids(data)
+        if missing_ids:
+            legacy = await legacy_embedding_query(supabase, user_id, missing_ids).execute()
+            merge_legacy_embeddings(data, legacy.data)
+        return data, counted.count
+    except Exception as e:
+        print("Error fetching changed items embedding:", e)
+        return None
+
+
+async def get_cloth_ids_async():
+    supabase = await get_async_supabase()
+    user_id = get_current_user_id()
+
+    try:
+        return [row["id"] for row in (await cloth_ids_query(supabase, user_id).execute()).data or []]
+    except Exception as e:
+        print("Error fetching cloth ids:", e)
+        return None
+
+
+async def get_similar_clothes_async(item_id: int, exclusions, per_category: int):
+    supabase = await get_async_supabase()
+    try:
+        return (await similar_clothes_query(supabase, get_current_user_id(), item_id, exclusions, per_category).execute()).data
+    except Exception as e:
+        print("Error fetching similar clothes:", e)
+        return None
+
+
+async def get_details_for_ids_async(valid_ids, with_image=False):
+    if not valid_ids:
+        return []
+
+    supabase = await get_async_supabase()
+    try:
+        response = await details_query(supabase, get_current_user_id(), valid_ids, with_image).execute()
+        return format_details(response.data or [])
+    except Exception as e:
+        print("Error fetching details for IDs:", e)
+        return []
@@ -0,0 +1,78 @@
+from app.async_web import json_response, read_json, route, token_required
+
+from .async_db_service import (
+    delete_cloth_in_db_async,
+    get_clothes_by_type_async,
+    get_clothes_page_async,
+    insert_cloth_with_styles_embedding_async,
+)
+
+# Async versions of the closet CRUD routes in routes.py (served in SERVER_MODE=asgi)
+
+
+# Get cloth by type
+@token_required
+async def get_wardrobe(request):
+    category = request.query_params.get("type", "all").lower()
+    try:
+        limit = int(request.query_params.get("limit", 3))
+        offset = int(request.query_params.get("offset", 0))
+    except ValueError:
+        return json_response({"message": "limit and offset must be integers"}, 400)
+
+    # Keyset pagination: `cursor` present (empty for the first page)
+    if "cursor" in request.query_params:
+        try:
+            page = await get_clothes_page_async(
+                None if category in ("", "all") else category,
+                limit,
+                request.query_params.get("cursor") or None,
+                with_counts=request.query_params.get("counts") in ("1", "true"),
+            )
+        except ValueError as e:
+            return json_response({"message": str(e)}, 400)
+        return json_response(page)
+
+    clothes = await get_clothes_by_type_async(None if category in ("", "all") else category, limit, offset)
+    return json_response(clothes)
+
+
+# Create new cloth with embedding and styles
+@token_required
+async def insert_update_cloth(request):
+    data = await read_json(request)
+    try:
+        result = await insert_cloth_with_styles_embedding_async(data)
+        if not result:
+            return json_response({"message": "Insert failed"}, 500)
+
+        return json_response(result, 201)
+    except ValueError as e:  # malformed payload (InvalidClothError)
+        return json_response({"message": str(e)}, 400)
+    except Exception as e:
+        return json_response({"message": str(e)}, 500)
+
+
+#Delete cloth item
+@token_required
+async def delete_cloth(request):
+    """ Delete cloth and its image by id """
+    id = request.path_params["id"]
+    if not id:
+        return json_response({"message": "Cloth ID is required"}, 400)
+    try:
+        success = await delete_cloth_in_db_async(id)
+        if not success:
+            return json_response({"message": "Cloth not found or delete failed"}, 404)
+
+        return json_response({"message": "Cloth deleted successfully"}, 200)
+
+    except Exception as e:
+        return json_response({"message": "An error occurred while deleting the cloth item", "error": str(e)}, 500)
+
+
+routes = [
+    route("clothes", "/api/clothes", get_wardrobe, methods=["GET"]),
+    route("clothes", "/api/clothes", insert_update_cloth, methods=["POST"]),
+    route("clothes", "/api/clothes/{id:int}", delete_cloth, methods=["DELETE"]),
+]
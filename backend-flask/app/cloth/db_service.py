@@ -1,9 +1,16 @@
 from supabase import create_client
 from flask import current_app
+import os
 import unicodedata
+import base64
+import json
+from datetime import datetime, timezone
 from app.memory_logger import log_memory
+from app.tracing import span
 
-from app.utils import get_current_user_id,generate_embedding
+from app.utils import get_current_user_id, generate_embedding, generate_embeddings, cached_embedding
+from app.embedding_codec import encode_embedding_b64, format_vector_text, use_binary_embeddings
+from .embedding_jobs import EMBEDDING_JOBS, embedding_mode
 _supabase = None
 
 TYPE_TO_CATEGORY = {
@@ -30,38 +37,121 @@ def get_supabase():
 
 
 
+CLOTH_LIST_COLUMNS = """
+        id, name, type, colour, category, image_url,
+        clothes_styles (
+            styles (id, name)
+        )
+    """
+MAX_PAGE_SIZE = 100
+
+
+def format_cloth_row(row):
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "type": row["type"],
+        "colour": row["colour"],
+        "category": row["category"],
+        "styles": [cs["styles"]["name"] for cs in row.get("clothes_styles", []) if cs.get("styles")],
+        "image_url": row["image_url"]
+    }
+
+
+def clothes_by_type_query(supabase, user_id, category: str | None, limit: int, offset: int):
+    """Offset page query; also used by the async routes (sync or async client)."""
+    query = supabase.table("clothes").select(CLOTH_LIST_COLUMNS)\
+        .eq("user_id", user_id).range(offset, offset + limit - 1)
+
+    if category and category.lower() != "all":
+        query = query.eq("category", category.lower())
+    return query
+
+
 # Fetch cloth by type and pagination
 def get_clothes_by_type(category: str | None, limit: int, offset: int):
     user_id = get_current_user_id()
     if not user_id:
         return []
 
-    supabase = get_supabase()
-    query = supabase.table("clothes").select("""
-        id, name, type, colour, category, image_url,
-        clothes_styles (
-            styles (id, name)
-        )
-    """).eq("user_id", user_id).range(offset, offset + limit - 1)
-    
+    data = clothes_by_type_query(get_supabase(), user_id, category, limit, offset).execute()
+    result = [format_cloth_row(row) for row in data.data]
+    return result
+
+
+def encode_page_cursor(category: str, cloth_id: int) -> str:
+    raw = json.dumps([category, cloth_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_page_cursor(cursor: str):
+    """Returns (category, id); raises ValueError on a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        category, cloth_id = json.loads(raw)
+        return str(category), int(cloth_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def clothes_page_query(supabase, user_id, category: str | None, limit: int, cursor: str | None = None):
+    """Keyset page query (limit + 1 rows to detect a next page); raises ValueError on a bad cursor."""
+    query = supabase.table("clothes").select(CLOTH_LIST_COLUMNS)\
+        .eq("user_id", user_id).order("category").order("id").limit(limit + 1)
+
     if category and category.lower() != "all":
         query = query.eq("category", category.lower())
+    if cursor:
+        after_category, after_id = decode_page_cursor(cursor)
+        after_category = after_category.replace('"', "")
+        query = query.or_(
+            f'category.gt."{after_category}",and(category.eq."{after_category}",id.gt.{after_id})'
+        )
+    return query
+
 
-    data = query.execute()
-    result = [
-        {
-            "id": row["id"],
-            "name": row["name"],
-            "type": row["type"],
-            "colour": row["colour"],
-            "category": row["category"],
-            "styles": [cs["styles"]["name"] for cs in row.get("clothes_styles", []) if cs.get("styles")],
-            "image_url": row["image_url"]
-        }
-        for row in data.data
-    ]
+def clothes_page_result(rows, limit: int):
+    page = rows[:limit]
+    return {
+        "items": [format_cloth_row(row) for row in page],
+        "next_cursor": encode_page_cursor(page[-1]["category"], page[-1]["id"]) if len(rows) > limit else None,
+    }
+
+
+# Fetch cloth by type with keyset pagination on (category, id)
+def get_clothes_page(category: str | None, limit: int, cursor: str | None = None, with_counts: bool = False):
+    """
+    Stable cost per page however deep the user scrolls: rows after the cursor
+    are found through the (user_id, category, id) index instead of skipping
+    `offset` rows.
+    Returns {items, next_cursor (None on the last page), counts? {category: n}}.
+    """
+    user_id = get_current_user_id()
+    if not user_id:
+        return {"items": [], "next_cursor": None}
+
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = clothes_page_query(get_supabase(), user_id, category, limit, cursor)
+
+    with span("supabase.clothes_page"):
+        rows = query.execute().data or []
+    result = clothes_page_result(rows, limit)
+    if with_counts:
+        result["counts"] = count_clothes_by_category()
     return result
 
+
+def count_clothes_by_category():
+    user_id = get_current_user_id()
+    if not user_id:
+        return {}
+    try:
+        response = get_supabase().rpc("count_clothes_by_category", {"p_user_id": user_id}).execute()
+        return {row["category"]: row["count"] for row in response.data or []}
+    except Exception as e:
+        print("Error counting clothes by category:", e)
+        return {}
+
 # Fetch all items
 # def get_all_items():
 #     supabase = get_supabase()
@@ -186,6 +276,7 @@ def get_random_items():
         
 # Update cloth image URL only 
 def update_cloth_url(cloth_id: int, image_url:str) -> bool:
+    from app.recommendation.result_cache import bump_wardrobe_version
     user_id = get_current_user_id()
     if not user_id:
             return False
@@ -194,17 +285,32 @@ def update_cloth_url(cloth_id: int, image_url:str) -> bool:
     supabase = get_supabase()
     try:
         res = supabase.table("clothes").update({"image_url":image_url}).eq("id", cloth_id).execute()
+        if res.data:
+            bump_wardrobe_version(user_id)  # cached outfits carry image URLs
         return bool(res.data)  # True if at least one row updated
     except Exception as e:
         print("Error updating cloth URL:", e)
         return False
 
+IMAGE_BUCKET = "clothes-images"
+
+
+# Path of an uploaded image inside the storage bucket, or None for foreign URLs
+def storage_image_path(image_url):
+    if not image_url or f"/{IMAGE_BUCKET}/" not in image_url:
+        return None
+    # Remove any query parameters
+    return image_url.split(f"{IMAGE_BUCKET}/")[1].split("?")[0]
+
+
 # Delete cloth item
 def delete_cloth_in_db(cloth_id: int) -> bool:
     """
     Deletes a cloth item by its ID.
     Returns True if deletion succeeded, False otherwise.
     """
+    from app.recommendation.embedding_service import remove_user_embedding
+    from app.recommendation.result_cache import bump_wardrobe_version
     
     user_id = get_current_user_id()
     if not user_id:
@@ -228,17 +334,14 @@ def delete_cloth_in_db(cloth_id: int) -> bool:
         
         if not delete_res.data:
             return False #deletion failed
+        remove_user_embedding(user_id, cloth_id)
+        bump_wardrobe_version(user_id)
         
         #delete image from storage
-        if image_url:
+        file_path = storage_image_path(image_url)
+        if file_path:
             try:
-                # Extract the file path from url
-                if "/clothes-images/" in image_url:
-                    file_path = image_url.split("clothes-images/")[1]
-                    # Remove any query parameters
-                    file_path = file_path.split("?")[0]
-                    
-                    supabase.storage.from_("clothes-images").remove([file_path])
+                supabase.storage.from_(IMAGE_BUCKET).remove([file_path])
             except Exception as storage_error:
                 # Log the error but do not fail the whole operation
                 print(f"Warning:Failed to delete image from storage: {storage_error}")
@@ -362,9 +465,111 @@ def delete_cloth_in_db(cloth_id: int) -> bool:
 #     return selected_item, relevant_style_items
 
 
+class InvalidClothError(ValueError):
+    """Malformed cloth payload (missing, blank or non-string fields): a 400, not a failed save."""
+
+
+# Normalize one cloth payload from the frontend (shared by single and bulk saves)
+def normalize_cloth_input(cloth_data):
+    name = unicodedata.normalize("NFC", cloth_data["name"]).strip()
+    type_ = unicodedata.normalize("NFC", cloth_data["type"]).strip().lower()
+    colour = unicodedata.normalize("NFC", cloth_data["colour"]).strip().lower()
+    if not name or not type_:
+        raise ValueError("name and type are required")
+    return {
+        "id": cloth_data.get("id"),
+        "name": name,
+        "type": type_,
+        "category": TYPE_TO_CATEGORY.get(type_, "unknown"),
+        "colour": colour,
+        "styles": cloth_data.get("styles") or [],
+    }
+
+
+def parse_cloth_input(cloth_data):
+    """normalize_cloth_input(), with any malformed payload raised as InvalidClothError."""
+    try:
+        return normalize_cloth_input(cloth_data)
+    except (KeyError, TypeError, AttributeError, ValueError) as e:
+        raise InvalidClothError(f"Invalid item: {e}") from e
+
+
+# Text that gets embedded for the prefilter
+def build_embedding_text(cloth):
+    styles_text = " ".join([s.get("name", "") for s in cloth["styles"]])
+    return f"{cloth['name']} {cloth['colour']} {cloth['type']} {styles_text}"
+
+
+# Column values for a freshly generated embedding
+def embedding_columns(embedding_vector):
+    columns = {"embedding": embedding_vector}
+    if use_binary_embeddings():
+        columns["embedding_b64"] = encode_embedding_b64(embedding_vector)
+    return columns
+
+
+# upsert_cloth_with_styles RPC arguments
+def cloth_upsert_params(user_id, cloth, embedding_vector):
+    styles_input = cloth["styles"]
+    embedding = embedding_columns(embedding_vector) if embedding_vector is not None else {}
+    return {
+        "p_user_id": user_id,
+        "p_cloth_id": cloth["id"],
+        "p_name": cloth["name"],
+        "p_type": cloth["type"],
+        "p_category": cloth["category"],
+        "p_colour": cloth["colour"],
+        "p_style_ids": [int(s["id"]) for s in styles_input if s.get("id")],
+        "p_style_names": [s["name"] for s in styles_input if s.get("name") and not s.get("id")],
+        "p_embedding": format_vector_text(embedding["embedding"]) if embedding else None,
+        "p_embedding_b64": embedding.get("embedding_b64"),
+    }
+
+
+# After the upsert RPC: embedding job, caches and the response (without embedding)
+def finish_cloth_save(user_id, row, embedding_text, embedding_vector):
+    from app.recommendation.embedding_service import (
+        mark_user_embedding_pending,
+        update_user_embedding_category,
+        upsert_user_embedding,
+    )
+    from app.recommendation.result_cache import bump_wardrobe_version
+
+    if not row:
+        return {"success": False, "error": "Failed to fetch saved cloth"}
+    cloth_id = row["id"]
+
+    # Queue the embedding if it wasn't available inline
+    if embedding_vector is not None:
+        EMBEDDING_JOBS.cancel(cloth_id)  # an older queued edit must not overwrite this one
+    else:
+        EMBEDDING_JOBS.enqueue(user_id, cloth_id, embedding_text)
+
+    cloth_data = {
+        "id": cloth_id,
+        "name": row["name"],
+        "type": row["type"],
+        "colour": row["colour"],
+        "category": row["category"],
+        "image_url": row["image_url"],
+        "styles": row.get("styles") or [],
+        "embedding_status": "ready" if embedding_vector is not None else "pending",
+    }
+    # Patch the cached embeddings rather than refetching them all
+    if embedding_vector is not None:
+        upsert_user_embedding(user_id, cloth_id, row["category"], embedding_vector)
+    elif row.get("has_embedding"):
+        update_user_embedding_category(user_id, cloth_id, row["category"])  # old vector until the job lands
+    else:
+        mark_user_embedding_pending(user_id, cloth_id)
+    bump_wardrobe_version(user_id)
+    return {"success": True, "cloth": cloth_data}
+
+
 def insert_cloth_with_styles_embedding(cloth_data):
     """
-    Create or update a cloth item along with its styles and embedding.
+    Create or update a cloth item along with its styles and embedding, in one
+    `upsert_cloth_with_styles` RPC (single round trip, single transaction).
     
     cloth_data: {
         id?: int,          # optional for update
@@ -374,7 +579,6 @@ def insert_cloth_with_styles_embedding(cloth_data):
         styles: [{id?: int, name?: str}, ...]  # existing or new styles
     }
     """
-    from app.recommendation.embedding_service import clear_user_embeddings
     user_id = get_current_user_id()
     if not user_id:
         return {"success": False, "error": "Unauthorized"}
@@ -382,155 +586,358 @@ def insert_cloth_with_styles_embedding(cloth_data):
     supabase = get_supabase()
     print('Get data from request:', cloth_data)
 
-    # Normalize inputs
-    name = unicodedata.normalize("NFC", cloth_data["name"]).strip()
-    type_ = unicodedata.normalize("NFC", cloth_data["type"]).strip().lower()
-    category = TYPE_TO_CATEGORY.get(type_, "unknown")
-    colour = unicodedata.normalize("NFC", cloth_data["colour"]).strip().lower()
-    styles_input = cloth_data.get("styles", [])
-    cloth_id = cloth_data.get("id")  # optional
-
     try:
-        # 1. Separate existing vs new styles
-        existing_style_ids = [s["id"] for s in styles_input if s.get("id")]
-        new_style_names = [s["name"].strip().lower() for s in styles_input if s.get("name") and not s.get("id")]
+        # Normalize inputs (InvalidClothError reaches the route as a 400)
+        cloth = parse_cloth_input(cloth_data)
+
+        # 1. Embedding for prefilter: inline if memoized or EMBEDDING_MODE=sync,
+        #    otherwise computed by the background job queue after we return
+        embedding_text = build_embedding_text(cloth)
+        print('embedding_text:', embedding_text)
+        embedding_vector = cached_embedding(embedding_text)
+        if embedding_vector is None and embedding_mode() == "sync":
+            embedding_vector = generate_embedding(embedding_text)
+            log_memory("After single item embedding generation")
+
+        # 2. Styles, cloth row, junction rows and embedding in one transaction
+        params = cloth_upsert_params(user_id, cloth, embedding_vector)
+        with span("supabase.upsert_cloth"):
+            response = supabase.rpc("upsert_cloth_with_styles", params).execute()
+        log_memory("After DB upsert")
+        return finish_cloth_save(user_id, response.data, embedding_text, embedding_vector)
+
+    except InvalidClothError:
+        raise
+    except Exception as e:
+        print("Error inserting cloth with styles:", e)
+        return {"success": False, "error": str(e)}
+    
+
+
+MAX_BULK_ITEMS = 200
 
-        # 2. Insert new styles if needed
-        new_style_rows = []
+
+# Bulk wardrobe import: batched statements + one embedding call for all items
+def bulk_insert_clothes_with_styles_embedding(items):
+    """
+    Create (or update, matched by id or name like the single save) many cloth items.
+
+    items: list of cloth_data dicts, same shape as insert_cloth_with_styles_embedding().
+    Returns {"success": bool, "results": [{index, success, cloth?, error?}, ...]}
+    with one result per input item, in order.
+    """
+    from app.recommendation.embedding_service import clear_user_embeddings
+    from app.recommendation.result_cache import bump_wardrobe_version
+    user_id = get_current_user_id()
+    if not user_id:
+        return {"success": False, "error": "Unauthorized"}
+
+    supabase = get_supabase()
+    results = [None] * len(items)
+
+    # 1. Normalize; reject malformed items and duplicate names within the batch
+    valid = []  # (index, normalized cloth)
+    seen_names = set()
+    for index, item in enumerate(items):
+        try:
+            cloth = parse_cloth_input(item)
+        except InvalidClothError as e:
+            results[index] = {"index": index, "success": False, "error": str(e)}
+            continue
+        if cloth["name"] in seen_names:
+            results[index] = {"index": index, "success": False, "error": "Duplicate name in import"}
+            continue
+        seen_names.add(cloth["name"])
+        valid.append((index, cloth))
+
+    if not valid:
+        return {"success": False, "results": results}
+
+    try:
+        # 2. Upsert every new style name once
+        new_style_names = sorted({
+            s["name"].strip().lower()
+            for _, cloth in valid for s in cloth["styles"]
+            if s.get("name") and not s.get("id") and s["name"].strip()
+        })
+        style_ids_by_name = {}
         if new_style_names:
-            insert_resp = supabase.table("styles").insert([{"name": n} for n in new_style_names]).select("*").execute()
-            new_style_rows = insert_resp.data or []
-
-        all_style_ids = existing_style_ids + [row["id"] for row in new_style_rows]
-        print("All style IDs to link:", all_style_ids)
-
-        # 3. Check if exist cloth item. Insert cloth row (without image_url yet)
-        if cloth_id:
-            # Update existing cloth
-            supabase.table("clothes").update({
-                "name": name,
-                "type": type_,
-                "category": category,
-                "colour": colour
-            }).eq("id", cloth_id).execute()
+            style_rows = create_style_tags(new_style_names)
+            if style_rows is None:
+                raise Exception("Failed to create style tags")
+            style_ids_by_name = {row["name"]: row["id"] for row in style_rows}
+
+        # 3. Match existing clothes by id (must be owned) or by name, in two queries
+        given_ids = [cloth["id"] for _, cloth in valid if cloth["id"]]
+        owned_ids = set()
+        if given_ids:
+            owned = supabase.table("clothes").select("id")\
+                .eq("user_id", user_id).in_("id", given_ids).execute()
+            owned_ids = {row["id"] for row in owned.data or []}
+        names = [cloth["name"] for _, cloth in valid if not cloth["id"]]
+        ids_by_name = {}
+        if names:
+            existing = supabase.table("clothes").select("id, name")\
+                .eq("user_id", user_id).in_("name", names).execute()
+            ids_by_name = {row["name"]: row["id"] for row in existing.data or []}
+
+        pending = []
+        for index, cloth in valid:
+            if cloth["id"] and cloth["id"] not in owned_ids:
+                results[index] = {"index": index, "success": False, "error": "Cloth not found or not yours"}
+                continue
+            cloth["id"] = cloth["id"] or ids_by_name.get(cloth["name"])
+            pending.append((index, cloth))
+
+        # 4. Embeddings like the single save: memoized ones inline, the rest in one
+        #    batched call (EMBEDDING_MODE=sync) or, in async mode or if that call
+        #    fails, by the background job queue once the rows are saved
+        texts = [build_embedding_text(cloth) for _, cloth in pending]
+        if embedding_mode() == "sync":
+            try:
+                embeddings = generate_embeddings(texts)
+            except Exception as e:
+                print("⚠️ Bulk embedding failed, queueing embedding jobs instead:", e, flush=True)
+                embeddings = [cached_embedding(text) for text in texts]
+            log_memory("After bulk embedding generation")
         else:
-            # Check if cloth exists by name/user
-            existing = supabase.table("clothes")\
-                .select("*")\
-                .eq("user_id", user_id)\
-                .eq("name", name)\
-                .execute()
-            
-            if existing.data and len(existing.data) > 0:
-                # Cloth already exists, update it
-                cloth_id = existing.data[0]["id"]
-                supabase.table("clothes").update({
-                    "type": type_,
-                    "category": category,
-                    "colour": colour
-                }).eq("id", cloth_id).execute()
-            else:
-                # Insert new cloth
-                insert_resp = supabase.table("clothes").insert({
-                    "user_id": user_id,
-                    "name": name,
-                    "type": type_,
-                    "category": category,
-                    "colour": colour
-                }, returning="representation").execute()
-                cloth_id = insert_resp.data[0]["id"]
-
-        # 4. Update junction table: remove old links and insert current
-        if cloth_id and all_style_ids:
-            supabase.table("clothes_styles").delete().eq("cloth_id", cloth_id).execute()
-            junction_payload = [{"cloth_id": cloth_id, "style_id": sid} for sid in all_style_ids]
+            embeddings = [cached_embedding(text) for text in texts]
+        for (_, cloth), text, embedding in zip(pending, texts, embeddings):
+            cloth["embedding_text"], cloth["embedding"] = text, embedding
+
+        # 5. Insert new rows / upsert existing rows, one statement per row shape
+        def cloth_row(cloth):
+            row = {
+                "user_id": user_id,
+                "name": cloth["name"],
+                "type": cloth["type"],
+                "category": cloth["category"],
+                "colour": cloth["colour"],
+            }
+            if cloth["embedding"] is not None:
+                row.update(embedding_columns(cloth["embedding"]))
+            return row
+
+        new_rows = [(index, cloth, cloth_row(cloth)) for index, cloth in pending if not cloth["id"]]
+        updates = [cloth for _, cloth in pending if cloth["id"]]
+        if new_rows:
+            inserted = supabase.table("clothes").insert([row for _, _, row in new_rows], returning="representation").execute()
+            ids_by_name = {row["name"]: row["id"] for row in inserted.data or []}
+            for _, cloth, _ in new_rows:
+                cloth["id"] = ids_by_name.get(cloth["name"])
+        # Updates without an embedding keep the old vector until their job lands; a
+        # row missing a column in a mixed batch would have it set to null instead
+        for with_embedding in (True, False):
+            update_rows = [
+                {"id": cloth["id"], **cloth_row(cloth)} for cloth in updates
+                if (cloth["embedding"] is not None) == with_embedding
+            ]
+            if update_rows:
+                supabase.table("clothes").upsert(update_rows, on_conflict="id").execute()
+        log_memory("After bulk DB insert/update")
+
+        # 6. Junction table: one delete + one insert for every saved cloth
+        saved = [(index, cloth) for index, cloth in pending if cloth["id"]]
+        junction_payload = []
+        for _, cloth in saved:
+            style_ids = {s["id"] for s in cloth["styles"] if s.get("id")}
+            style_ids.update(
+                style_ids_by_name[s["name"].strip().lower()]
+                for s in cloth["styles"]
+                if not s.get("id") and s.get("name") and s["name"].strip().lower() in style_ids_by_name
+            )
+            cloth["style_ids"] = sorted(style_ids)
+            junction_payload.extend({"cloth_id": cloth["id"], "style_id": sid} for sid in cloth["style_ids"])
+        if saved:
+            supabase.table("clothes_styles").delete().in_("cloth_id", [cloth["id"] for _, cloth in saved]).execute()
+        if junction_payload:
             supabase.table("clothes_styles").insert(junction_payload).execute()
 
-        log_memory("After DB insert/update")
-        # 5. Generate embedding for prefilter
-        styles_text = " ".join([s.get("name", "") for s in styles_input])
-        print('styles_text:', styles_text)
-        embedding_text = f"{name} {colour} {type_} {styles_text}"
-        embedding_vector = generate_embedding(embedding_text)
-        log_memory("After single item embedding generation")
-        
-        # 6. Store embedding in clothes table
-        supabase.table("clothes").update({"embedding": embedding_vector}).eq("id", cloth_id).execute()
-        log_memory("After embedding update in DB")
-        
-        # 7. Re-fetch the full cloth row with image_url + styles
-        print('user_id:', user_id, 'cloth_id:', cloth_id)
-        final_resp = (
-            supabase.table("clothes")
-            .select("""
-                id,
-                name,
-                type,
-                colour,
-                category,
-                image_url,
-                clothes_styles (
-                    styles (
-                        id,
-                        name
-                    )
-                )
-            """)
-            .eq("user_id", user_id)
-            .eq("id", cloth_id)
-            .execute()
-        )
-        print('final_resp:', final_resp)
-        row = final_resp.data[0] if final_resp.data else None
-
-        if row:
-            cloth_data = {
-                "id": row["id"],
-                "name": row["name"],
-                "type": row["type"],
-                "colour": row["colour"],
-                "category": row["category"],
-                "image_url": row["image_url"],
-                "styles": [
-                    cs["styles"]["name"] for cs in row.get("clothes_styles", []) if cs.get("styles")
-                ]
+        # 7. Like finish_cloth_save(): a stale queued job must not overwrite a fresh
+        #    embedding, and items saved without one get a job
+        for _, cloth in saved:
+            if cloth["embedding"] is not None:
+                EMBEDDING_JOBS.cancel(cloth["id"])
+            else:
+                EMBEDDING_JOBS.enqueue(user_id, cloth["id"], cloth["embedding_text"])
+
+        for index, cloth in pending:
+            if not cloth["id"]:
+                results[index] = {"index": index, "success": False, "error": "Insert failed"}
+                continue
+            results[index] = {
+                "index": index,
+                "success": True,
+                "cloth": {
+                    "id": cloth["id"],
+                    "name": cloth["name"],
+                    "type": cloth["type"],
+                    "colour": cloth["colour"],
+                    "category": cloth["category"],
+                    "styles": [s.get("name", "").strip().lower() for s in cloth["styles"]],
+                    "embedding_status": "ready" if cloth["embedding"] is not None else "pending",
+                },
             }
-        else:
-            cloth_data = None
-            
-        # Return to frontend without embedding
-        if not cloth_data:
-            return {"success": False, "error": "Failed to fetch saved cloth"}
-        clear_user_embeddings(user_id)  # clear cache
-        return {"success": True, "cloth": cloth_data}
-
     except Exception as e:
-        print("Error inserting cloth with styles:", e)
-        return {"success": False, "error": str(e)}
-    
+        print("Error in bulk cloth import:", e)
+        for index, _ in valid:
+            if results[index] is None:
+                results[index] = {"index": index, "success": False, "error": str(e)}
+
+    clear_user_embeddings(user_id)  # once for the whole import
+    bump_wardrobe_version(user_id)
+    return {"success": all(r["success"] for r in results), "results": results}
+
+
+# EMBEDDING_SYNC=delta: refresh cached embeddings from rows changed since a
+# watermark (needs sql/004_clothes_updated_at.sql)
+def use_delta_sync() -> bool:
+    return os.getenv("EMBEDDING_SYNC", "full").lower() == "delta"
+
+
+def cloth_embedding_query(supabase, user_id, since=None):
+    binary = use_binary_embeddings()
+    columns = "id, embedding_b64, category" if binary else "id, embedding, category"
+    query = supabase.table("clothes").select(columns).eq("user_id", user_id)
+    if since is not None:
+        query = query.gte("updated_at", datetime.fromtimestamp(since, timezone.utc).isoformat())
+    return query
+
+
+# Row count only (HEAD request, no body)
+def cloth_count_query(supabase, user_id):
+    return supabase.table("clothes").select("id", count="exact", head=True).eq("user_id", user_id)
+
+
+def cloth_ids_query(supabase, user_id):
+    return supabase.table("clothes").select("id").eq("user_id", user_id)
+
+
+# Rows saved before the binary column existed (EMBEDDING_STORAGE=binary only)
+def legacy_embedding_ids(data):
+    if not use_binary_embeddings():
+        return []
+    return [row["id"] for row in data if not row.get("embedding_b64")]
+
+
+def legacy_embedding_query(supabase, user_id, missing_ids):
+    return (
+        supabase.table("clothes")
+        .select("id, embedding")
+        .eq("user_id", user_id)
+        .in_("id", missing_ids)
+        .not_.is_("embedding", None)
+    )
+
+
+def merge_legacy_embeddings(data, legacy_rows):
+    legacy_map = {row["id"]: row.get("embedding") for row in legacy_rows or []}
+    for row in data:
+        if not row.get("embedding_b64"):
+            row["embedding"] = legacy_map.get(row["id"])
+    return data
 
 
 # Fetch all items' embedding and ids
 def get_all_cloth_embedding():
+    """
+    Returns one row per cloth: {id, category, embedding} or, with
+    EMBEDDING_STORAGE=binary, {id, category, embedding_b64}. Rows saved before
+    the binary column existed fall back to the pgvector text in a second query.
+    Rows whose embedding hasn't been computed yet come back with neither
+    (pending), so callers can tell them apart from missing items.
+    """
     supabase = get_supabase()
     user_id = get_current_user_id()
-    
+
     try:
-        response = (
-            supabase.table("clothes")
-            .select("id, embedding, category")
-            .eq("user_id", user_id)
-            .not_.is_("embedding", None)
-            .execute()
-        )
-        data = response.data or []
-         # sanity check: filter valid embeddings only
-        valid = [row for row in data if row.get("embedding")]
-        return valid
+        data = cloth_embedding_query(supabase, user_id).execute().data or []
+        missing_ids = legacy_embedding_ids(data)
+        if missing_ids:
+            legacy = legacy_embedding_query(supabase, user_id, missing_ids).execute()
+            merge_legacy_embeddings(data, legacy.data)
+        return data
     except Exception as e:
         print("Error fetching all items embedding:", e)
         return None
 
+
+def get_cloth_embedding_changes(since: float):
+    """
+    Delta for the embedding cache: rows (as get_all_cloth_embedding()) updated
+    at or after `since` (epoch seconds), plus how many clothes the user has now,
+    so the caller can tell whether any were deleted. Returns (rows, count) or None.
+    """
+    supabase = get_supabase()
+    user_id = get_current_user_id()
+
+    try:
+        data = cloth_embedding_query(supabase, user_id, since).execute().data or []
+        missing_ids = legacy_embedding_ids(data)
+        if missing_ids:
+            legacy = legacy_embedding_query(supabase, user_id, missing_ids).execute()
+            merge_legacy_embeddings(data, legacy.data)
+        count = cloth_count_query(supabase, user_id).execute().count
+        return data, count
+    except Exception as e:
+        print("Error fetching changed items embedding:", e)
+        return None
+
+
+# Every cloth id of the user (only needed when the delta shows deletes)
+def get_cloth_ids():
+    supabase = get_supabase()
+    user_id = get_current_user_id()
+
+    try:
+        return [row["id"] for row in cloth_ids_query(supabase, user_id).execute().data or []]
+    except Exception as e:
+        print("Error fetching cloth ids:", e)
+        return None
+
+
+# similar_clothes_by_category RPC (SIMILARITY_BACKEND=pgvector, sql/005)
+def similar_clothes_query(supabase, user_id, item_id: int, exclusions, per_category: int):
+    return supabase.rpc("similar_clothes_by_category", {
+        "p_user_id": user_id,
+        "p_item_id": item_id,
+        "p_exclusions": exclusions,
+        "p_per_category": per_category,
+    })
+
+
+def get_similar_clothes(item_id: int, exclusions, per_category: int):
+    """
+    Server-side shortlist: {selected, candidates: [{id, category, similarity}], pending_ids}
+    for the item's top `per_category` neighbours per compatible category, or None on error.
+    """
+    try:
+        return similar_clothes_query(get_supabase(), get_current_user_id(), item_id, exclusions, per_category).execute().data
+    except Exception as e:
+        print("Error fetching similar clothes:", e)
+        return None
+
+DETAIL_COLUMNS = """
+        id, name, type, colour, category,
+        clothes_styles (
+            styles (id, name)
+        )
+    """
+DETAIL_COLUMNS_WITH_IMAGE = CLOTH_LIST_COLUMNS
+
+
+def details_query(supabase, user_id, valid_ids, with_image=False):
+    columns = DETAIL_COLUMNS_WITH_IMAGE if with_image else DETAIL_COLUMNS
+    return supabase.table("clothes").select(columns).eq("user_id", user_id).in_("id", valid_ids)
+
+
+def format_details(items):
+    # Convert styles to list of names
+    for item in items:
+        item["styles"] = [cs["styles"]["name"] for cs in item.get("clothes_styles", []) if cs.get("styles")]
+    return items
+
+
 # Fetch details for list of ids (top K candidates or recommended items)
 def get_details_for_ids(valid_ids, with_image=False):
     supabase = get_supabase()
@@ -540,42 +947,8 @@ def get_details_for_ids(valid_ids, with_image=False):
         return []
 
     try:
-        if with_image:
-            response = supabase.table("clothes").select("""
-                id,
-                name,
-                type,
-                colour,
-                category,
-                image_url,
-                clothes_styles (
-                    styles (
-                        id,
-                        name
-                    )
-                )
-            """).eq("user_id", user_id).in_("id", valid_ids).execute()
-        else:
-            response = supabase.table("clothes").select("""
-                id,
-                name,
-                type,
-                colour,
-                category,
-                clothes_styles (
-                    styles (
-                        id,
-                        name
-                    )
-                )
-            """).eq("user_id", user_id).in_("id", valid_ids).execute()
-        
-        items = response.data or []
-        # Convert styles to list of names
-        for item in items:
-            item["styles"] = [cs["styles"]["name"] for cs in item.get("clothes_styles", []) if cs.get("styles")]
-        
-        return items
+        response = details_query(supabase, user_id, valid_ids, with_image).execute()
+        return format_details(response.data or [])
     except Exception as e:
         print("Error fetching details for IDs:", e)
-        return []
\ No newline at end of file
+        return []
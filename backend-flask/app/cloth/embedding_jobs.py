@@ -0,0 +1,275 @@
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep, time
+
+from app.utils import generate_embedding
+
+# Not persistent: on Render the temp dir (like the rest of the instance disk) is wiped on
+# every deploy and restart. Point EMBEDDING_JOBS_PATH at a persistent disk mount to keep
+# the queue, retry counts and failed marks; without one, the startup scan of clothes
+# with no embedding (requeue_missing) rebuilds the queue instead
+DEFAULT_JOBS_PATH = os.path.join(tempfile.gettempdir(), "my-ootd-embedding-jobs.sqlite")
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 5  # seconds, doubled per attempt
+# A claimed job is left to its worker this long (seconds); after that any worker may take it over
+LEASE_SECONDS = int(os.getenv("EMBEDDING_JOB_LEASE", 300))
+MISSING_SCAN_PAGE_SIZE = 500
+
+
+def embedding_mode() -> str:
+    """'async' (default): cloth saves return before the embedding is computed. 'sync': old behaviour."""
+    return "sync" if os.getenv("EMBEDDING_MODE", "async").lower() == "sync" else "async"
+
+
+def _worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class EmbeddingJobQueue:
+    """
+    Computes cloth embeddings off the request path.
+
+    Jobs are persisted in a small SQLite file (one row per cloth, so a newer edit
+    replaces a queued one) before being handed to a thread pool, so a worker restart
+    doesn't lose them. Workers share the file: a job runs under a lease
+    (claimed_by / claimed_at), and only unclaimed jobs or ones whose lease expired
+    (their worker died) are picked up on startup and then every LEASE_SECONDS.
+    Until a job lands the cloth row has no embedding and the recommender reports
+    it as pending. A job that fails MAX_ATTEMPTS times is kept with `failed_at`
+    set: it's never retried on its own (saving the cloth again re-enqueues it)
+    and the recommender reports the item as failed instead of pending.
+
+    The sweeper also scans Supabase for clothes with no embedding and no job
+    (e.g. the SQLite file was lost on a redeploy) and enqueues them.
+    """
+
+    def __init__(self, path: str, workers: int = 1):
+        self.path = path
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embedding-job")
+        self._lock = threading.Lock()
+        self._db = None
+        self._app = None
+        self._sweeper = None
+
+    def init_app(self, app):
+        self._app = app
+        self.requeue_claimable()
+        # The missing-embedding scan queries Supabase, so it runs on the sweeper rather than at startup
+        self._sweeper = threading.Thread(target=self._sweep_loop, name="embedding-job-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def requeue_claimable(self):
+        cloth_ids = self.claimable_cloth_ids()
+        for cloth_id in cloth_ids:
+            self._pool.submit(self._run, cloth_id)
+        return len(cloth_ids)
+
+    def requeue_missing(self):
+        """Enqueue every cloth that has no embedding and no job, failed or not. Returns how many."""
+        with self._app.app_context():
+            rows = clothes_missing_embedding()
+        with self._lock:
+            known = {row[0] for row in self._connect().execute("SELECT cloth_id FROM embedding_jobs")}
+        added = []
+        for row in rows:
+            if row["id"] in known:
+                continue
+            with self._lock:
+                # OR IGNORE: a save (or another worker's scan) may have enqueued it meanwhile
+                if self._connect().execute(
+                    "INSERT OR IGNORE INTO embedding_jobs (cloth_id, user_id, text, attempts, created_at) VALUES (?, ?, ?, 0, ?)",
+                    (row["id"], row["user_id"], row["text"], time()),
+                ).rowcount:
+                    added.append(row["id"])
+        for cloth_id in added:
+            self._pool.submit(self._run, cloth_id)
+        return len(added)
+
+    def _sweep_loop(self):
+        while True:
+            try:
+                missing = self.requeue_missing()
+                if missing:
+                    print(f"[EMBEDDING JOBS] queued {missing} clothes with no embedding", flush=True)
+            except Exception as e:
+                print(f"❌ Scan for clothes with no embedding failed: {e}", flush=True)
+            sleep(LEASE_SECONDS)
+            requeued = self.requeue_claimable()
+            if requeued:
+                print(f"[EMBEDDING JOBS] re-queued {requeued} unclaimed or expired jobs", flush=True)
+
+    def _connect(self):
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS embedding_jobs (
+                    cloth_id INTEGER PRIMARY KEY,
+                    user_id NOT NULL,  -- no affinity: keeps the JWT sub type as-is
+                    text TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    claimed_by TEXT,
+                    claimed_at REAL,
+                    failed_at REAL
+                )
+            """)
+            columns = {row[1] for row in db.execute("PRAGMA table_info(embedding_jobs)")}
+            for column, kind in (("claimed_by", "TEXT"), ("claimed_at", "REAL"), ("failed_at", "REAL")):
+                if column not in columns:  # file from before the lease / failed columns
+                    try:
+                        db.execute(f"ALTER TABLE embedding_jobs ADD COLUMN {column} {kind}")
+                    except sqlite3.OperationalError as e:
+                        if "duplicate column" not in str(e):  # another worker migrated it first
+                            raise
+            self._db = db
+        return self._db
+
+    def enqueue(self, user_id, cloth_id: int, text: str):
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO embedding_jobs (cloth_id, user_id, text, attempts, created_at) VALUES (?, ?, ?, 0, ?)",
+                (cloth_id, user_id, text, time()),
+            )
+        self._pool.submit(self._run, cloth_id)
+
+    def cancel(self, cloth_id: int):
+        """Drop a queued job, e.g. when a newer save already stored the embedding."""
+        with self._lock:
+            self._connect().execute("DELETE FROM embedding_jobs WHERE cloth_id = ?", (cloth_id,))
+
+    def claimable_cloth_ids(self):
+        """Jobs no live worker holds: never claimed (or re-enqueued since), or with an expired lease."""
+        with self._lock:
+            return [row[0] for row in self._connect().execute(
+                "SELECT cloth_id FROM embedding_jobs WHERE failed_at IS NULL AND (claimed_at IS NULL OR claimed_at < ?)",
+                (time() - LEASE_SECONDS,),
+            )]
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM embedding_jobs WHERE failed_at IS NULL").fetchone()[0]
+
+    def failed_count(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM embedding_jobs WHERE failed_at IS NOT NULL").fetchone()[0]
+
+    def failed_ids(self, cloth_ids):
+        """The subset of cloth_ids whose job gave up after MAX_ATTEMPTS."""
+        cloth_ids = [int(i) for i in cloth_ids]
+        if not cloth_ids:
+            return set()
+        with self._lock:
+            return {row[0] for row in self._connect().execute(
+                f"SELECT cloth_id FROM embedding_jobs WHERE failed_at IS NOT NULL"
+                f" AND cloth_id IN ({', '.join('?' * len(cloth_ids))})",
+                cloth_ids,
+            )}
+
+    def is_failed(self, cloth_id) -> bool:
+        return bool(self.failed_ids([cloth_id]))
+
+    def _load(self, cloth_id):
+        with self._lock:
+            return self._connect().execute(
+                "SELECT user_id, text, attempts FROM embedding_jobs WHERE cloth_id = ?", (cloth_id,)
+            ).fetchone()
+
+    def _claim(self, cloth_id):
+        """Take (or renew) the job's lease for this worker. Returns the job, or None if it's gone or leased elsewhere."""
+        now, worker = time(), _worker_id()
+        with self._lock:
+            db = self._connect()
+            claimed = db.execute(
+                "UPDATE embedding_jobs SET claimed_by = ?, claimed_at = ? WHERE cloth_id = ? AND failed_at IS NULL"
+                " AND (claimed_at IS NULL OR claimed_at < ? OR claimed_by = ?)",
+                (worker, now, cloth_id, now - LEASE_SECONDS, worker),
+            ).rowcount
+            if not claimed:
+                return None
+            return db.execute(
+                "SELECT user_id, text, attempts FROM embedding_jobs WHERE cloth_id = ?", (cloth_id,)
+            ).fetchone()
+
+    def _run(self, cloth_id):
+        job = self._claim(cloth_id)
+        if job is None:
+            return  # already done, or another worker holds it
+        user_id, text, attempts = job
+        try:
+            embedding_vector = generate_embedding(text)
+            current = self._load(cloth_id)
+            if current is None or current[1] != text:
+                return  # cancelled or superseded by a newer edit while we were embedding
+            with self._app.app_context():
+                store_embedding(user_id, cloth_id, embedding_vector)
+        except Exception as e:
+            attempts += 1
+            print(f"❌ Embedding job for cloth {cloth_id} failed (attempt {attempts}/{MAX_ATTEMPTS}): {e}", flush=True)
+            with self._lock:
+                if attempts >= MAX_ATTEMPTS:
+                    # Terminal: kept so the item reads as failed, not pending, until it's saved again
+                    self._connect().execute(
+                        "UPDATE embedding_jobs SET attempts = ?, failed_at = ?, claimed_by = NULL, claimed_at = NULL"
+                        " WHERE cloth_id = ? AND text = ?",
+                        (attempts, time(), cloth_id, text),
+                    )
+                else:
+                    self._connect().execute("UPDATE embedding_jobs SET attempts = ? WHERE cloth_id = ?", (attempts, cloth_id))
+            if attempts >= MAX_ATTEMPTS:
+                from app.recommendation.result_cache import bump_wardrobe_version
+                bump_wardrobe_version(user_id)  # cached outfits list the item as pending
+            else:
+                timer = threading.Timer(RETRY_BASE_DELAY * 2 ** (attempts - 1), self._pool.submit, (self._run, cloth_id))
+                timer.daemon = True
+                timer.start()
+            return
+
+        with self._lock:
+            # Only drop the job if it wasn't replaced by a newer edit meanwhile
+            self._connect().execute("DELETE FROM embedding_jobs WHERE cloth_id = ? AND text = ?", (cloth_id, text))
+        print(f"✅ Embedding stored for cloth {cloth_id}", flush=True)
+
+
+def clothes_missing_embedding():
+    """[{id, user_id, text}] for every cloth row with no embedding, paged by id (all users)."""
+    from .db_service import build_embedding_text, get_supabase
+
+    rows, last_id = [], 0
+    while True:
+        page = get_supabase().table("clothes")\
+            .select("id, user_id, name, type, colour, clothes_styles (styles (name))")\
+            .is_("embedding", "null").gt("id", last_id).order("id").limit(MISSING_SCAN_PAGE_SIZE)\
+            .execute().data or []
+        for row in page:
+            styles = [cs["styles"] for cs in row.get("clothes_styles") or [] if cs.get("styles")]
+            text = build_embedding_text({**row, "styles": styles})
+            rows.append({"id": row["id"], "user_id": row["user_id"], "text": text})
+        if len(page) < MISSING_SCAN_PAGE_SIZE:
+            return rows
+        last_id = page[-1]["id"]
+
+
+def store_embedding(user_id, cloth_id: int, embedding_vector):
+    """Write a computed embedding to the cloth row and refresh the owner's cache."""
+    from app.recommendation.embedding_service import remove_user_embedding, upsert_user_embedding
+    from app.recommendation.result_cache import bump_wardrobe_version
+    from .db_service import embedding_columns, get_supabase
+
+    res = get_supabase().table("clothes").update(embedding_columns(embedding_vector))\
+        .eq("id", cloth_id).eq("user_id", user_id).execute()
+    if res.data:
+        upsert_user_embedding(user_id, cloth_id, res.data[0].get("category"), embedding_vector)
+    else:
+        remove_user_embedding(user_id, cloth_id)  # deleted while we were embedding
+    bump_wardrobe_version(user_id)  # the new item can now appear in outfits
+
+
+EMBEDDING_JOBS = EmbeddingJobQueue(
+    path=os.getenv("EMBEDDING_JOBS_PATH", DEFAULT_JOBS_PATH),
+    workers=int(os.getenv("EMBEDDING_WORKERS", 1)),
+)
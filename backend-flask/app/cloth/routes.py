@@ -9,8 +9,11 @@ from .db_service import (
     fetch_style_tags,
     get_random_items,
     insert_cloth_with_styles_embedding,
+    bulk_insert_clothes_with_styles_embedding,
+    MAX_BULK_ITEMS,
     delete_cloth_in_db,
     get_clothes_by_type,
+    get_clothes_page,
     update_cloth_url
 )     
 
@@ -21,6 +24,19 @@ def get_wardrobe():
     category = request.args.get("type", "all").lower()
     limit = int(request.args.get("limit", 3))
     offset = int(request.args.get("offset", 0))
+
+    # Keyset pagination: `cursor` present (empty for the first page)
+    if "cursor" in request.args:
+        try:
+            page = get_clothes_page(
+                None if category in ("", "all") else category,
+                limit,
+                request.args.get("cursor") or None,
+                with_counts=request.args.get("counts") in ("1", "true"),
+            )
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+        return jsonify(page)
    
     if category == "" or category == "all":
         clothes = get_clothes_by_type(None, limit, offset)  # no filter
@@ -40,10 +56,30 @@ def insert_update_cloth():
             return jsonify({"message": "Insert failed"}), 500
 
         return jsonify(result), 201
+    except ValueError as e:  # malformed payload (InvalidClothError)
+        return jsonify({"message": str(e)}), 400
     except Exception as e:
         return jsonify({"message": str(e)}), 500
 
 
+# Bulk wardrobe import (onboarding): per-item results
+@bp.route("/bulk", methods=["POST"])
+@token_required
+def bulk_insert_clothes():
+    data = request.json
+    items = data.get("items") if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({"message": "items must be a non-empty list"}), 400
+    if len(items) > MAX_BULK_ITEMS:
+        return jsonify({"message": f"At most {MAX_BULK_ITEMS} items per import"}), 400
+
+    try:
+        result = bulk_insert_clothes_with_styles_embedding(items)
+        if "results" not in result:
+            return jsonify({"message": result.get("error", "Import failed")}), 401
+        return jsonify(result), 201
+    except Exception as e:
+        return jsonify({"message": str(e)}), 500
 
 # Update cloth image URL only (for add cloth items)
 @bp.route("/<int:id>/image", methods=["PUT"])
@@ -0,0 +1,109 @@
+import base64
+import os
+
+import numpy as np
+
+# all-MiniLM-L6-v2 output size
+EMBEDDING_DIM = 384
+
+# float32 little-endian, the layout used for the compact binary column
+_WIRE_DTYPE = np.dtype("<f4")
+_B64_ROW_LEN = 4 * ((EMBEDDING_DIM * _WIRE_DTYPE.itemsize + 2) // 3)
+
+
+def use_binary_embeddings() -> bool:
+    """True when the compact `embedding_b64` column should be read and written."""
+    return os.getenv("EMBEDDING_STORAGE", "vector").lower() == "binary"
+
+
+def empty_embeddings(dim: int = EMBEDDING_DIM):
+    return np.empty((0, dim), dtype=np.float32)
+
+
+# Encode a single vector for the binary column (raw float32 -> base64 text)
+def encode_embedding_b64(vector) -> str:
+    arr = np.asarray(vector, dtype=_WIRE_DTYPE)
+    if arr.shape != (EMBEDDING_DIM,):
+        raise ValueError(f"Expected {EMBEDDING_DIM} dimensions, got {arr.shape}")
+    return base64.b64encode(arr.tobytes()).decode("ascii")
+
+
+# pgvector text literal ('[0.1,0.2,...]') for RPC parameters
+def format_vector_text(vector) -> str:
+    return "[" + ",".join(f"{x:.9g}" for x in np.asarray(vector, dtype=np.float32).tolist()) + "]"
+
+
+def decode_embedding_b64(text: str, dim: int = EMBEDDING_DIM):
+    arr = np.frombuffer(base64.b64decode(text), dtype=_WIRE_DTYPE)
+    if arr.size != dim:
+        raise ValueError(f"Expected {dim} dimensions, got {arr.size}")
+    return arr.astype(np.float32, copy=False)
+
+
+def _fill_from_b64(values, out):
+    """Decode base64 rows into `out` (shape (len(values), dim)).
+
+    Every full-size row encodes to the same unpadded length, so the strings can be
+    concatenated and decoded in one call straight into the output buffer.
+    """
+    if not values:
+        return
+    dim = out.shape[1]
+    if dim == EMBEDDING_DIM and all(len(v) == _B64_ROW_LEN for v in values):
+        raw = base64.b64decode("".join(values))
+        out[:] = np.frombuffer(raw, dtype=_WIRE_DTYPE).reshape(len(values), dim)
+        return
+    for i, v in enumerate(values):
+        out[i] = decode_embedding_b64(v, dim)
+
+
+def _fill_from_text(values, out):
+    """Parse pgvector text rows ('[0.1,0.2,...]') into `out` with one numpy call."""
+    if not values:
+        return
+    n, dim = out.shape
+    joined = ",".join(v.strip()[1:-1] for v in values)
+    flat = np.fromstring(joined, dtype=np.float32, sep=",")
+    if flat.size != n * dim:
+        raise ValueError(f"Expected {n * dim} values for {n} embeddings, got {flat.size}")
+    out[:] = flat.reshape(n, dim)
+
+
+# Build one (N, dim) float32 matrix from Supabase rows
+def decode_embedding_rows(rows, dim: int = EMBEDDING_DIM):
+    """
+    rows: list of dicts carrying `embedding_b64` (base64 float32) and/or
+    `embedding` (pgvector text or list of floats).
+    Returns a preallocated (N, dim) float32 matrix, one row per input row, in order.
+    Rows without any embedding must be filtered out by the caller.
+    """
+    out = np.empty((len(rows), dim), dtype=np.float32)
+
+    b64_idx, b64_vals = [], []
+    text_idx, text_vals = [], []
+    for i, row in enumerate(rows):
+        b64 = row.get("embedding_b64")
+        if b64:
+            b64_idx.append(i)
+            b64_vals.append(b64)
+            continue
+        emb = row.get("embedding")
+        if isinstance(emb, str):
+            text_idx.append(i)
+            text_vals.append(emb)
+        elif emb is not None:
+            out[i] = np.asarray(emb, dtype=np.float32)
+        else:
+            raise ValueError(f"Row {row.get('id')} has no embedding")
+
+    # Contiguous batches (the common case) are written in place, no scatter copy
+    for idx, vals, fill in ((b64_idx, b64_vals, _fill_from_b64), (text_idx, text_vals, _fill_from_text)):
+        if not idx:
+            continue
+        if len(idx) == len(rows):
+            fill(vals, out)
+        else:
+            tmp = np.empty((len(idx), dim), dtype=np.float32)
+            fill(vals, tmp)
+            out[idx] = tmp
+    return out
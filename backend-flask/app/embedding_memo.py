@@ -0,0 +1,128 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_MEMO_PATH = os.path.join(tempfile.gettempdir(), "my-ootd-embedding-memo.sqlite")
+
+
+def normalize_embedding_text(text: str) -> str:
+    """Case, unicode form and whitespace differences don't change the embedding key."""
+    return " ".join(unicodedata.normalize("NFC", text).lower().split())
+
+
+def embedding_key(text: str, model_id: str) -> str:
+    return hashlib.sha256(f"{model_id}\0{normalize_embedding_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingMemo:
+    """
+    Content-addressed embedding cache: sha256(model id + normalized text) -> float32 vector.
+
+    Two tiers: an in-process LRU, then an optional SQLite file that survives restarts
+    and is shared by every worker on the same machine. Vectors are stored as raw
+    float32 bytes.
+    """
+
+    def __init__(self, max_entries: int = 2048, path: str | None = None):
+        self.max_entries = max_entries
+        self.path = path
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.lru_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        if self._db is None and self.path:
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self._db = db
+        return self._db
+
+    def _safe_connect(self):
+        # The persistent tier is best effort: fall back to the LRU only
+        try:
+            return self._connect()
+        except sqlite3.Error as e:
+            print("Embedding memo file unavailable:", e)
+            self.path = None
+            return None
+
+    def _remember(self, key, blob):
+        self._lru[key] = blob
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def get_many(self, texts, model_id):
+        """Returns a list aligned with texts: a list of floats on hit, None on miss."""
+        keys = [embedding_key(t, model_id) for t in texts]
+        found = {}
+        with self._lock:
+            for key in keys:
+                blob = self._lru.get(key)
+                if blob is not None:
+                    self._lru.move_to_end(key)
+                    found[key] = blob
+            from_lru = set(found)
+
+            missing = [k for k in dict.fromkeys(keys) if k not in found]
+            db = self._safe_connect() if missing else None
+            if db is not None:
+                placeholders = ",".join("?" * len(missing))
+                rows = db.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", missing).fetchall()
+                for key, blob in rows:
+                    found[key] = blob
+                    self._remember(key, blob)
+
+            results = []
+            for key in keys:
+                blob = found.get(key)
+                if blob is None:
+                    self.misses += 1
+                    results.append(None)
+                    continue
+                if key in from_lru:
+                    self.lru_hits += 1
+                else:
+                    self.disk_hits += 1
+                results.append(np.frombuffer(blob, dtype=np.float32).tolist())
+        return results
+
+    def put_many(self, texts, model_id, vectors):
+        items = [(embedding_key(t, model_id), np.asarray(v, dtype=np.float32).tobytes()) for t, v in zip(texts, vectors)]
+        with self._lock:
+            for key, blob in items:
+                self._remember(key, blob)
+            db = self._safe_connect()
+            if db is not None:
+                try:
+                    db.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", items)
+                except sqlite3.Error as e:
+                    print("Failed to persist embeddings:", e)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.lru_hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._lru),
+                "lru_hits": self.lru_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.lru_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+EMBEDDING_MEMO = EmbeddingMemo(
+    max_entries=int(os.getenv("EMBEDDING_MEMO_SIZE", 2048)),
+    # Set EMBEDDING_MEMO_PATH="" to keep the memo in memory only
+    path=os.getenv("EMBEDDING_MEMO_PATH", DEFAULT_MEMO_PATH) or None,
+)
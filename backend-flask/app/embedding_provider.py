@@ -0,0 +1,190 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from app.embedding_codec import EMBEDDING_DIM
+from app.http_client import default_timeout, post_with_retries
+
+MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+class EmbeddingProvider(ABC):
+    """Turns texts into 384-dim all-MiniLM-L6-v2 sentence embeddings."""
+
+    name = "base"
+    model_id = MODEL_ID
+
+    @abstractmethod
+    def embed(self, texts):
+        """Returns one list of floats per input text, in order."""
+
+
+class HuggingFaceProvider(EmbeddingProvider):
+    """Hugging Face Inference API (remote, free tier)."""
+
+    name = "huggingface"
+    API_URL = f"https://router.huggingface.co/hf-inference/models/{MODEL_ID}/pipeline/feature-extraction"
+    max_retries = 2
+    read_timeout = 30  # seconds
+    max_loading_wait = 10  # cap on a cold-start sleep, retries cover the rest
+
+    def embed(self, texts):
+        HF_API_KEY = os.getenv("HUGGING_FACE_API_KEY")
+        if not HF_API_KEY:
+            raise ValueError("HUGGING_FACE_API_KEY not set in environment")
+
+        headers = {
+            "Authorization": f"Bearer {HF_API_KEY}",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "inputs": texts if len(texts) > 1 else texts[0],
+            "options": {
+                "wait_for_model": True  # Wait if model is loading (cold start)
+            }
+        }
+
+        response = post_with_retries(
+            self.API_URL, headers=headers, json=payload,
+            timeout=default_timeout(read=self.read_timeout),
+            retries=self.max_retries, retry_delay=self._loading_delay,
+        )
+        if response.is_error:
+            print(f"❌ HTTP error: {response.status_code} - {response.text}", flush=True)
+        response.raise_for_status()
+        return self._parse(response.json(), len(texts))
+
+    def _loading_delay(self, response):
+        # Cold start: 503 with {"error": "... is currently loading", "estimated_time": 20.3}
+        if response.status_code != 503:
+            return None
+        try:
+            error_data = response.json()
+        except ValueError:
+            return None
+        if "loading" in str(error_data).lower():
+            return min(float(error_data.get("estimated_time", self.max_loading_wait)), self.max_loading_wait)
+        return None
+
+    @staticmethod
+    def _parse(result, count):
+        # HF returns different formats, handle both:
+        if not isinstance(result, list) or not result:
+            raise ValueError(f"Response is not a list: {type(result)}")
+        # Format 1: [embedding] (flat list, single input)
+        if isinstance(result[0], (int, float)):
+            embeddings = [result]
+        # Format 2: [[embedding], ...] (one per input; single input may be nested once more)
+        elif isinstance(result[0], list):
+            embeddings = result
+            if count == 1 and len(result) == 1 and result[0] and isinstance(result[0][0], list):
+                embeddings = result[0]
+        else:
+            raise ValueError(f"Unexpected response format: {result[:2]}...")
+
+        if len(embeddings) != count:
+            raise ValueError(f"Expected {count} embeddings, got {len(embeddings)}")
+        # Verify dimensions (all-MiniLM-L6-v2 = 384 dims)
+        for embedding in embeddings:
+            if len(embedding) != EMBEDDING_DIM:
+                raise ValueError(f"Expected {EMBEDDING_DIM} dimensions, got {len(embedding)}")
+        return embeddings
+
+
+class OnnxMiniLMProvider(EmbeddingProvider):
+    """
+    Local CPU backend: all-MiniLM-L6-v2 exported to ONNX, run with onnxruntime
+    + a `tokenizers` tokenizer.json. Both are optional dependencies and the
+    model is only loaded on the first embed() call.
+
+    Defaults to the fp32 export, which matches the Hugging Face vectors (min
+    cosine 1.0 in scripts/check_embedding_parity.py). These vectors share the
+    clothes.embedding column with the API's, so only point ONNX_MODEL_PATH at
+    a quantized export after it passes that check: a dynamic int8 export
+    scored 0.943.
+
+    Output matches sentence-transformers: mean pooling over the attention mask,
+    then L2 normalization.
+    """
+
+    name = "onnx"
+    max_length = 256  # all-MiniLM-L6-v2 max_seq_length
+
+    def __init__(self, model_path=None, tokenizer_path=None, threads=None):
+        self.model_path = model_path or os.getenv("ONNX_MODEL_PATH", "models/all-MiniLM-L6-v2/model.onnx")
+        self.tokenizer_path = tokenizer_path or os.getenv(
+            "ONNX_TOKENIZER_PATH", os.path.join(os.path.dirname(self.model_path), "tokenizer.json")
+        )
+        self.threads = threads or int(os.getenv("ONNX_THREADS", 1))
+        self._session = None
+        self._tokenizer = None
+        self._input_names = ()
+        self._load_lock = threading.Lock()
+
+    def _load(self):
+        with self._load_lock:
+            if self._session is not None:
+                return
+            try:
+                import onnxruntime as ort
+                from tokenizers import Tokenizer
+            except ImportError as e:
+                raise RuntimeError("EMBEDDING_PROVIDER=onnx needs `onnxruntime` and `tokenizers` installed") from e
+
+            tokenizer = Tokenizer.from_file(self.tokenizer_path)
+            tokenizer.enable_truncation(max_length=self.max_length)
+            tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = self.threads
+            options.inter_op_num_threads = 1
+            # No arena: keeps RSS close to the model size on a small worker
+            options.enable_cpu_mem_arena = False
+            session = ort.InferenceSession(self.model_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+            self._input_names = tuple(i.name for i in session.get_inputs())
+            self._tokenizer = tokenizer
+            self._session = session
+            print(f"✅ ONNX embedding model loaded from {self.model_path}", flush=True)
+
+    def embed(self, texts):
+        if self._session is None:
+            self._load()
+
+        encodings = self._tokenizer.encode_batch(list(texts))
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        token_embeddings = self._session.run(None, feeds)[0]  # (batch, tokens, 384)
+
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32).tolist()
+
+
+PROVIDERS = {
+    HuggingFaceProvider.name: HuggingFaceProvider,
+    OnnxMiniLMProvider.name: OnnxMiniLMProvider,
+}
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_embedding_provider() -> EmbeddingProvider:
+    """Process-wide provider chosen by EMBEDDING_PROVIDER (huggingface | onnx)."""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                name = os.getenv("EMBEDDING_PROVIDER", HuggingFaceProvider.name).lower()
+                if name not in PROVIDERS:
+                    raise ValueError(f"Unknown EMBEDDING_PROVIDER '{name}', expected one of {list(PROVIDERS)}")
+                _provider = PROVIDERS[name]()
+    return _provider
@@ -0,0 +1,163 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+import httpx
+
+# Statuses worth retrying for the free-tier APIs we call
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+_client = None
+_client_lock = threading.Lock()
+_async_client = None
+
+
+def _env_float(name, default):
+    return float(os.getenv(name, default))
+
+
+def default_timeout(read=None) -> httpx.Timeout:
+    """Connect/read timeouts from HTTP_CONNECT_TIMEOUT / HTTP_READ_TIMEOUT (seconds)."""
+    return httpx.Timeout(
+        connect=_env_float("HTTP_CONNECT_TIMEOUT", 5),
+        read=read if read is not None else _env_float("HTTP_READ_TIMEOUT", 60),
+        write=10,
+        pool=5,
+    )
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", 20)),
+        max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", 10)),
+        keepalive_expiry=_env_float("HTTP_KEEPALIVE_EXPIRY", 60),
+    )
+
+
+def get_http_client() -> httpx.Client:
+    """
+    Process-wide outbound client: one keep-alive connection pool per host
+    (OpenRouter, Hugging Face, ...) and HTTP/2 when `h2` is installed, so
+    repeated calls skip the TCP + TLS handshake.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(http2=_http2_available(), timeout=default_timeout(), limits=_limits())
+    return _client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    Same pool settings for the ASGI routes. Created lazily inside the event loop
+    that uses it (one loop per worker); close it with close_async_http_client().
+    With HTTP/2 many in-flight LLM calls share a few connections.
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(http2=_http2_available(), timeout=default_timeout(), limits=_limits())
+    return _async_client
+
+
+async def close_async_http_client():
+    global _async_client
+    client, _async_client = _async_client, None
+    if client is not None:
+        await client.aclose()
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 10) -> float:
+    """Exponential backoff with full jitter: uniform(0, min(cap, base * 2**attempt))."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _retry_after(response: httpx.Response):
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def post_with_retries(url, *, headers=None, json=None, content=None, timeout=None, retries=None,
+                      retry_statuses=RETRY_STATUSES, retry_delay=None):
+    """
+    POST through the shared client, retrying timeouts, connection errors and
+    `retry_statuses` with jittered exponential backoff (or the server's
+    Retry-After). `retry_delay(response)` may return a custom delay in seconds
+    for a retryable response, e.g. a model's estimated loading time.
+    Returns the last response; the caller decides what a non-2xx means.
+    """
+    retries = int(os.getenv("HTTP_RETRIES", 2)) if retries is None else retries
+    client = get_http_client()
+    for attempt in range(retries + 1):
+        last_attempt = attempt == retries
+        try:
+            response = client.post(url, headers=headers, json=json, content=content,
+                                   timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT)
+        except (httpx.TimeoutException, httpx.TransportError) as e:
+            if last_attempt:
+                raise
+            print(f"⚠️ {type(e).__name__} calling {url} (attempt {attempt + 1}/{retries + 1})", flush=True)
+            time.sleep(backoff_delay(attempt))
+            continue
+
+        if response.status_code not in retry_statuses or last_attempt:
+            return response
+        delay = (retry_delay(response) if retry_delay else None) or _retry_after(response) or backoff_delay(attempt)
+        print(f"⚠️ HTTP {response.status_code} from {url}, retrying in {delay:.1f}s", flush=True)
+        time.sleep(delay)
+    return response
+
+
+@contextmanager
+def stream_post(url, *, headers=None, json=None, content=None, timeout=None):
+    """Streaming POST through the shared client (no retries once bytes may have been consumed)."""
+    with get_http_client().stream("POST", url, headers=headers, json=json, content=content,
+                                  timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT) as response:
+        yield response
+
+
+async def apost_with_retries(url, *, headers=None, json=None, content=None, timeout=None, retries=None,
+                             retry_statuses=RETRY_STATUSES, retry_delay=None):
+    """post_with_retries() on the async client; backoff sleeps yield to the event loop."""
+    retries = int(os.getenv("HTTP_RETRIES", 2)) if retries is None else retries
+    client = get_async_http_client()
+    for attempt in range(retries + 1):
+        last_attempt = attempt == retries
+        try:
+            response = await client.post(url, headers=headers, json=json, content=content,
+                                         timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT)
+        except (httpx.TimeoutException, httpx.TransportError) as e:
+            if last_attempt:
+                raise
+            print(f"⚠️ {type(e).__name__} calling {url} (attempt {attempt + 1}/{retries + 1})", flush=True)
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+
+        if response.status_code not in retry_statuses or last_attempt:
+            return response
+        delay = (retry_delay(response) if retry_delay else None) or _retry_after(response) or backoff_delay(attempt)
+        print(f"⚠️ HTTP {response.status_code} from {url}, retrying in {delay:.1f}s", flush=True)
+        await asyncio.sleep(delay)
+    return response
+
+
+@asynccontextmanager
+async def astream_post(url, *, headers=None, json=None, content=None, timeout=None):
+    """stream_post() on the async client."""
+    async with get_async_http_client().stream("POST", url, headers=headers, json=json, content=content,
+                                              timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT) as response:
+        yield response
@@ -1,7 +1,26 @@
 # utils/memory_logger.py
 import psutil, os
 
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_process = None  # (pid, psutil.Process), re-created after a fork
+
+
+def rss_bytes():
+    """
+    Resident set size of this worker. On Linux one small read of /proc/self/statm;
+    elsewhere a cached psutil handle instead of a new Process per call.
+    """
+    global _process
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        pid = os.getpid()
+        if _process is None or _process[0] != pid:
+            _process = (pid, psutil.Process(pid))
+        return _process[1].memory_info().rss
+
+
 def log_memory(label=""):
-    process = psutil.Process(os.getpid())
-    mem = process.memory_info().rss / 1024 / 1024  # MB
-    print(f"[MEMORY] {label}: {mem:.2f} MB used")
\ No newline at end of file
+    mem = rss_bytes() / 1024 / 1024  # MB
+    print(f"[MEMORY] {label}: {mem:.2f} MB used")
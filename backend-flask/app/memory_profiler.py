@@ -0,0 +1,173 @@
+import gc
+import os
+import threading
+import tracemalloc
+
+import anyio
+from flask import g, jsonify, request
+
+from app.auth.auth_utils import admin_required
+from app.memory_logger import rss_bytes
+
+# MEMORY_PROFILING=1 starts tracemalloc (slows allocations down, keep it off normally)
+MEMORY_PROFILING = os.getenv("MEMORY_PROFILING", "0").lower() in ("1", "true", "yes")
+TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", 5))
+# Every Nth request of a route takes a snapshot and diffs it with that route's previous one
+SNAPSHOT_EVERY = int(os.getenv("MEMORY_SNAPSHOT_EVERY", 50))
+TOP_SITES = 15
+# Largest sites kept per route between snapshots (a full Snapshot can be tens of MB)
+KEPT_SITES = 200
+
+# Allocations made by the profiler itself or by imports are noise
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+)
+
+
+def _site(stat):
+    return str(stat.traceback[0]) if stat.traceback else "?"
+
+
+def _format_stats(stats, limit):
+    return [{"site": _site(stat), "size_kb": round(stat.size / 1024, 1), "count": stat.count} for stat in stats[:limit]]
+
+
+def _top_sites():
+    """{site: (size, count)} of the KEPT_SITES largest allocation sites ("lineno"), snapshot discarded."""
+    stats = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS).statistics("lineno")
+    return {_site(stat): (stat.size, stat.count) for stat in stats[:KEPT_SITES]}
+
+
+def _growth(previous, current, limit):
+    """Sites that grew most between two _top_sites() results (a site missing from `previous` grew from 0)."""
+    rows = [
+        {"site": site, "size_kb": round(size / 1024, 1), "count": count,
+         "size_diff_kb": round((size - previous.get(site, (0, 0))[0]) / 1024, 1)}
+        for site, (size, count) in current.items()
+    ]
+    rows.sort(key=lambda row: row["size_diff_kb"], reverse=True)
+    return rows[:limit]
+
+
+class MemoryProfiler:
+    """
+    Per-route memory accounting on top of tracemalloc: traced bytes gained per
+    request (avg / max) and, every SNAPSHOT_EVERY requests, the allocation sites
+    that grew most since the route's previous snapshot. Only the KEPT_SITES
+    largest sites of that snapshot are kept, not the snapshot itself.
+    """
+
+    def __init__(self, frames=TRACEMALLOC_FRAMES, snapshot_every=SNAPSHOT_EVERY):
+        self.frames = frames
+        self.snapshot_every = snapshot_every
+        self._routes = {}  # route -> {"requests", "growth_total", "growth_max", "sites", "top_growth"}
+        self._lock = threading.Lock()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    def request_started(self):
+        g.memory_traced_start = tracemalloc.get_traced_memory()[0]
+
+    def request_finished(self, route):
+        if self._record(route, g.pop("memory_traced_start", None)):
+            self._snapshot(route)
+
+    def start_async_request(self):
+        """Traced bytes at the start of an ASGI request (None when not profiling), for finish_async_request()."""
+        return tracemalloc.get_traced_memory()[0] if MEMORY_PROFILING and tracemalloc.is_tracing() else None
+
+    async def finish_async_request(self, route, start):
+        # Coroutines of other requests allocate in between too, as other threads do under Flask
+        if self._record(route, start):
+            await anyio.to_thread.run_sync(self._snapshot, route)  # not on the event loop
+
+    def _record(self, route, start):
+        """Account one request's growth; True when the route is due a snapshot."""
+        if start is None:
+            return False
+        growth = tracemalloc.get_traced_memory()[0] - start
+        with self._lock:
+            stats = self._routes.setdefault(route, {
+                "requests": 0, "growth_total": 0, "growth_max": 0, "sites": None, "top_growth": [],
+            })
+            stats["requests"] += 1
+            stats["growth_total"] += growth
+            stats["growth_max"] = max(stats["growth_max"], growth)
+            return stats["requests"] % self.snapshot_every == 0
+
+    def _snapshot(self, route):
+        sites = _top_sites()
+        with self._lock:
+            stats = self._routes[route]
+            previous, stats["sites"] = stats["sites"], sites
+            if previous is not None:
+                stats["top_growth"] = _growth(previous, sites, TOP_SITES)
+
+    def report(self, route=None, limit=TOP_SITES):
+        report = {
+            "rss_mb": round(rss_bytes() / 1024 / 1024, 2),
+            "gc_counts": gc.get_count(),
+            "tracemalloc": tracemalloc.is_tracing(),
+        }
+        if not tracemalloc.is_tracing():
+            return report
+
+        current, peak = tracemalloc.get_traced_memory()
+        report["traced_current_mb"] = round(current / 1024 / 1024, 2)
+        report["traced_peak_mb"] = round(peak / 1024 / 1024, 2)
+        with self._lock:
+            report["routes"] = {
+                name: {
+                    "requests": stats["requests"],
+                    "avg_growth_kb": round(stats["growth_total"] / stats["requests"] / 1024, 1),
+                    "max_growth_kb": round(stats["growth_max"] / 1024, 1),
+                    "top_growth": stats["top_growth"][:limit],
+                }
+                for name, stats in self._routes.items()
+                if route is None or name == route
+            }
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        report["top_allocations"] = _format_stats(snapshot.statistics("lineno"), limit)
+        return report
+
+
+MEMORY_PROFILER = MemoryProfiler()
+
+
+def init_app(app):
+    """
+    GET /admin/memory (X-Admin-Token header must match ADMIN_TOKEN; 404 when unset),
+    plus per-route tracemalloc accounting when MEMORY_PROFILING=1.
+    """
+
+    @app.route("/admin/memory")
+    @admin_required
+    def admin_memory():
+        limit = request.args.get("limit", TOP_SITES, type=int)
+        return jsonify(MEMORY_PROFILER.report(route=request.args.get("route"), limit=limit))
+
+    if not MEMORY_PROFILING:
+        return
+    MEMORY_PROFILER.start()
+    print(f"🧠 tracemalloc on ({MEMORY_PROFILER.frames} frames), snapshot every {MEMORY_PROFILER.snapshot_every} requests per route", flush=True)
+
+    @app.before_request
+    def memory_request_started():
+        MEMORY_PROFILER.request_started()
+
+    @app.after_request
+    def memory_mark_streamed(response):
+        g.memory_streamed = response.is_streamed
+        return response
+
+    @app.teardown_request
+    def memory_request_finished(exc):
+        if g.pop("memory_streamed", False):
+            return  # measured when stream_with_context tears down after the body
+        if request.endpoint and request.endpoint != "admin_memory":
+            MEMORY_PROFILER.request_finished(request.endpoint)
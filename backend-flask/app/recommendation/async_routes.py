@@ -0,0 +1,83 @@
+from app.async_web import StreamingResponse, json_response, read_json, route, token_required
+
+from .async_service import recommend_outfit_async, recommend_outfits_async, stream_recommendation_async
+from .recommendation_service import BATCH_MAX_ITEMS, MODES
+from .routes import format_sse, parse_item_ids
+
+# Async versions of the routes in routes.py (served in SERVER_MODE=asgi)
+
+
+async def _parse_request(request):
+    """(item_id, mode, data) or an error response."""
+    data = await read_json(request) or {}
+    try:
+        selected_item_id = int(data.get("item_id"))
+    except (ValueError, TypeError, AttributeError):
+        return json_response({"error": "Invalid item_id"}, 400)
+    mode = data.get("mode", "llm")
+    if mode not in MODES:
+        return json_response({"error": f"Invalid mode, expected one of {list(MODES)}"}, 400)
+    return selected_item_id, mode, data
+
+
+@token_required
+async def recommend_ai(request):
+    parsed = await _parse_request(request)
+    if not isinstance(parsed, tuple):
+        return parsed
+    selected_item_id, mode, data = parsed
+
+    try:
+        outfit = await recommend_outfit_async(
+            selected_item_id=selected_item_id,
+            different=bool(data.get("different", False)),
+            mode=mode)
+        return json_response(outfit)
+    except Exception as e:
+        print("Error in /recommend_ai:", e)
+        return json_response({"error": str(e)}, 500)
+
+
+@token_required
+async def recommend_ai_batch(request):
+    data = await read_json(request) or {}
+    item_ids = parse_item_ids(data.get("item_ids")) if isinstance(data, dict) else None
+    if item_ids is None:
+        return json_response({"error": f"Invalid item_ids, expected 1 to {BATCH_MAX_ITEMS} ids"}, 400)
+    mode = data.get("mode", "llm")
+    if mode not in MODES:
+        return json_response({"error": f"Invalid mode, expected one of {list(MODES)}"}, 400)
+
+    try:
+        return json_response({"outfits": await recommend_outfits_async(item_ids, mode=mode)})
+    except Exception as e:
+        print("Error in /recommend_ai/batch:", e)
+        return json_response({"error": str(e)}, 500)
+
+
+# Same events as the Flask /ai/stream route
+@token_required
+async def recommend_ai_stream(request):
+    parsed = await _parse_request(request)
+    if not isinstance(parsed, tuple):
+        return parsed
+    selected_item_id, mode, _ = parsed
+
+    async def generate():
+        try:
+            async for event, payload in stream_recommendation_async(selected_item_id, mode=mode):
+                yield format_sse(event, payload)
+        except Exception as e:
+            print("Error in /recommend_ai/stream:", e)
+            yield format_sse("error", {"success": False, "message": str(e)})
+        yield format_sse("done", {})
+
+    return StreamingResponse(
+        generate(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+routes = [
+    route("recommendations", "/api/recommendations/ai", recommend_ai, methods=["POST"]),
+    route("recommendations", "/api/recommendations/ai/batch", recommend_ai_batch, methods=["POST"]),
+    route("recommendations", "/api/recommendations/ai/stream", recommend_ai_stream, methods=["POST"]),
+]
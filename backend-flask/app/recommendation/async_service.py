@@ -0,0 +1,213 @@
+import asyncio
+from time import time
+
+from app.cloth.async_db_service import (
+    get_all_cloth_embedding_async,
+    get_cloth_embedding_changes_async,
+    get_cloth_ids_async,
+    get_details_for_ids_async,
+    get_similar_clothes_async,
+)
+from app.memory_logger import log_memory
+from app.tracing import span
+from app.utils import get_current_user_id
+from .embedding_service import (
+    TOP_N_PER_CATEGORY,
+    EmbeddingUnavailableError,
+    assemble_batch_candidates,
+    assemble_candidates,
+    batch_fetch_ids,
+    build_embedding_matrix,
+    cached_embedding_matrix,
+    drop_deleted_embeddings,
+    embedding_generation,
+    merge_embedding_changes,
+    needs_refresh,
+    shortlist_from_matrix,
+    shortlist_many_from_matrix,
+    shortlist_from_rpc,
+    similarity_backend,
+    store_synced_matrix,
+)
+from .llm_service import ask_openrouter_for_outfit_async, stream_openrouter_for_outfit_async
+from .parser import JsonObjectExtractor
+from .recommendation_service import (
+    BATCH_LLM_CONCURRENCY,
+    cached_outfits,
+    finish_batch,
+    finish_outfit,
+    is_cacheable,
+    item_not_found,
+    recommendation_cache_key,
+    split_batch_candidates,
+)
+from .result_cache import RECOMMENDATION_CACHE
+from .selection import EXCLUSION_RULES
+
+# The recommendation pipeline for the ASGI routes. Supabase and OpenRouter calls
+# are awaited, so a slow LLM holds a coroutine instead of a worker thread; the
+# similarity, ranking and mapping stages are the same code as the sync pipeline.
+
+
+async def get_all_embeddings_async():
+    user_id = get_current_user_id()
+    generation = embedding_generation(user_id)
+    cache = cached_embedding_matrix(user_id, generation)
+    if cache is not None and not needs_refresh(cache):
+        return cache
+
+    if cache is not None and cache.watermark is not None:
+        fetched_at = time()
+        with span("supabase.embeddings_delta"):
+            changes = await get_cloth_embedding_changes_async(cache.watermark)
+        if changes is not None:
+            rows, count = changes
+            matrix = merge_embedding_changes(cache, rows)
+            if count is not None and count < len(matrix.known_ids()):
+                with span("supabase.cloth_ids"):
+                    matrix = drop_deleted_embeddings(matrix, await get_cloth_ids_async())
+            if matrix is not None and count == len(matrix.known_ids()):
+                return store_synced_matrix(user_id, cache, matrix, generation, fetched_at)
+
+    fetched_at = time()
+    with span("supabase.embeddings"):
+        data = await get_all_cloth_embedding_async() or []
+    return build_embedding_matrix(user_id, data, generation, fetched_at)
+
+
+async def create_candidate_by_category_async(selected_item_id:int):
+    """create_candidate_by_category() with awaited Supabase queries."""
+    result = None
+    if similarity_backend() == "pgvector":
+        with span("supabase.similar"):
+            result = await get_similar_clothes_async(selected_item_id, EXCLUSION_RULES, TOP_N_PER_CATEGORY)
+    if result is not None:
+        top_ids, similarities, fetch_ids, pending_ids = shortlist_from_rpc(result, selected_item_id)
+    else:
+        matrix = await get_all_embeddings_async()
+        top_ids, similarities, fetch_ids = shortlist_from_matrix(matrix, selected_item_id)
+        pending_ids = matrix.pending_ids.tolist()
+    with span("supabase.details"):
+        all_details = await get_details_for_ids_async(fetch_ids, with_image=True)
+    return assemble_candidates(pending_ids, selected_item_id, top_ids, similarities, all_details)
+
+
+async def create_candidates_for_items_async(item_ids):
+    """create_candidates_for_items() with awaited Supabase queries."""
+    matrix = await get_all_embeddings_async()
+    shortlists = shortlist_many_from_matrix(matrix, item_ids)
+    fetch_ids = batch_fetch_ids(shortlists)
+    all_details = []
+    if fetch_ids:
+        with span("supabase.details"):
+            all_details = await get_details_for_ids_async(fetch_ids, with_image=True)
+    return assemble_batch_candidates(matrix.pending_ids.tolist(), item_ids, shortlists, all_details)
+
+
+async def ask_llm_for_outfits_async(ready):
+    """ask_llm_for_outfits() as coroutines, at most BATCH_LLM_CONCURRENCY in flight."""
+    limit = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def ask(item_id, c):
+        async with limit:
+            try:
+                return item_id, await ask_openrouter_for_outfit_async(
+                    c["candidates_by_category"], c["selected_item"], c["similarities"])
+            except Exception as e:
+                print(f"⚠️ LLM unavailable for item {item_id}, using local ranker:", e, flush=True)
+                return item_id, None
+
+    answers = await asyncio.gather(*(ask(item_id, c) for item_id, c in ready.items()))
+    return {item_id: answer for item_id, answer in answers if answer is not None}
+
+
+async def recommend_outfits_async(item_ids, mode:str="llm"):
+    """recommend_outfits() for the ASGI routes."""
+    outfits, cache_keys = cached_outfits(item_ids, mode)
+    misses = [item_id for item_id in item_ids if item_id not in outfits]
+    ready = split_batch_candidates(await create_candidates_for_items_async(misses), outfits) if misses else {}
+
+    answers = {}
+    if mode == "llm" and ready:
+        with span("llm"):
+            answers = await ask_llm_for_outfits_async(ready)
+    outfits = finish_batch(item_ids, outfits, ready, answers, cache_keys, mode)
+    log_memory("After mapping AI to DB items")
+    return outfits
+
+
+async def recommend_outfit_async(selected_item_id:int, different:bool=False, mode:str="llm"):
+    """recommend_outfit() for the ASGI routes (same cache, same fallbacks)."""
+    cache_key = recommendation_cache_key(get_current_user_id(), selected_item_id, mode)
+    with span("recommendation_cache"):
+        cached = RECOMMENDATION_CACHE.get(cache_key, different=different)
+    if cached is not None:
+        cached["cached"] = True
+        return cached
+
+    exclude_ids = RECOMMENDATION_CACHE.suggested_ids(cache_key) if different else set()
+    try:
+        prefilter_candidates = await create_candidate_by_category_async(selected_item_id)
+    except EmbeddingUnavailableError as e:
+        return e.outfit()
+    if prefilter_candidates["selected_item"] is None:
+        return item_not_found()
+
+    ai_res_json = None
+    if mode == "llm":
+        try:
+            with span("llm"):
+                ai_res_json = await ask_openrouter_for_outfit_async(
+                    prefilter_candidates["candidates_by_category"], prefilter_candidates["selected_item"],
+                    prefilter_candidates["similarities"], exclude_ids)
+        except Exception as e:
+            print("⚠️ LLM unavailable, using local ranker:", e, flush=True)
+
+    outfit = finish_outfit(prefilter_candidates, ai_res_json, exclude_ids)
+    log_memory("After mapping AI to DB items")
+    if is_cacheable(outfit, mode):
+        outfit = RECOMMENDATION_CACHE.add(cache_key, outfit)
+    return outfit
+
+
+async def stream_recommendation_async(selected_item_id:int, mode:str="llm"):
+    """stream_recommendation() as an async generator of (event, data)."""
+    cache_key = recommendation_cache_key(get_current_user_id(), selected_item_id, mode)
+    with span("recommendation_cache"):
+        cached = RECOMMENDATION_CACHE.get(cache_key)
+    if cached is not None:
+        cached["cached"] = True
+        yield "outfit", cached
+        return
+
+    try:
+        prefilter_candidates = await create_candidate_by_category_async(selected_item_id)
+    except EmbeddingUnavailableError as e:
+        yield "error", e.outfit()
+        return
+    if prefilter_candidates["selected_item"] is None:
+        yield "error", item_not_found()
+        return
+    yield "shortlist", prefilter_candidates
+
+    extractor = JsonObjectExtractor()
+    if mode == "llm":
+        deltas = stream_openrouter_for_outfit_async(
+            prefilter_candidates["candidates_by_category"], prefilter_candidates["selected_item"],
+            prefilter_candidates["similarities"],
+        )
+        try:
+            with span("llm"):
+                async for delta in deltas:
+                    yield "token", {"text": delta}
+                    if extractor.feed(delta):
+                        break  # trailing prose isn't needed
+        except Exception as e:
+            print("⚠️ LLM stream failed, using local ranker:", e, flush=True)
+        finally:
+            await deltas.aclose()  # closes the upstream request now, not at garbage collection
+
+    outfit = finish_outfit(prefilter_candidates, extractor.result if extractor.done else None)
+    if is_cacheable(outfit, mode):
+        RECOMMENDATION_CACHE.add(cache_key, outfit)
+    yield "outfit", outfit
@@ -0,0 +1,142 @@
+import sys
+import threading
+from collections import OrderedDict
+from time import sleep, time
+
+import numpy as np
+
+
+def entry_nbytes(entry) -> int:
+    """Memory held by a cache entry: real nbytes of its arrays plus container overhead."""
+    if hasattr(entry, "nbytes"):
+        return int(entry.nbytes)
+    total = 0
+    for value in entry.values():
+        if isinstance(value, np.ndarray):
+            total += value.nbytes
+        elif isinstance(value, (list, tuple)):
+            total += sys.getsizeof(value) + sum(sys.getsizeof(v) for v in value)
+    return total
+
+
+class EmbeddingCache:
+    """
+    Per-user embedding cache with a byte budget, LRU eviction and TTL expiry.
+
+    Entries are objects exposing `nbytes` (e.g. EmbeddingMatrix) or dicts of
+    arrays/lists; their size is measured once on `put`.
+    Expired entries are dropped lazily on `get` and by a background sweeper thread,
+    so users who never come back don't stay resident.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, sweep_interval: float = 60):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._entries = OrderedDict()  # user_id -> (entry, nbytes, timestamp)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __contains__(self, user_id):
+        with self._lock:
+            return user_id in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def get(self, user_id):
+        """Return the cached entry (and mark it recently used) or None on miss/expiry."""
+        now = time()
+        with self._lock:
+            item = self._entries.get(user_id)
+            if item is None:
+                self.misses += 1
+                return None
+            entry, _, timestamp = item
+            if now - timestamp >= self.ttl:
+                self._drop(user_id)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry
+
+    def put(self, user_id, entry):
+        size = entry_nbytes(entry)
+        with self._lock:
+            if user_id in self._entries:
+                self._drop(user_id)
+            if size > self.max_bytes:
+                # A single wardrobe larger than the whole budget is never cached
+                return False
+            while self._entries and self._bytes + size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+            self._entries[user_id] = (entry, size, time())
+            self._bytes += size
+        self._ensure_sweeper()
+        return True
+
+    def invalidate(self, user_id):
+        with self._lock:
+            if user_id in self._entries:
+                self._drop(user_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def sweep(self) -> int:
+        """Drop every expired entry. Returns the number removed."""
+        cutoff = time() - self.ttl
+        with self._lock:
+            expired = [uid for uid, (_, _, ts) in self._entries.items() if ts <= cutoff]
+            for uid in expired:
+                self._drop(uid)
+            self.expirations += len(expired)
+        return len(expired)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    # --- internals (caller holds the lock) ---
+    def _drop(self, user_id):
+        _, size, _ = self._entries.pop(user_id)
+        self._bytes -= size
+
+    def _ensure_sweeper(self):
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        with self._lock:
+            if self._sweeper is not None and self._sweeper.is_alive():
+                return
+            self._sweeper = threading.Thread(target=self._sweep_loop, name="embed-cache-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def _sweep_loop(self):
+        while True:
+            sleep(self.sweep_interval)
+            removed = self.sweep()
+            if removed:
+                print(f"[EMBED CACHE] swept {removed} expired entries", flush=True)
@@ -0,0 +1,312 @@
+import os
+from time import time
+
+import numpy as np
+
+from app.cloth.db_service import TYPE_TO_CATEGORY
+from app.embedding_codec import empty_embeddings
+
+# Category names <-> small int codes stored per row
+CATEGORIES = tuple(sorted(set(TYPE_TO_CATEGORY.values()))) + ("unknown",)
+CATEGORY_CODES = {name: code for code, name in enumerate(CATEGORIES)}
+UNKNOWN_CODE = CATEGORY_CODES["unknown"]
+# Code of a row dropped by an incremental update; never a candidate, never indexed
+REMOVED_CODE = len(CATEGORIES)
+
+PRECISIONS = ("float32", "float16", "int8")
+# Rows scored per chunk when the stored matrix has to be upcast to float32
+_SCORE_CHUNK = 1024
+# Compact (rebuild without dropped rows) once they make up this share of the matrix
+_COMPACT_RATIO = 0.25
+
+
+def category_code(name) -> int:
+    return CATEGORY_CODES.get(name, UNKNOWN_CODE)
+
+
+def category_codes(names):
+    return np.fromiter((category_code(n) for n in names), dtype=np.int8, count=len(names))
+
+
+def embedding_precision() -> str:
+    precision = os.getenv("EMBEDDING_PRECISION", "float32").lower()
+    return precision if precision in PRECISIONS else "float32"
+
+
+def normalize_embeddings(embeddings, precision):
+    """Row-normalize raw (N, D) embeddings and store them at `precision`. Returns (vectors, scales)."""
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    normalized = embeddings / norms
+
+    scales = None
+    if precision == "float16":
+        vectors = normalized.astype(np.float16)
+    elif precision == "int8":
+        scales = np.abs(normalized).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        vectors = np.rint(normalized / scales[:, None]).astype(np.int8)
+        scales = scales.astype(np.float32)
+    else:
+        vectors = normalized.astype(np.float32, copy=False)
+    return vectors, scales
+
+
+class _RowBuffer:
+    """
+    Over-allocated vector (and scale) storage that matrices view a prefix of.
+    `used` is the row count of the newest matrix on it: only that matrix may
+    append, so an older matrix never sees rows written after it.
+    """
+
+    __slots__ = ("vectors", "scales", "used")
+
+    def __init__(self, vectors, scales, used):
+        self.vectors = vectors
+        self.scales = scales
+        self.used = used
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+
+class EmbeddingMatrix:
+    """
+    Compact per-user embedding set: ids (int64), category codes (int8) and one
+    row-normalized matrix, stored as float32, float16, or int8 with a float32
+    scale per row (row = int8 * scale).
+    `id_order` (argsort of ids) is the id -> row index, built once when the cache fills
+    (or read back from the shared store).
+    `pending_ids` are the user's items whose embedding is still being computed.
+    `generation` is the shared-store generation the matrix was built at (None without that tier).
+    `watermark` (EMBEDDING_SYNC=delta) is the epoch time from which rows changed in
+    Supabase still have to be fetched, and `synced_at` when the matrix last matched it.
+
+    The `with_*` / `without_row` updates return a new matrix and never change
+    rows this one can see, so a request still scoring it is unaffected. Vectors
+    are appended into spare rows of a shared buffer and removed rows are only
+    re-coded as REMOVED_CODE (compacted once they pile up), so a change costs
+    O(D) for the vector plus an O(N) copy of the small id/code arrays.
+    """
+
+    __slots__ = (
+        "ids", "codes", "vectors", "scales", "precision", "id_order", "pending_ids",
+        "generation", "watermark", "synced_at", "_buffer",
+    )
+
+    def __init__(self, ids, codes, vectors, scales=None, precision="float32", pending_ids=None, id_order=None):
+        self.ids = ids
+        self.codes = codes
+        self.vectors = vectors
+        self.scales = scales
+        self.precision = precision
+        self.id_order = np.argsort(ids, kind="stable") if id_order is None else id_order
+        self.pending_ids = np.asarray(pending_ids if pending_ids is not None else [], dtype=np.int64)
+        self.generation = None
+        self.watermark = None
+        self.synced_at = time()
+        self._buffer = None
+
+    @classmethod
+    def from_embeddings(cls, ids, categories, embeddings, precision=None, pending_ids=None):
+        """Normalize raw (N, D) embeddings and store them at the requested precision."""
+        precision = precision or embedding_precision()
+        vectors, scales = normalize_embeddings(embeddings, precision)
+        return cls(
+            ids=np.asarray(ids, dtype=np.int64),
+            codes=category_codes(categories),
+            vectors=vectors,
+            scales=scales,
+            precision=precision,
+            pending_ids=pending_ids,
+        )
+
+    @classmethod
+    def empty(cls, dim, pending_ids=None, precision=None):
+        precision = precision or embedding_precision()  # rows may be added later
+        vectors, scales = normalize_embeddings(empty_embeddings(dim), precision)
+        return cls(
+            ids=np.empty(0, dtype=np.int64),
+            codes=np.empty(0, dtype=np.int8),
+            vectors=vectors,
+            scales=scales,
+            precision=precision,
+            pending_ids=pending_ids,
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        total = self.ids.nbytes + self.codes.nbytes + self.id_order.nbytes + self.pending_ids.nbytes
+        if self._buffer is not None:
+            return total + self._buffer.nbytes  # spare rows are held too
+        total += self.vectors.nbytes
+        if self.scales is not None:
+            total += self.scales.nbytes
+        return total
+
+    def rows_of(self, ids):
+        """Row index for each id (-1 where the id isn't in the matrix)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(self.id_order):  # removed rows aren't indexed
+            return np.full(ids.shape, -1, dtype=np.int64)
+        sorted_ids = self.ids[self.id_order]
+        pos = np.minimum(np.searchsorted(sorted_ids, ids), len(self.id_order) - 1)
+        rows = self.id_order[pos]
+        return np.where(sorted_ids[pos] == ids, rows, -1)
+
+    def row_of(self, item_id) -> int:
+        return int(self.rows_of([item_id])[0])
+
+    def is_pending(self, item_id) -> bool:
+        return bool(np.any(self.pending_ids == item_id))
+
+    def known_ids(self):
+        """Ids of every item the matrix accounts for: indexed rows plus pending ones."""
+        return np.concatenate([self.ids[self.id_order], self.pending_ids])
+
+    def rows_float32(self, start=0, stop=None):
+        """Dequantized, normalized float32 copy of rows [start:stop]."""
+        block = self.vectors[start:stop].astype(np.float32)
+        if self.scales is not None:
+            block *= self.scales[start:stop, None]
+        return block
+
+    def rows_at(self, rows):
+        """Dequantized, normalized float32 copy of the given rows."""
+        rows = np.asarray(rows, dtype=np.int64)
+        block = self.vectors[rows].astype(np.float32)
+        if self.scales is not None:
+            block *= self.scales[rows, None]
+        return block
+
+    def vector(self, row: int):
+        return self.rows_float32(row, row + 1)[0]
+
+    def scores(self, query):
+        """Cosine similarity of every row with a normalized float32 query vector."""
+        query = np.asarray(query, dtype=np.float32)
+        if self.precision == "float32":
+            return self.vectors @ query
+        out = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), _SCORE_CHUNK):
+            stop = start + _SCORE_CHUNK
+            out[start:stop] = self.vectors[start:stop].astype(np.float32) @ query
+        if self.scales is not None:
+            out *= self.scales
+        return out
+
+    def scores_many(self, queries):
+        """(N, S) cosine similarities of every row with S normalized float32 query vectors, one matmul."""
+        queries = np.asarray(queries, dtype=np.float32).T
+        if self.precision == "float32":
+            return self.vectors @ queries
+        out = np.empty((len(self), queries.shape[1]), dtype=np.float32)
+        for start in range(0, len(self), _SCORE_CHUNK):
+            stop = start + _SCORE_CHUNK
+            out[start:stop] = self.vectors[start:stop].astype(np.float32) @ queries
+        if self.scales is not None:
+            out *= self.scales[:, None]
+        return out
+
+    # --- incremental updates ---
+    def _derive(self, ids=None, codes=None, vectors=None, scales=None, id_order=None, pending_ids=None, buffer=None):
+        matrix = EmbeddingMatrix(
+            ids=self.ids if ids is None else ids,
+            codes=self.codes if codes is None else codes,
+            vectors=self.vectors if vectors is None else vectors,
+            scales=self.scales if vectors is None else scales,
+            precision=self.precision,
+            pending_ids=self.pending_ids if pending_ids is None else pending_ids,
+            id_order=self.id_order if id_order is None else id_order,
+        )
+        matrix._buffer = self._buffer if buffer is None else buffer
+        matrix.watermark, matrix.synced_at = self.watermark, self.synced_at
+        return matrix
+
+    def _spare_buffer(self):
+        """A buffer this matrix can append one row to, copying (and growing) it only when needed."""
+        n = len(self)
+        buffer = self._buffer
+        if buffer is not None and buffer.used == n and len(buffer.vectors) > n:
+            return buffer
+        capacity = max(16, n + n // 2 + 1)  # amortized O(D) per append
+        vectors = np.empty((capacity,) + self.vectors.shape[1:], dtype=self.vectors.dtype)
+        vectors[:n] = self.vectors
+        scales = None
+        if self.scales is not None:
+            scales = np.empty(capacity, dtype=np.float32)
+            scales[:n] = self.scales
+        return _RowBuffer(vectors, scales, n)
+
+    def with_row(self, item_id, category, embedding):
+        """Add or replace one item from its raw embedding; it's no longer pending. Unchanged rows return self."""
+        vector, scale = normalize_embeddings(np.asarray(embedding, dtype=np.float32).reshape(1, -1), self.precision)
+        row = self.row_of(item_id)
+        if (row >= 0 and self.codes[row] == category_code(category) and np.array_equal(self.vectors[row], vector[0])
+                and (scale is None or self.scales[row] == scale[0])):
+            return self
+        base = self.without_row(item_id)
+        n = len(base)
+        buffer = base._spare_buffer()
+        buffer.vectors[n] = vector[0]
+        if buffer.scales is not None:
+            buffer.scales[n] = scale[0]
+        buffer.used = n + 1
+
+        pos = np.searchsorted(base.ids[base.id_order], item_id)
+        return base._derive(
+            ids=np.append(base.ids, np.int64(item_id)),
+            codes=np.append(base.codes, np.int8(category_code(category))),
+            vectors=buffer.vectors[:n + 1],
+            scales=buffer.scales[:n + 1] if buffer.scales is not None else None,
+            id_order=np.insert(base.id_order, pos, n),
+            pending_ids=base.pending_ids[base.pending_ids != item_id],
+            buffer=buffer,
+        )
+
+    def without_row(self, item_id):
+        """Drop one item (and its pending mark)."""
+        pending_ids = self.pending_ids[self.pending_ids != item_id]
+        row = self.row_of(item_id)
+        if row < 0:
+            return self._derive(pending_ids=pending_ids)
+        codes = self.codes.copy()
+        codes[row] = REMOVED_CODE
+        matrix = self._derive(codes=codes, id_order=self.id_order[self.id_order != row], pending_ids=pending_ids)
+        if len(matrix) - len(matrix.id_order) > _COMPACT_RATIO * len(matrix):
+            return matrix.compacted()
+        return matrix
+
+    def with_pending(self, item_id):
+        """Drop one item's vector and mark it pending until its new embedding lands."""
+        if self.is_pending(item_id):
+            return self
+        matrix = self.without_row(item_id)
+        return matrix._derive(pending_ids=np.append(matrix.pending_ids, np.int64(item_id)))
+
+    def with_category(self, item_id, category):
+        """Re-code one item's category, keeping its vector."""
+        row = self.row_of(item_id)
+        if row < 0:
+            return self
+        codes = self.codes.copy()
+        codes[row] = category_code(category)
+        return self._derive(codes=codes)
+
+    def compacted(self):
+        """Private copy holding only the live rows (one O(N·D) copy)."""
+        live = self.codes != REMOVED_CODE
+        matrix = EmbeddingMatrix(
+            ids=self.ids[live],
+            codes=self.codes[live],
+            vectors=self.vectors[live],
+            scales=self.scales[live] if self.scales is not None else None,
+            precision=self.precision,
+            pending_ids=self.pending_ids,
+        )
+        matrix.watermark, matrix.synced_at = self.watermark, self.synced_at
+        return matrix
@@ -1,148 +1,449 @@
-import ast
-from app.cloth.db_service import get_all_cloth_embedding, get_details_for_ids
+import os
+import threading
+from time import time
 
 import numpy as np
-from time import time
+from app.cloth.db_service import (
+    get_all_cloth_embedding,
+    get_cloth_embedding_changes,
+    get_cloth_ids,
+    get_details_for_ids,
+    get_similar_clothes,
+    use_delta_sync,
+)
+
+from app.cloth.embedding_jobs import EMBEDDING_JOBS
 from app.memory_logger import log_memory
+from app.tracing import span
 from app.utils import get_current_user_id
+from app.embedding_codec import EMBEDDING_DIM, decode_embedding_rows
+from .embedding_cache import EmbeddingCache
+from .embedding_matrix import CATEGORIES, EmbeddingMatrix
+from .selection import (
+    EXCLUSION_RULES,
+    candidate_mask,
+    candidate_masks,
+    top_n_per_category,
+    top_n_per_category_many,
+)
+from .shared_embedding_store import SHARED_DIR, SharedEmbeddingStore
 log_memory("startup embedding_service")
 
 # Cache
-EMBED_CACHE = {}
-CACHE_TTL = 60 * 60  # 1 hour
+CACHE_TTL = 60 * 60  # 1 hour, then the matrix is refreshed from Supabase
+# With EMBEDDING_SYNC=delta a refresh only reads rows changed since the matrix's
+# watermark, so matrices stay resident longer and are synced in place
+CACHE_IDLE_TTL = 4 * CACHE_TTL if use_delta_sync() else CACHE_TTL
+# The watermark trails the fetch it came from, covering slower transactions and clock skew
+SYNC_OVERLAP = 60  # seconds
+CACHE_MAX_BYTES = int(os.getenv("EMBED_CACHE_MAX_BYTES", 64 * 1024 * 1024))  # 64 MB
+EMBED_CACHE = EmbeddingCache(max_bytes=CACHE_MAX_BYTES, ttl=CACHE_IDLE_TTL)
+# Cross-worker tier between EMBED_CACHE and Supabase (SHARED_EMBED_CACHE_DIR=off to disable)
+SHARED_EMBEDDINGS = SharedEmbeddingStore(SHARED_DIR, ttl=CACHE_IDLE_TTL)
 TOP_N_PER_CATEGORY = 3
 
 
-# Clear cache (e.g. on new cloth added)
+def similarity_backend() -> str:
+    """
+    'local' (default): cosine over the cached matrix in this process.
+    'pgvector': the similar_clothes_by_category RPC (sql/005), which returns only the shortlist.
+    """
+    return "pgvector" if os.getenv("SIMILARITY_BACKEND", "local").lower() == "pgvector" else "local"
+
+
+class EmbeddingUnavailableError(Exception):
+    """The selected item has no embedding: still being computed, or its job gave up."""
+    status = None
+
+    def __init__(self, item_id, message):
+        super().__init__(message)
+        self.item_id = item_id
+
+    def outfit(self):
+        """The recommendation response for this item: {success, pending | failed, message}."""
+        return {"success": False, self.status: True, "message": str(self)}
+
+
+class EmbeddingPendingError(EmbeddingUnavailableError):
+    """The selected item was saved but its embedding is still being computed."""
+    status = "pending"
+
+    def __init__(self, item_id):
+        super().__init__(item_id, f"Item {item_id} is still being analysed, try again in a moment")
+
+
+class EmbeddingFailedError(EmbeddingUnavailableError):
+    """Computing the selected item's embedding failed MAX_ATTEMPTS times; saving it again retries."""
+    status = "failed"
+
+    def __init__(self, item_id):
+        super().__init__(item_id, f"Item {item_id} could not be analysed, edit and save it again to retry")
+
+
+def unavailable_error(item_id):
+    """The error for an item with no embedding, failed if its background job gave up."""
+    return EmbeddingFailedError(item_id) if EMBEDDING_JOBS.is_failed(item_id) else EmbeddingPendingError(item_id)
+
+
+# Clear cache (e.g. after a bulk import), in every worker
 def clear_user_embeddings(user_id):
-    if user_id in EMBED_CACHE:
-        del EMBED_CACHE[user_id]
+    EMBED_CACHE.invalidate(user_id)
+    SHARED_EMBEDDINGS.invalidate(user_id)
+
+
+_UPDATE_LOCK = threading.Lock()
+
+
+def _publish(user_id, matrix, generation):
+    """
+    Store a changed matrix in both tiers under a new generation, unless another
+    worker changed the user since `generation` was read. Returns True if stored.
+    """
+    new_generation = SHARED_EMBEDDINGS.invalidate(user_id, expected=generation)
+    if SHARED_EMBEDDINGS.enabled and new_generation is None:
+        return False
+    matrix.generation = new_generation
+    # Other workers attach to the shared copy; this one keeps its private
+    # arrays so the next update appends in place
+    SHARED_EMBEDDINGS.put(user_id, matrix, new_generation)
+    EMBED_CACHE.put(user_id, matrix)
+    return True
+
+
+def _update_user_embeddings(user_id, change):
+    """
+    Apply `change(matrix) -> matrix` to the user's cached matrix instead of
+    dropping it, so the next recommendation doesn't refetch every embedding.
+    Nothing cached, or another worker changed the user meanwhile: both tiers
+    are just invalidated.
+    """
+    with _UPDATE_LOCK:
+        generation = embedding_generation(user_id)
+        matrix = cached_embedding_matrix(user_id, generation)
+        if matrix is not None:
+            matrix = change(matrix)
+            if _publish(user_id, matrix, generation):
+                return matrix
+        clear_user_embeddings(user_id)
+        return None
+
+
+def upsert_user_embedding(user_id, cloth_id, category, embedding_vector):
+    """A cloth's embedding was saved: add or replace its row."""
+    return _update_user_embeddings(user_id, lambda m: m.with_row(cloth_id, category, embedding_vector))
+
+
+def remove_user_embedding(user_id, cloth_id):
+    """A cloth was deleted: drop its row."""
+    return _update_user_embeddings(user_id, lambda m: m.without_row(cloth_id))
+
+
+def mark_user_embedding_pending(user_id, cloth_id):
+    """A cloth was saved without an embedding yet: report it as pending."""
+    return _update_user_embeddings(user_id, lambda m: m.with_pending(cloth_id))
+
+
+def update_user_embedding_category(user_id, cloth_id, category):
+    """A cloth changed category but keeps its stored vector for now."""
+    return _update_user_embeddings(user_id, lambda m: m.with_category(cloth_id, category))
+
+
+def embedding_generation(user_id):
+    """Shared-store generation, read before fetching so a racing invalidation wins."""
+    return SHARED_EMBEDDINGS.generation(user_id)
+
+
+def cached_embedding_matrix(user_id, generation=None):
+    """
+    The worker's own copy if no worker invalidated the user since it was cached,
+    else the shared-memory copy (zero-copy views), else None.
+    """
+    with span("embedding_cache"):
+        matrix = EMBED_CACHE.get(user_id)
+        if matrix is not None and matrix.generation == generation:
+            return matrix
+        matrix = SHARED_EMBEDDINGS.get(user_id, generation)
+    if matrix is not None:
+        matrix.generation = generation
+        EMBED_CACHE.put(user_id, matrix)
+    return matrix
+
+
+def build_embedding_matrix(user_id, data, generation=None, fetched_at=None):
+    """
+    EmbeddingMatrix from get_all_cloth_embedding() rows, stored in both cache tiers.
+    `fetched_at` (when the fetch started) sets the delta-sync watermark.
+    """
+    watermark = fetched_at - SYNC_OVERLAP if fetched_at is not None and use_delta_sync() else None
+    rows = [row for row in data if row.get("embedding_b64") or row.get("embedding")]
+    # Saved items whose embedding job hasn't landed yet
+    pending_ids = [row["id"] for row in data if not (row.get("embedding_b64") or row.get("embedding"))]
+    if not rows:
+        # No valid embeddings
+        matrix = EmbeddingMatrix.empty(EMBEDDING_DIM, pending_ids=pending_ids)
+        matrix.watermark = watermark
+        return matrix
+
+    ids = [row["id"] for row in rows]
+    categories = [row["category"] for row in rows]
+    # Decode every row into one preallocated (N, D) float32 matrix, then keep only
+    # the normalized (optionally quantized) copy
+    with span("decode"):
+        matrix = EmbeddingMatrix.from_embeddings(ids, categories, decode_embedding_rows(rows), pending_ids=pending_ids)
+    matrix.watermark = watermark
+
+    # Shared copy first, so this worker keeps views into it rather than private arrays
+    matrix = SHARED_EMBEDDINGS.put(user_id, matrix, generation) or matrix
+    matrix.generation = generation
+    # Update cache (may evict least recently used users to stay within budget)
+    EMBED_CACHE.put(user_id, matrix)
+    return matrix
+
+
+def needs_refresh(matrix) -> bool:
+    return time() - matrix.synced_at >= CACHE_TTL
+
+
+def merge_embedding_changes(matrix, rows):
+    """
+    Apply rows from get_cloth_embedding_changes() to the cached matrix. Returns
+    a new matrix (O(D) per changed row), or the same one if nothing changed
+    (rows re-read inside the overlap come back identical).
+    """
+    ready = [row for row in rows if row.get("embedding_b64") or row.get("embedding")]
+    vectors = decode_embedding_rows(ready) if ready else None
+    for row, vector in zip(ready, vectors if vectors is not None else []):
+        matrix = matrix.with_row(row["id"], row["category"], vector)
+    for row in rows:
+        if not (row.get("embedding_b64") or row.get("embedding")):
+            matrix = matrix.with_pending(row["id"])
+    return matrix
+
+
+def drop_deleted_embeddings(matrix, ids):
+    """Remove items no longer in `ids` (the user's current cloth ids); None if they couldn't be fetched."""
+    if ids is None:
+        return None
+    for item_id in np.setdiff1d(matrix.known_ids(), np.asarray(ids, dtype=np.int64)):
+        matrix = matrix.without_row(int(item_id))
+    return matrix
+
+
+def store_synced_matrix(user_id, cached, matrix, generation, fetched_at):
+    """
+    Keep a delta-synced matrix. Unchanged ones just restart their TTL; changed
+    ones are published like an incremental update, unless the user changed
+    while the delta was fetched (then it serves this request only).
+    """
+    matrix.synced_at = time()
+    matrix.watermark = fetched_at - SYNC_OVERLAP
+    if matrix is cached:
+        SHARED_EMBEDDINGS.put(user_id, matrix, generation)  # other workers skip their own delta
+        EMBED_CACHE.put(user_id, matrix)
+        return matrix
+    with _UPDATE_LOCK:
+        _publish(user_id, matrix, generation)
+    return matrix
+
 
 # Fetch cached embeddings from memory or Supabase
 def get_all_embeddings():
-    """Fetch cached embeddings + categories from memory or Supabase."""
+    """
+    Fetch the user's EmbeddingMatrix (ids, category codes, normalized vectors)
+    from memory or Supabase.
+    """
     user_id = get_current_user_id()
-    now = time()
-    cache = EMBED_CACHE.get(user_id)
+    generation = embedding_generation(user_id)
+    cache = cached_embedding_matrix(user_id, generation)
 
-    # 1️⃣ Use cache if valid
-    if cache and now - cache["timestamp"] < CACHE_TTL:
+    # 1️⃣ Use cache if valid (TTL and LRU handled by EMBED_CACHE, other workers' changes by generation)
+    if cache is not None and not needs_refresh(cache):
         print('will use cache!!')
-        return cache["ids"], cache["embeddings"], cache["norms"], cache["categories"]
-
-    # 2️⃣ Fetch from Supabase
-    data = get_all_cloth_embedding()
-    if not data:
-        return [], np.empty((0, 1536), dtype=np.float32), np.empty((0, 1536), dtype=np.float32), []
-
-    ids = []
-    embeddings_list = []
-    categories = []
-
-    for row in data:
-        emb = row.get("embedding")
-        if not emb:
-            continue
-        # Convert string embedding to numeric array (float32)
-        if isinstance(emb, str):
-            emb = np.array(ast.literal_eval(emb), dtype=np.float32)
-        else:
-            emb = np.array(emb, dtype=np.float32)
-        embeddings_list.append(emb)
-        ids.append(row["id"])
-        categories.append(row["category"])
-
-    if not embeddings_list:
-        # No valid embeddings
-        return [], np.empty((0, 1536), dtype=np.float32), np.empty((0, 1536), dtype=np.float32), []
+        return cache
+
+    # 2️⃣ Stale cache with a watermark: fetch only rows changed since, and the
+    # row count to catch deletes (the merged ids are a superset of Supabase's)
+    if cache is not None and cache.watermark is not None:
+        fetched_at = time()
+        with span("supabase.embeddings_delta"):
+            changes = get_cloth_embedding_changes(cache.watermark)
+        if changes is not None:
+            rows, count = changes
+            matrix = merge_embedding_changes(cache, rows)
+            if count is not None and count < len(matrix.known_ids()):
+                with span("supabase.cloth_ids"):
+                    matrix = drop_deleted_embeddings(matrix, get_cloth_ids())
+            if matrix is not None and count == len(matrix.known_ids()):
+                return store_synced_matrix(user_id, cache, matrix, generation, fetched_at)
+
+    # 3️⃣ Fetch everything from Supabase, decode and cache
+    fetched_at = time()
+    with span("supabase.embeddings"):
+        data = get_all_cloth_embedding() or []
+    return build_embedding_matrix(user_id, data, generation, fetched_at)
+
+
+def shortlist_from_matrix(matrix, selected_item_id:int):
+    """
+    Similarity stage of the prefilter, no I/O.
+    Returns (top_ids {category: [id]}, similarities {id: cosine}, ids to fetch details for).
+    """
+    # --- Step 1: locate selected item (id -> row index, no list scan) ---
+    selected_row = matrix.row_of(selected_item_id)
+    if selected_row < 0:
+        if matrix.is_pending(selected_item_id):
+            raise unavailable_error(selected_item_id)
+        raise ValueError(f"Item {selected_item_id} has no embedding")
+    selected_vec = matrix.vector(selected_row)  # normalized, so dot product = cosine
+    
+    # --- Step 2 + 3: category rules as a mask, cosine similarity, then
+    # top-N per category (argpartition within each category code) ---
+    with span("similarity"):
+        mask = candidate_mask(matrix.codes, selected_row)
+        sims = matrix.scores(selected_vec)
+        top_rows = top_n_per_category(sims, matrix.codes, mask, TOP_N_PER_CATEGORY)
+    log_memory("After cosine similarity")
+
+    top_ids = {CATEGORIES[code]: matrix.ids[rows].tolist() for code, rows in top_rows.items()}
+    similarities = {
+        int(matrix.ids[row]): float(sims[row]) for rows in top_rows.values() for row in rows
+    }
+    fetch_ids = [selected_item_id] + [i for ids in top_ids.values() for i in ids]
+    return top_ids, similarities, fetch_ids
+
+
+def shortlist_many_from_matrix(matrix, item_ids):
+    """
+    shortlist_from_matrix() for many seed items: one (N, S) matmul and one
+    top-N pass per category over all seeds. Returns one entry per item id,
+    either (top_ids, similarities, fetch_ids) or the error that
+    shortlist_from_matrix() would raise for it.
+    """
+    rows = matrix.rows_of(item_ids)
+    results = [None] * len(item_ids)
+    for i, (item_id, row) in enumerate(zip(item_ids, rows)):
+        if row < 0:
+            results[i] = (unavailable_error(item_id) if matrix.is_pending(item_id)
+                          else ValueError(f"Item {item_id} has no embedding"))
+    seeds = [i for i, row in enumerate(rows) if row >= 0]
+    if not seeds:
+        return results
+
+    with span("similarity"):
+        seed_rows = rows[seeds]
+        sims = matrix.scores_many(matrix.rows_at(seed_rows))
+        top_rows = top_n_per_category_many(sims, matrix.codes, candidate_masks(matrix.codes, seed_rows), TOP_N_PER_CATEGORY)
+    log_memory("After batch cosine similarity")
+
+    for column, (i, seed_top) in enumerate(zip(seeds, top_rows)):
+        top_ids = {CATEGORIES[code]: matrix.ids[r].tolist() for code, r in seed_top.items()}
+        similarities = {int(matrix.ids[r]): float(sims[r, column]) for rs in seed_top.values() for r in rs}
+        results[i] = (top_ids, similarities, [item_ids[i]] + [x for ids in top_ids.values() for x in ids])
+    return results
+
+
+def shortlist_from_rpc(result, selected_item_id:int):
+    """
+    shortlist_from_matrix() for the pgvector backend's RPC result (same errors).
+    Returns (top_ids, similarities, fetch_ids, pending_ids).
+    """
+    selected = result.get("selected")
+    if not selected:
+        raise ValueError(f"Item {selected_item_id} has no embedding")
+    if not selected["has_embedding"]:
+        raise unavailable_error(selected_item_id)
+
+    top_ids, similarities = {}, {}
+    for row in result.get("candidates") or []:
+        top_ids.setdefault(row["category"], []).append(row["id"])
+        similarities[row["id"]] = float(row["similarity"])
+    fetch_ids = [selected_item_id] + [i for ids in top_ids.values() for i in ids]
+    return top_ids, similarities, fetch_ids, result.get("pending_ids") or []
 
-    embeddings = np.stack(embeddings_list, axis=0)  # shape (N, D)
 
-    # Normalize embeddings (float32)
-    norms = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True).astype(np.float32)
+def assemble_candidates(pending_ids, selected_item_id:int, top_ids, similarities, all_details):
+    """Split fetched details into the selected item and its candidates (create_candidate_by_category's result)."""
+    details_map = {item["id"]: item for item in all_details}
+    failed_ids = EMBEDDING_JOBS.failed_ids(pending_ids)
+    selected_item = details_map.get(selected_item_id)
+    candidates_by_category = {
+        cat: [details_map[i] for i in ids if i in details_map]
+        for cat, ids in top_ids.items()
+    }
 
-    # 3️⃣ Update cache
-    EMBED_CACHE[user_id] = {
-        "ids": ids,
-        "embeddings": embeddings,
-        "norms": norms,
-        "categories": categories,
-        "timestamp": now,
+    return {
+        "selected_item": selected_item,
+        "candidates_by_category": candidates_by_category,
+        "similarities": similarities,
+        "pending_ids": [i for i in pending_ids if i not in failed_ids],
+        "failed_ids": sorted(failed_ids),
     }
 
-    return ids, embeddings, norms, categories
 
 # Prefilter with embedding cosine similarity
 def create_candidate_by_category(selected_item_id:int):
     """
-    Group items by category for prefiltering.
-    all_items: list of dicts with 'type', 'name', 'colour', 'styles' (list of strings)
-    Returns: dict {selected_item, candidates_by_category}    
+    Pick the top-N most similar items per compatible category for the selected item.
+    Returns: dict {selected_item, candidates_by_category, similarities, pending_ids, failed_ids},
+    candidates sorted by similarity; similarities maps candidate id -> cosine similarity; pending_ids
+    are items not considered because their embedding isn't ready, failed_ids because its job gave up.
     """
-    # --- Step 0: extract ids, embeddings, categories ---
-    ids, embeddings, norms, categories = get_all_embeddings()
-    print('all ids:', ids)
-    log_memory("After get_all_embeddings()")
-    
-    # --- Step 1: locate selected item ---
-    selected_idx = ids.index(selected_item_id)
-    selected_vec = embeddings[selected_idx]
-    selected_cat = categories[selected_idx]
-    
-    # --- Step 1.5: apply category rules ---
-    def should_exclude_category(selected_category, candidate_category):
-        """Returns True if candidate_category should be excluded based on selected_category"""
-        # Rule 1: if selected is dress, exclude top and bottom
-        if selected_category == 'dress' and candidate_category in ['top', 'bottom']:
-            return True
-        # Rule 2: if selected is top or bottom, exclude dress
-        if selected_category in ['top', 'bottom'] and candidate_category == 'dress':
-            return True
-        return False
-    
-    candidate_indices = [
-        i for i in range(len(ids))
-        if ids[i] != selected_item_id  # not the selected item itself
-        and categories[i] != selected_cat  # not same category
-        and not should_exclude_category(selected_cat, categories[i])  # not excluded by rules
-    ]
-    
-    # --- Step 2: cosine similarity using cache---
-    candidate_norms = norms[candidate_indices]
-    sims = np.dot(candidate_norms, selected_vec)
-    log_memory("After cosine similarity")
-    
-    # --- Step 3: score and group by category ---
-    scored = [
-        {"id": ids[idx], "sim": sims[i], "category": categories[idx]}
-        for i, idx in enumerate(candidate_indices)
-    ]
-
-    grouped = {}
-    for item in scored:
-        cat = item["category"]
-        grouped.setdefault(cat, []).append(item)
-    
-    # --- Step 5: pick top-N per category ---
-    top_ids = []
-    for cat, items in grouped.items():
-        top_items = sorted(items, key=lambda x: x["sim"], reverse=True)[:TOP_N_PER_CATEGORY]
-        top_ids.extend([i["id"] for i in top_items])
-    
-    # --- Step 6: fetch all details in one query (selected + top candidates) ---
-    fetch_ids = [selected_item_id] + top_ids
-    all_details = get_details_for_ids(fetch_ids, with_image=False)
+    result = None
+    if similarity_backend() == "pgvector":
+        # --- Step 0-3 in Postgres: only the shortlist comes back ---
+        with span("supabase.similar"):
+            result = get_similar_clothes(selected_item_id, EXCLUSION_RULES, TOP_N_PER_CATEGORY)
+    if result is not None:
+        top_ids, similarities, fetch_ids, pending_ids = shortlist_from_rpc(result, selected_item_id)
+    else:
+        # --- Step 0: cached ids, category codes and normalized embeddings ---
+        matrix = get_all_embeddings()
+        log_memory("After get_all_embeddings()")
+
+        # --- Step 1-3: selected row, similarity, top-N per category ---
+        top_ids, similarities, fetch_ids = shortlist_from_matrix(matrix, selected_item_id)
+        pending_ids = matrix.pending_ids.tolist()
+
+    # --- Step 4: fetch all details in one query (selected + top candidates) ---
+    # image_url included, so the chosen items are later resolved from this shortlist without another query
+    with span("supabase.details"):
+        all_details = get_details_for_ids(fetch_ids, with_image=True)
     log_memory("After get_details_for_ids()")
-    
-    # --- Step 7: split selected vs candidates ---
-    selected_item = next((i for i in all_details if i["id"] == selected_item_id), None)
-    candidates_by_category = {cat: [] for cat in grouped.keys()}
-    
-    for cat, items in grouped.items():
-        ids_list = [i["id"] for i in items]
-        candidates_by_category[cat] = [i for i in all_details if i["id"] in ids_list]
 
+    # --- Step 5: split selected vs candidates ---
+    return assemble_candidates(pending_ids, selected_item_id, top_ids, similarities, all_details)
+
+
+def assemble_batch_candidates(pending_ids, item_ids, shortlists, all_details):
+    """{item_id: create_candidate_by_category() result, or its error} from shortlist_many_from_matrix()."""
     return {
-        "selected_item": selected_item,
-        "candidates_by_category": candidates_by_category
-    }
\ No newline at end of file
+        item_id: shortlist if isinstance(shortlist, Exception)
+        else assemble_candidates(pending_ids, item_id, *shortlist[:2], all_details)
+        for item_id, shortlist in zip(item_ids, shortlists)
+    }
+
+
+def batch_fetch_ids(shortlists):
+    """Every id the batch needs details for, deduplicated, for one get_details_for_ids() call."""
+    return list(dict.fromkeys(i for s in shortlists if not isinstance(s, Exception) for i in s[2]))
+
+
+def create_candidates_for_items(item_ids):
+    """
+    create_candidate_by_category() for many seed items with one embedding
+    fetch, one similarity matmul and one details query. Always scores the
+    cached matrix (also with SIMILARITY_BACKEND=pgvector: one matmul beats an
+    RPC per seed). Returns {item_id: candidates dict, or the seed's
+    EmbeddingUnavailableError / ValueError}.
+    """
+    matrix = get_all_embeddings()
+    log_memory("After get_all_embeddings()")
+    shortlists = shortlist_many_from_matrix(matrix, item_ids)
+
+    fetch_ids = batch_fetch_ids(shortlists)
+    all_details = []
+    if fetch_ids:
+        with span("supabase.details"):
+            all_details = get_details_for_ids(fetch_ids, with_image=True)
+        log_memory("After get_details_for_ids()")
+    return assemble_batch_candidates(matrix.pending_ids.tolist(), item_ids, shortlists, all_details)
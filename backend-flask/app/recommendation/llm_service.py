@@ -1,52 +1,119 @@
-import requests
 import json
 import os
 
+from app.http_client import apost_with_retries, astream_post, default_timeout, post_with_retries, stream_post
+from .prompt_builder import build_outfit_prompt
+
 
 OPENROUTER_API_KEY = os.getenv("OPEN_ROUTER_API_KEY")
 
 
-def ask_openrouter_for_outfit(shortlist, selected_item):
-    style_names = [cs['styles']['name'] for cs in selected_item.get('clothes_styles', [])]
-    prompt = f"You are a fashion stylist. Create a complete outfit based on:\n"
-    prompt += f"- {selected_item['name']}, color: {selected_item['colour']}, style: {', '.join(style_names)}\n\n"
-
-    prompt += "Here are the candidates:\n"
-    for category, items in shortlist.items():
-        for item in items:
-            if item['id'] == selected_item['id']:
-                continue
-            item_styles = ", ".join([cs['styles']['name'] for cs in item.get("clothes_styles", [])])
-            prompt += f"- {item['type']} (id: {item['id']}): {item['name']}, color: {item['colour']}, styles: {item_styles}\n"
-
-    
-    prompt += (
-        "\nInstructions:"
-        "\n- Pick exactly **1 item per category** from the candidates list ONLY."
-        "\n- You must return the **id** value of each chosen item (not its name)."
-        "\n- Do NOT invent or mention any items not listed in the candidates."
-        f"\n- Do NOT include the base category ('{category}') in your outfit."
-        "\n- If no perfect match, pick the closest style or color match."
-        "\n- Return the outfit as a single JSON object with keys for each category, plus two extra keys: 'style_phrase' and 'style_flair'."
-        "\n- After the outfit JSON, do NOT add explanations or commentary."
-        "\n- Example output format (must return cloth IDs integer, not names text):"
-        '\n  {"shoes": 2, "accessory": 10, "jacket": 26, "style_phrase": "formal minimalist", "style_flair": "Perfect for a laid-back lunch event."}'
-    )
-    
-    
-    print("AI prompt:", prompt)
-    response = requests.post(
-        url="https://openrouter.ai/api/v1/chat/completions",
-        headers={
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-        },
-        data=json.dumps({
-            "model": "nvidia/nemotron-nano-9b-v2:free",
-            "max_reasoning_depth": 0,
-            "messages": [{"role": "user", "content": prompt}],
-        })
-    )
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_MODEL = "nvidia/nemotron-nano-9b-v2:free"
+# Free models can take a while to answer, but a hung call must not pin a worker thread.
+# Worst case is about OPENROUTER_TIMEOUT * (OPENROUTER_RETRIES + 1) before the local ranker takes over.
+OPENROUTER_TIMEOUT = float(os.getenv("OPENROUTER_TIMEOUT", 20))
+OPENROUTER_RETRIES = int(os.getenv("OPENROUTER_RETRIES", 1))
+# Ask for a bare JSON object (response_format); set LLM_JSON_MODE=0 for models that reject it
+LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "1").lower() not in ("0", "false", "no")
+
+
+def _openrouter_request(prompt, stream=False):
+    headers = {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json",
+    }
+    payload = {
+        "model": OPENROUTER_MODEL,
+        "max_reasoning_depth": 0,
+        "messages": [{"role": "user", "content": prompt}],
+    }
+    if LLM_JSON_MODE:
+        payload["response_format"] = {"type": "json_object"}
+    if stream:
+        payload["stream"] = True
+    return headers, json.dumps(payload)
+
+
+def _outfit_prompt(shortlist, selected_item, similarities, exclude_ids=()):
+    prompt, stats = build_outfit_prompt(shortlist, selected_item, similarities, exclude_ids=exclude_ids)
+    print(f"AI prompt: ~{stats['estimated_tokens']} tokens, {stats['candidates']} candidates"
+          f" ({stats['dropped']} trimmed)", flush=True)
+    return prompt
+
+
+def ask_openrouter_for_outfit(shortlist, selected_item, similarities=None, exclude_ids=()):
+    prompt = _outfit_prompt(shortlist, selected_item, similarities, exclude_ids)
+    headers, body = _openrouter_request(prompt)
+    response = post_with_retries(OPENROUTER_URL, headers=headers, content=body,
+                                 timeout=default_timeout(read=OPENROUTER_TIMEOUT), retries=OPENROUTER_RETRIES)
+    response.raise_for_status()
     res_json = response.json()
     # print("AI response:", res_json["choices"][0]["message"]["content"])
-    return res_json["choices"][0]["message"]["content"]
\ No newline at end of file
+    return res_json["choices"][0]["message"]["content"]
+
+
+async def ask_openrouter_for_outfit_async(shortlist, selected_item, similarities=None, exclude_ids=()):
+    """ask_openrouter_for_outfit() for the ASGI routes: waits on the event loop, not a thread."""
+    prompt = _outfit_prompt(shortlist, selected_item, similarities, exclude_ids)
+    headers, body = _openrouter_request(prompt)
+    response = await apost_with_retries(OPENROUTER_URL, headers=headers, content=body,
+                                        timeout=default_timeout(read=OPENROUTER_TIMEOUT), retries=OPENROUTER_RETRIES)
+    response.raise_for_status()
+    return response.json()["choices"][0]["message"]["content"]
+
+
+def stream_openrouter_for_outfit(shortlist, selected_item, similarities=None):
+    """Same request as ask_openrouter_for_outfit(), streamed: yields content deltas as they arrive."""
+    prompt = _outfit_prompt(shortlist, selected_item, similarities)
+    headers, body = _openrouter_request(prompt, stream=True)
+    with stream_post(OPENROUTER_URL, headers=headers, content=body,
+                     timeout=default_timeout(read=OPENROUTER_TIMEOUT)) as response:
+        response.raise_for_status()
+        yield from iter_openrouter_deltas(response.iter_lines())
+
+
+async def stream_openrouter_for_outfit_async(shortlist, selected_item, similarities=None):
+    """Async generator version of stream_openrouter_for_outfit()."""
+    prompt = _outfit_prompt(shortlist, selected_item, similarities)
+    headers, body = _openrouter_request(prompt, stream=True)
+    async with astream_post(OPENROUTER_URL, headers=headers, content=body,
+                            timeout=default_timeout(read=OPENROUTER_TIMEOUT)) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            deltas = line_deltas(line)
+            if deltas is None:
+                return
+            for delta in deltas:
+                yield delta
+
+
+def line_deltas(line):
+    """
+    Content deltas in one OpenRouter SSE line ('data: {...}', keep-alive comments,
+    'data: [DONE]'); None once the stream is done.
+    """
+    if not line or not line.startswith("data:"):
+        return []  # blank separators and ': OPENROUTER PROCESSING' comments
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return None
+    try:
+        chunk = json.loads(data)
+    except json.JSONDecodeError:
+        return []
+    if chunk.get("error"):
+        raise Exception(f"OpenRouter stream error: {chunk['error']}")
+    return [
+        delta for choice in chunk.get("choices", [])
+        if (delta := (choice.get("delta") or {}).get("content"))
+    ]
+
+
+def iter_openrouter_deltas(lines):
+    """Content deltas from OpenRouter's SSE lines."""
+    for line in lines:
+        deltas = line_deltas(line)
+        if deltas is None:
+            return
+        yield from deltas
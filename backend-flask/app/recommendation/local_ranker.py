@@ -0,0 +1,133 @@
+import re
+from collections import Counter
+
+from .selection import without_picked
+
+# Score weights: embedding similarity dominates, colour and style tags refine it
+SIMILARITY_WEIGHT = 0.6
+COLOUR_WEIGHT = 0.25
+STYLE_WEIGHT = 0.15
+
+NEUTRAL = None  # hue of black/white/grey/denim/earth tones: pairs with anything
+
+# Colour words found in the free-text `colour` field -> hue in degrees (or NEUTRAL)
+COLOUR_HUES = {
+    "black": NEUTRAL, "white": NEUTRAL, "grey": NEUTRAL, "gray": NEUTRAL, "silver": NEUTRAL,
+    "charcoal": NEUTRAL, "cream": NEUTRAL, "ivory": NEUTRAL, "beige": NEUTRAL, "nude": NEUTRAL,
+    "tan": NEUTRAL, "camel": NEUTRAL, "khaki": NEUTRAL, "brown": NEUTRAL, "navy": NEUTRAL,
+    "denim": NEUTRAL, "taupe": NEUTRAL,
+    "red": 0, "burgundy": 345, "maroon": 345, "wine": 345, "pink": 330, "rose": 330,
+    "coral": 15, "orange": 30, "rust": 20, "mustard": 50, "gold": 50, "yellow": 60,
+    "olive": 80, "lime": 90, "green": 120, "mint": 150, "teal": 180, "turquoise": 175,
+    "blue": 220, "purple": 280, "lavender": 270, "lilac": 280, "violet": 270,
+}
+
+STYLE_FLAIR_TEMPLATES = (
+    "The {colour} {name} sets the tone for an easy {style} look.",
+    "Built around the {colour} {name}: {style} without trying too hard.",
+    "A {style} outfit that lets the {colour} {name} do the talking.",
+    "Pair it all with the {colour} {name} for a put-together {style} day.",
+)
+
+
+def colour_hues(colour) -> list:
+    """Known colour words in a free-text colour ('light blue / white') as hues."""
+    words = re.findall(r"[a-z]+", (colour or "").lower())
+    return [COLOUR_HUES[w] for w in words if w in COLOUR_HUES]
+
+
+def colour_harmony(colour_a, colour_b) -> float:
+    """
+    0..1 harmony between two colour fields: neutrals go with everything,
+    same/analogous hues and complements score high, other hue pairs low.
+    Unknown colours are scored as 0.5 so they neither help nor hurt much.
+    """
+    hues_a, hues_b = colour_hues(colour_a), colour_hues(colour_b)
+    if not hues_a or not hues_b:
+        return 0.5
+    best = 0.0
+    for a in hues_a:
+        for b in hues_b:
+            if a is NEUTRAL or b is NEUTRAL:
+                score = 0.8
+            else:
+                diff = abs(a - b) % 360
+                diff = min(diff, 360 - diff)
+                if diff <= 20:
+                    score = 0.9   # monochrome
+                elif diff <= 45:
+                    score = 0.8   # analogous
+                elif diff >= 150:
+                    score = 0.7   # complementary
+                elif 105 <= diff <= 135:
+                    score = 0.5   # triadic
+                else:
+                    score = 0.2
+            best = max(best, score)
+    return best
+
+
+def style_overlap(styles_a, styles_b) -> float:
+    """Jaccard overlap of two style tag lists."""
+    a = {s.lower() for s in styles_a or []}
+    b = {s.lower() for s in styles_b or []}
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def score_candidate(candidate, similarity, anchors) -> float:
+    """Weighted score of one candidate against the selected item and the items already picked."""
+    harmony = sum(colour_harmony(candidate.get("colour"), a.get("colour")) for a in anchors) / len(anchors)
+    overlap = sum(style_overlap(candidate.get("styles"), a.get("styles")) for a in anchors) / len(anchors)
+    return SIMILARITY_WEIGHT * similarity + COLOUR_WEIGHT * harmony + STYLE_WEIGHT * overlap
+
+
+def describe_outfit(selected_item, picked):
+    """Template style_phrase / style_flair from the dominant style tag and palette."""
+    items = [selected_item] + picked
+    styles = Counter(s.lower() for item in items for s in item.get("styles") or [])
+    style = styles.most_common(1)[0][0] if styles else "everyday"
+
+    hues = [h for item in items for h in colour_hues(item.get("colour"))]
+    if hues and all(h is NEUTRAL for h in hues):
+        palette = "neutral"
+    elif len({h for h in hues if h is not NEUTRAL}) == 1:
+        palette = "tonal"
+    else:
+        palette = "colour-blocked" if hues else "relaxed"
+
+    # Deterministic choice so the same outfit always reads the same
+    template = STYLE_FLAIR_TEMPLATES[sum(item["id"] for item in items) % len(STYLE_FLAIR_TEMPLATES)]
+    flair = template.format(
+        colour=(selected_item.get("colour") or "").strip().lower() or "standout",
+        name=selected_item.get("name", "piece"),
+        style=style,
+    )
+    return f"{palette} {style}", " ".join(flair.split())
+
+
+def rank_outfit(candidates_by_category, selected_item, similarities, exclude_ids=()):
+    """
+    Deterministic stand-in for the LLM: picks one item per category from the
+    shortlist by similarity + colour harmony + style overlap, greedily in
+    category order so later picks also have to suit the earlier ones.
+    exclude_ids (items of outfits already shown) are skipped where a category
+    has other candidates, so the next-best item is picked instead.
+    Returns the same shape the LLM is asked for: {category: id, style_phrase, style_flair}.
+    """
+    anchors = [selected_item]
+    picked = []
+    result = {}
+    for category in sorted(candidates_by_category):
+        candidates = without_picked(
+            [c for c in candidates_by_category[category] if c["id"] != selected_item["id"]], exclude_ids)
+        if not candidates:
+            continue
+        best = max(candidates, key=lambda c: (score_candidate(c, similarities.get(c["id"], 0.0), anchors), -c["id"]))
+        result[category] = best["id"]
+        anchors.append(best)
+        picked.append(best)
+
+    result["style_phrase"], result["style_flair"] = describe_outfit(selected_item, picked)
+    return result
@@ -55,35 +55,174 @@ from app.cloth.db_service import get_details_for_ids
 
 #     return outfit
 
-def map_ai_json_to_db_details(ai_res_json):
+OUTFIT_TEXT_KEYS = ("style_phrase", "style_flair")
+
+
+class JsonObjectExtractor:
     """
-    Map AI JSON response (category -> cloth_id) to full DB details.
-    Returns outfit dict with success, message, and items list.
+    Finds the first balanced top-level {...} in text that arrives in pieces
+    (LLM deltas), skipping markdown fences and prose around it.
+    feed() returns the object's raw text once its closing brace arrives, else None.
+    Quotes are tracked so braces inside strings don't count; single-quoted
+    strings are tracked too since repair_json_text() accepts them.
+    """
+
+    def __init__(self):
+        self._parts = []
+        self._depth = 0
+        self._quote = None
+        self._escape = False
+        self.result = None
+
+    @property
+    def done(self):
+        return self.result is not None
+
+    def feed(self, text):
+        if self.done:
+            return self.result
+        start = 0
+        for i, ch in enumerate(text):
+            if self._depth == 0:
+                if ch != "{":
+                    continue  # prose / fences before the object
+                start = i
+                self._parts = []
+            if self._quote:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == self._quote:
+                    self._quote = None
+            elif ch in "\"'":
+                self._quote = ch
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(text[start:i + 1])
+                    self.result = "".join(self._parts)
+                    return self.result
+        if self._depth > 0:
+            self._parts.append(text[start:])
+        return None
+
+
+def repair_json_text(text):
+    """
+    Best-effort fix of common LLM JSON defects: single-quoted strings become
+    double-quoted and trailing commas before } or ] are dropped.
+    """
+    out = []
+    quote = None
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            if ch == "\\" and i + 1 < len(text):
+                nxt = text[i + 1]
+                # \' is not a valid JSON escape
+                out.append(nxt if (quote == "'" and nxt == "'") else ch + nxt)
+                i += 2
+                continue
+            if ch == quote:
+                quote = None
+                out.append('"')
+            elif ch == '"':
+                out.append('\\"')  # double quote inside a single-quoted string
+            else:
+                out.append(ch)
+        elif ch in "\"'":
+            quote = ch
+            out.append('"')
+        elif ch == ",":
+            j = i + 1
+            while j < len(text) and text[j].isspace():
+                j += 1
+            if j < len(text) and text[j] in "}]":
+                i += 1
+                continue  # trailing comma
+            out.append(ch)
+        else:
+            out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+def _coerce_id(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    return None
+
+
+def parse_ai_outfit(ai_res_json, allowed_ids=None):
+    """
+    LLM answer (raw text, dict or one-element list) -> {category: int id, style_phrase, style_flair},
+    or None if no usable JSON object is found. Ids that aren't integers (or numeric
+    strings) or aren't in allowed_ids are dropped.
     """
-    # Normalize input: could be str, dict, list, or unexpected
     if isinstance(ai_res_json, str):
+        raw = JsonObjectExtractor().feed(ai_res_json)
+        if raw is None:
+            return None
         try:
-            ai_res_json = json.loads(ai_res_json)
+            ai_res_json = json.loads(raw)
         except json.JSONDecodeError:
-            return {"success": False, "message": "Invalid AI response format"}
-    
+            try:
+                ai_res_json = json.loads(repair_json_text(raw))
+            except json.JSONDecodeError:
+                return None
+
     # If AI returned a list with one object inside, extract it
     if isinstance(ai_res_json, list) and len(ai_res_json) == 1 and isinstance(ai_res_json[0], dict):
         ai_res_json = ai_res_json[0]
-    
-    # If it's not a dict at this point, we can't process it
     if not isinstance(ai_res_json, dict):
-        return {"success": False, "message": "Unexpected AI response type"}
+        return None
+
+    allowed = set(allowed_ids) if allowed_ids is not None else None
+    outfit = {}
+    for key, value in ai_res_json.items():
+        if key in OUTFIT_TEXT_KEYS:
+            outfit[key] = value if isinstance(value, str) else ""
+            continue
+        cloth_id = _coerce_id(value)
+        if cloth_id is not None and (allowed is None or cloth_id in allowed):
+            outfit[key] = cloth_id
+    return outfit
+
+
+def map_ai_json_to_db_details(ai_res_json, allowed_ids=None, items_by_id=None):
+    """
+    Map AI JSON response (category -> cloth_id) to full DB details.
+    The response may be raw model text: the first JSON object in it is used.
+    allowed_ids (the shortlist) filters out ids the model invented before any query.
+    items_by_id: already hydrated shortlist {id: item with image_url}; ids found
+    there are resolved from memory and also serve as allowed_ids when none are given.
+    Returns outfit dict with success, message, and items list.
+    """
+    if allowed_ids is None and items_by_id is not None:
+        allowed_ids = items_by_id.keys()
+    ai_res_json = parse_ai_outfit(ai_res_json, allowed_ids)
+    if ai_res_json is None:
+        return {"success": False, "message": "Invalid AI response format"}
 
     # --- Extract cloth IDs (skip style_phrase and style_flair) ---
-    valid_ids = [
-    v for k, v in ai_res_json.items()
-    if k not in ["style_phrase", "style_flair"] and isinstance(v, int)
-]
+    valid_ids = [v for k, v in ai_res_json.items() if k not in OUTFIT_TEXT_KEYS]
 
-    # --- Fetch full details from DB ---
-    db_items = get_details_for_ids(valid_ids, with_image=True)
-    db_items_map = {item["id"]: item for item in db_items}
+    # --- Resolve from the hydrated shortlist, fetch anything else from DB ---
+    items_by_id = items_by_id or {}
+    db_items_map = {i: items_by_id[i] for i in valid_ids if i in items_by_id}
+    missing_ids = [i for i in valid_ids if i not in db_items_map]
+    if missing_ids:
+        db_items_map.update({item["id"]: item for item in get_details_for_ids(missing_ids, with_image=True)})
 
     outfit = {
         "success": True,
@@ -95,7 +234,7 @@ def map_ai_json_to_db_details(ai_res_json):
 
     # --- Map AI categories to DB items ---
     for category, cloth_id in ai_res_json.items():
-        if category in ["style_phrase", "style_flair"]:
+        if category in OUTFIT_TEXT_KEYS:
             continue
         db_item = db_items_map.get(cloth_id)
         if db_item:
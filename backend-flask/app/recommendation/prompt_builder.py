@@ -0,0 +1,102 @@
+import math
+import os
+
+from .selection import without_picked
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", 700))
+MAX_FIELD_CHARS = 40  # long user-entered names/colours are cut, they add tokens but no signal
+CHARS_PER_TOKEN = 4   # rough English average for BPE tokenizers; no tokenizer dependency
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _field(value) -> str:
+    # "|" separates columns and newlines separate rows
+    text = " ".join(str(value or "").replace("|", "/").split())
+    return text[:MAX_FIELD_CHARS]
+
+
+def _styles(item) -> str:
+    return ",".join(_field(s) for s in item.get("styles") or [])
+
+
+def candidate_row(item) -> str:
+    return f"{item['id']}|{_field(item.get('name'))}|{_field(item.get('colour'))}|{_styles(item)}"
+
+
+def _trim_to_budget(shortlist, similarities, fixed_chars, budget):
+    """
+    Drop the lowest-similarity candidates until the prompt fits the token budget,
+    always keeping the best candidate of every category.
+    """
+    rows = {cat: [(item, candidate_row(item)) for item in items] for cat, items in shortlist.items()}
+    max_chars = budget * CHARS_PER_TOKEN
+    total = fixed_chars + sum(len(row) + 1 for cat_rows in rows.values() for _, row in cat_rows)
+    if total <= max_chars:
+        return rows
+
+    droppable = []
+    for cat, cat_rows in rows.items():
+        for rank, (item, row) in enumerate(cat_rows[1:], start=1):
+            # Without a similarity, shortlist order (best first) is the ranking
+            score = similarities.get(item["id"], -rank) if similarities else -rank
+            droppable.append((score, cat, item["id"], len(row) + 1))
+    droppable.sort(key=lambda d: (d[0], -d[2]))
+
+    dropped = set()
+    for _, cat, item_id, cost in droppable:
+        if total <= max_chars:
+            break
+        dropped.add(item_id)
+        total -= cost
+    rows = {cat: [(item, row) for item, row in cat_rows if item["id"] not in dropped] for cat, cat_rows in rows.items()}
+    return rows
+
+
+def build_outfit_prompt(shortlist, selected_item, similarities=None, budget=None, exclude_ids=()):
+    """
+    Compact outfit prompt: one header line per category and one
+    `id|name|colour|styles` row per candidate, trimmed to LLM_PROMPT_TOKEN_BUDGET
+    (estimated tokens) by dropping the least similar candidates first.
+    exclude_ids (items of outfits already shown) are left out of every category
+    that has other candidates, so a "different" request gets a different outfit.
+    Returns (prompt, stats) where stats has estimated tokens and candidate counts.
+    """
+    budget = PROMPT_TOKEN_BUDGET if budget is None else budget
+    shortlist = {
+        cat: without_picked([item for item in items if item["id"] != selected_item["id"]], exclude_ids)
+        for cat, items in shortlist.items()
+    }
+    shortlist = {cat: items for cat, items in shortlist.items() if items}
+    example = ",".join(f'"{cat}":<id>' for cat in shortlist)
+    example = "{" + example + (',' if example else '') + '"style_phrase":"2-4 words","style_flair":"one short sentence"}'
+
+    head = (
+        "You are a fashion stylist. Build one outfit around the selected item.\n"
+        f"Selected: {_field(selected_item.get('name'))}|{_field(selected_item.get('colour'))}|{_styles(selected_item)}"
+        f" (category: {selected_item.get('category')})\n"
+        "Candidates as id|name|colour|styles, grouped by category:\n"
+    )
+    tail = (
+        "Pick exactly 1 id per category listed above, only from these candidates; "
+        f"no other {selected_item.get('category')}. Prefer matching colours and styles.\n"
+        f"Answer with one JSON object only, integer ids: {example}"
+    )
+    fixed_chars = len(head) + len(tail) + sum(len(cat) + 3 for cat in shortlist)
+    rows = _trim_to_budget(shortlist, similarities, fixed_chars, budget)
+
+    lines = [head.rstrip("\n")]
+    for cat, cat_rows in rows.items():
+        lines.append(f"[{cat}]")
+        lines.extend(row for _, row in cat_rows)
+    lines.append(tail)
+
+    prompt = "\n".join(lines)
+    stats = {
+        "estimated_tokens": estimate_tokens(prompt),
+        "candidates": sum(len(r) for r in rows.values()),
+        "dropped": sum(len(items) for items in shortlist.values()) - sum(len(r) for r in rows.values()),
+    }
+    return prompt, stats
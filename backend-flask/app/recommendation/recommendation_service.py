@@ -1,36 +1,271 @@
 
-from .embedding_service import create_candidate_by_category
-from .llm_service import ask_openrouter_for_outfit
-from .parser import map_ai_json_to_db_details
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from .embedding_service import create_candidate_by_category, create_candidates_for_items, EmbeddingUnavailableError
+from .llm_service import ask_openrouter_for_outfit, stream_openrouter_for_outfit
+from .local_ranker import rank_outfit
+from .parser import JsonObjectExtractor, map_ai_json_to_db_details
+from .result_cache import RECOMMENDATION_CACHE, wardrobe_version
 from app.memory_logger import log_memory
+from app.tracing import span
+from app.utils import get_current_user_id
+
+# "llm": OpenRouter picks the outfit (local ranker on failure); "fast": local ranker only
+MODES = ("llm", "fast")
+# Batch endpoint: most seed items per request, and LLM calls in flight per worker
+BATCH_MAX_ITEMS = int(os.getenv("RECOMMENDATION_BATCH_MAX_ITEMS", 20))
+BATCH_LLM_CONCURRENCY = int(os.getenv("RECOMMENDATION_BATCH_LLM_CONCURRENCY", 4))
+_LLM_POOL = ThreadPoolExecutor(max_workers=BATCH_LLM_CONCURRENCY, thread_name_prefix="llm-batch")
+
+
+def recommendation_cache_key(user_id, selected_item_id:int, mode:str):
+    return (user_id, selected_item_id, wardrobe_version(user_id), mode)
 
 
-def recommend_outfit(selected_item_id:int):
+def is_cacheable(outfit, mode:str):
+    # A fallback outfit isn't cached for "llm" mode, so the next request tries the LLM again
+    return bool(outfit.get("success")) and outfit.get("source") == ("local" if mode == "fast" else "llm")
+
+
+def recommend_outfit(selected_item_id:int, different:bool=False, mode:str="llm"):
+    """
+    Cached front of the pipeline, keyed by (user, item, wardrobe version, mode).
+    different=True asks for another outfit: new alternates are computed, steered
+    away from the items already shown, until RECOMMENDATION_ALTERNATES exist,
+    then the cached ones are cycled. An alternate that repeats a cached outfit
+    isn't stored; the current outfit is shown again instead.
+    """
+    cache_key = recommendation_cache_key(get_current_user_id(), selected_item_id, mode)
+    with span("recommendation_cache"):
+        cached = RECOMMENDATION_CACHE.get(cache_key, different=different)
+    if cached is not None:
+        cached["cached"] = True
+        return cached
+
+    exclude_ids = RECOMMENDATION_CACHE.suggested_ids(cache_key) if different else set()
+    outfit = run_recommendation_pipeline(selected_item_id, mode=mode, exclude_ids=exclude_ids)
+    if is_cacheable(outfit, mode):
+        outfit = RECOMMENDATION_CACHE.add(cache_key, outfit)
+    return outfit
+
+
+def item_not_found():
+    # The selected item's row is gone (deleted since its embedding was cached)
+    return {"success": False, "message": "Selected item not found"}
+
+
+def shortlist_items(prefilter_candidates):
+    """
+    The hydrated shortlist as {id: item}: the only ids the LLM may answer with,
+    already carrying image_url, so mapping the answer needs no second query.
+    """
+    return {item["id"]: item for items in prefilter_candidates["candidates_by_category"].values() for item in items}
+
+
+def local_outfit(prefilter_candidates, exclude_ids=()):
+    """Outfit from the deterministic local ranker, mapped like an LLM answer."""
+    with span("local_ranker"):
+        ranked = rank_outfit(
+            prefilter_candidates["candidates_by_category"],
+            prefilter_candidates["selected_item"],
+            prefilter_candidates["similarities"],
+            exclude_ids,
+        )
+    with span("mapping"):
+        outfit = map_ai_json_to_db_details(ranked, items_by_id=shortlist_items(prefilter_candidates))
+    outfit["source"] = "local"
+    return outfit
+
+
+def run_recommendation_pipeline(selected_item_id:int, mode:str="llm", exclude_ids=()):
     """
     Recommendation pipeline:
     1. Get cached embeddings for all user's items
     2. Compute cosine similarity -> use huggingface api due to server memory limit
     3. Pick top-N items per category (e.g. 3 tops, 3 bottoms, etc.)
     4. Use LLM to pick one per category and generate outfit description
+       (local ranker in "fast" mode, or when the LLM times out / fails / returns junk)
     5. Map AI response to full item details for frontend
     6. Return outfit
+    exclude_ids: items of outfits already shown for this seed, skipped by the
+    LLM and the local ranker where a category has other candidates.
     """
     log_memory("Start of request")
     # Step 1 + 2 + 3: call get_all_embeddings() to get cached embeddings + perform top-N per category
-    prefilter_candidates = create_candidate_by_category(selected_item_id)
+    try:
+        prefilter_candidates = create_candidate_by_category(selected_item_id)
+    except EmbeddingUnavailableError as e:
+        return e.outfit()
     log_memory("After prefilter")
+    if prefilter_candidates["selected_item"] is None:
+        return item_not_found()
     
     # Step 4: fetch selected item details and top candidates details
     selected_item = prefilter_candidates["selected_item"]
     candidates_by_category = prefilter_candidates["candidates_by_category"]
     
     # Step 5: call LLM with prefilter_candidates + selected item
-    ai_res_json = ask_openrouter_for_outfit(candidates_by_category, selected_item)
-    log_memory("After AI response")
-    print('ai_res_json:', ai_res_json)
+    ai_res_json = None
+    if mode == "llm":
+        try:
+            with span("llm"):
+                ai_res_json = ask_openrouter_for_outfit(
+                    candidates_by_category, selected_item, prefilter_candidates["similarities"], exclude_ids)
+        except Exception as e:
+            print("⚠️ LLM unavailable, using local ranker:", e, flush=True)
+        log_memory("After AI response")
+        print('ai_res_json:', ai_res_json)
     
     # Step 6: map AI response (category -> cloth_id) to full DB details
-    outfit = map_ai_json_to_db_details(ai_res_json)
+    outfit = finish_outfit(prefilter_candidates, ai_res_json, exclude_ids)
     log_memory("After mapping AI to DB items")
     return outfit
-    
+
+
+def finish_outfit(prefilter_candidates, ai_res_json, exclude_ids=()):
+    """
+    Map the LLM answer (None if there was none) onto the shortlist, falling back
+    to the local ranker (steered away from exclude_ids); `source` says which one
+    produced the outfit.
+    """
+    if prefilter_candidates["selected_item"] is None:
+        return item_not_found()
+    outfit = {"success": False}
+    if ai_res_json:
+        with span("mapping"):
+            outfit = map_ai_json_to_db_details(ai_res_json, items_by_id=shortlist_items(prefilter_candidates))
+    if outfit.get("success"):
+        outfit["source"] = "llm"
+    else:
+        outfit = local_outfit(prefilter_candidates, exclude_ids)
+    # Items saved moments ago that couldn't be considered yet, and ones whose embedding job gave up
+    outfit["pending_ids"] = prefilter_candidates["pending_ids"]
+    outfit["failed_ids"] = prefilter_candidates["failed_ids"]
+    return outfit
+
+
+
+
+def stream_recommendation(selected_item_id:int, mode:str="llm"):
+    """
+    Staged version of recommend_outfit() for the SSE route. Yields (event, data):
+    - "shortlist": {selected_item, candidates_by_category, similarities, pending_ids, failed_ids} as soon as the prefilter is done
+    - "token": {"text"} for every LLM content delta (none in "fast" mode), until the
+      first complete JSON object has arrived; the rest of the LLM stream is not read
+    - "outfit": the final mapped outfit (same shape as the JSON endpoint)
+    - "error": {"message", "pending"? | "failed"?} if a stage fails
+    """
+    cache_key = recommendation_cache_key(get_current_user_id(), selected_item_id, mode)
+    with span("recommendation_cache"):
+        cached = RECOMMENDATION_CACHE.get(cache_key)
+    if cached is not None:
+        cached["cached"] = True
+        yield "outfit", cached
+        return
+
+    try:
+        prefilter_candidates = create_candidate_by_category(selected_item_id)
+    except EmbeddingUnavailableError as e:
+        yield "error", e.outfit()
+        return
+    if prefilter_candidates["selected_item"] is None:
+        yield "error", item_not_found()
+        return
+    yield "shortlist", prefilter_candidates
+
+    extractor = JsonObjectExtractor()
+    if mode == "llm":
+        try:
+            with span("llm"):
+                for delta in stream_openrouter_for_outfit(
+                    prefilter_candidates["candidates_by_category"], prefilter_candidates["selected_item"],
+                    prefilter_candidates["similarities"],
+                ):
+                    yield "token", {"text": delta}
+                    if extractor.feed(delta):
+                        break  # closes the upstream request, trailing prose isn't needed
+        except Exception as e:
+            print("⚠️ LLM stream failed, using local ranker:", e, flush=True)
+        print('ai_res_json:', extractor.result)
+
+    outfit = finish_outfit(prefilter_candidates, extractor.result if extractor.done else None)
+    if is_cacheable(outfit, mode):
+        RECOMMENDATION_CACHE.add(cache_key, outfit)
+    yield "outfit", outfit
+
+
+def cached_outfits(item_ids, mode:str):
+    """Batch cache lookup: ({item_id: cached outfit}, {item_id: cache key}) for every item."""
+    user_id = get_current_user_id()
+    cache_keys = {item_id: recommendation_cache_key(user_id, item_id, mode) for item_id in item_ids}
+    outfits = {}
+    with span("recommendation_cache"):
+        for item_id, cache_key in cache_keys.items():
+            cached = RECOMMENDATION_CACHE.get(cache_key)
+            if cached is not None:
+                cached["cached"] = True
+                outfits[item_id] = cached
+    return outfits, cache_keys
+
+
+def split_batch_candidates(candidates, outfits):
+    """Seeds whose shortlist failed get their error outfit; returns {item_id: candidates} of the rest."""
+    ready = {}
+    for item_id, prefilter_candidates in candidates.items():
+        if isinstance(prefilter_candidates, EmbeddingUnavailableError):
+            outfits[item_id] = prefilter_candidates.outfit()
+        elif isinstance(prefilter_candidates, Exception):
+            outfits[item_id] = {"success": False, "message": str(prefilter_candidates)}
+        elif prefilter_candidates["selected_item"] is None:
+            outfits[item_id] = item_not_found()
+        else:
+            ready[item_id] = prefilter_candidates
+    return ready
+
+
+def finish_batch(item_ids, outfits, ready, answers, cache_keys, mode:str):
+    """finish_outfit() for every shortlisted seed, then one result per item id, in order."""
+    for item_id, prefilter_candidates in ready.items():
+        outfit = finish_outfit(prefilter_candidates, answers.get(item_id))
+        if is_cacheable(outfit, mode):
+            RECOMMENDATION_CACHE.add(cache_keys[item_id], outfit)
+        outfits[item_id] = outfit
+    return [{"item_id": item_id, **outfits[item_id]} for item_id in item_ids]
+
+
+def ask_llm_for_outfits(ready):
+    """One OpenRouter call per seed on _LLM_POOL; {item_id: answer} for the calls that succeeded."""
+    futures = {
+        item_id: _LLM_POOL.submit(
+            ask_openrouter_for_outfit, c["candidates_by_category"], c["selected_item"], c["similarities"])
+        for item_id, c in ready.items()
+    }
+    answers = {}
+    for item_id, future in futures.items():
+        try:
+            answers[item_id] = future.result()
+        except Exception as e:
+            print(f"⚠️ LLM unavailable for item {item_id}, using local ranker:", e, flush=True)
+    return answers
+
+
+def recommend_outfits(item_ids, mode:str="llm"):
+    """
+    recommend_outfit() for many seed items (e.g. a week of outfits). Cached
+    outfits are reused; the rest share one embedding fetch, one similarity
+    matmul and one details query, and their LLM calls run concurrently.
+    Returns one outfit per item id, in order, each with its `item_id`; a seed
+    that can't be shortlisted gets {"success": False, "message", "pending"? | "failed"?}.
+    """
+    outfits, cache_keys = cached_outfits(item_ids, mode)
+    misses = [item_id for item_id in item_ids if item_id not in outfits]
+    ready = split_batch_candidates(create_candidates_for_items(misses), outfits) if misses else {}
+    log_memory("After batch prefilter")
+
+    answers = {}
+    if mode == "llm" and ready:
+        with span("llm"):
+            answers = ask_llm_for_outfits(ready)
+        log_memory("After AI responses")
+    return finish_batch(item_ids, outfits, ready, answers, cache_keys, mode)
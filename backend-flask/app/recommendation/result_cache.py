@@ -0,0 +1,123 @@
+import copy
+import os
+import threading
+from collections import OrderedDict
+from time import time
+
+from .embedding_service import SHARED_EMBEDDINGS
+
+# Per-user wardrobe version, bumped on every change that can alter a recommendation.
+# Kept in the shared generations file when that tier is on, so a change made in
+# one worker also retires the outfits other workers cached; else per process.
+_wardrobe_versions = {}
+_versions_lock = threading.Lock()
+
+
+def wardrobe_version(user_id) -> int:
+    shared = SHARED_EMBEDDINGS.wardrobe_version(user_id)
+    if shared is not None:
+        return shared
+    with _versions_lock:
+        return _wardrobe_versions.get(user_id, 0)
+
+
+def bump_wardrobe_version(user_id):
+    """Call after any save/delete/image change: cached outfits for the user become stale."""
+    SHARED_EMBEDDINGS.bump_wardrobe_version(user_id)
+    with _versions_lock:
+        _wardrobe_versions[user_id] = _wardrobe_versions.get(user_id, 0) + 1
+    RECOMMENDATION_CACHE.invalidate_user(user_id)
+
+
+def _outfit_ids(outfit):
+    return frozenset(item["id"] for item in outfit.get("items", []))
+
+
+class RecommendationCache:
+    """
+    Finished outfits keyed by (user, selected item, wardrobe version).
+
+    Each key keeps up to `max_alternates` outfits. A normal request returns the
+    current one; a "different" request computes new alternates until that many
+    exist, then cycles through them without calling the LLM again. An alternate
+    with the same items as a cached outfit is not stored, but counts as an
+    attempt, so a wardrobe with fewer possible outfits still starts cycling.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, max_alternates: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_alternates = max_alternates
+        self._entries = OrderedDict()  # key -> {"outfits": [...], "cursor": int, "repeats": int, "timestamp": float}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _live_entry(self, key):
+        entry = self._entries.get(key)
+        if entry and time() - entry["timestamp"] >= self.ttl:
+            del self._entries[key]
+            entry = None
+        if entry:
+            self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key, different=False):
+        """
+        Cached outfit for key, or None when the pipeline has to run
+        (miss, or `different` and fewer than max_alternates cached so far).
+        """
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is None or (different and len(entry["outfits"]) + entry["repeats"] < self.max_alternates):
+                self.misses += 1
+                return None
+            if different:
+                entry["cursor"] = (entry["cursor"] + 1) % len(entry["outfits"])
+            self.hits += 1
+            return copy.deepcopy(entry["outfits"][entry["cursor"]])
+
+    def suggested_ids(self, key) -> set:
+        """Item ids of every outfit cached for key, for the pipeline to steer away from."""
+        with self._lock:
+            entry = self._live_entry(key)
+            return set().union(*map(_outfit_ids, entry["outfits"])) if entry else set()
+
+    def add(self, key, outfit):
+        """
+        Store a freshly computed outfit as the current alternate for key and
+        return it. If a cached outfit has the same items, nothing is stored and
+        the current outfit is returned instead (marked "cached").
+        """
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is None:
+                entry = {"outfits": [], "cursor": 0, "repeats": 0, "timestamp": time()}
+                self._entries[key] = entry
+            if _outfit_ids(outfit) in map(_outfit_ids, entry["outfits"]):
+                entry["repeats"] += 1
+                current = copy.deepcopy(entry["outfits"][entry["cursor"]])
+                current["cached"] = True
+                return current
+            entry["outfits"].append(copy.deepcopy(outfit))
+            entry["outfits"] = entry["outfits"][-self.max_alternates:]
+            entry["cursor"] = len(entry["outfits"]) - 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return outfit
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == user_id]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+RECOMMENDATION_CACHE = RecommendationCache(
+    max_entries=int(os.getenv("RECOMMENDATION_CACHE_SIZE", 512)),
+    ttl=int(os.getenv("RECOMMENDATION_CACHE_TTL", 30 * 60)),  # 30 minutes
+    max_alternates=int(os.getenv("RECOMMENDATION_ALTERNATES", 3)),
+)
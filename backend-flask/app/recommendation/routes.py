@@ -1,7 +1,9 @@
-from flask import Blueprint, request, jsonify
+import json
+
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 
 from app.auth.auth_utils import token_required
-from .recommendation_service import recommend_outfit
+from .recommendation_service import BATCH_MAX_ITEMS, MODES, recommend_outfit, recommend_outfits, stream_recommendation
 
 # define the blueprint
 bp = Blueprint("recommendations", __name__)
@@ -14,11 +16,79 @@ def recommend_ai():
             selected_item_id = int(data.get("item_id"))  # <--- convert to int
     except (ValueError, TypeError):
         return jsonify({"error": "Invalid item_id"}), 400
+    mode = data.get("mode", "llm")
+    if mode not in MODES:
+        return jsonify({"error": f"Invalid mode, expected one of {list(MODES)}"}), 400
     
     try:
         outfit = recommend_outfit(
-            selected_item_id=selected_item_id)
+            selected_item_id=selected_item_id,
+            different=bool(data.get("different", False)),
+            mode=mode)
         return jsonify(outfit)
     except Exception as e:
         print("Error in /recommend_ai:", e)
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+
+def parse_item_ids(value):
+    """Distinct item ids of a batch request, in order, or None if invalid."""
+    if not isinstance(value, list) or not 0 < len(value) <= BATCH_MAX_ITEMS:
+        return None
+    try:
+        return list(dict.fromkeys(int(item_id) for item_id in value))
+    except (ValueError, TypeError):
+        return None
+
+
+# Many seed items in one call: {"item_ids": [...], "mode"?} -> {"outfits": [...]}
+@bp.route("/ai/batch", methods=["POST"])
+@token_required
+def recommend_ai_batch():
+    data = request.json or {}
+    item_ids = parse_item_ids(data.get("item_ids")) if isinstance(data, dict) else None
+    if item_ids is None:
+        return jsonify({"error": f"Invalid item_ids, expected 1 to {BATCH_MAX_ITEMS} ids"}), 400
+    mode = data.get("mode", "llm")
+    if mode not in MODES:
+        return jsonify({"error": f"Invalid mode, expected one of {list(MODES)}"}), 400
+
+    try:
+        return jsonify({"outfits": recommend_outfits(item_ids, mode=mode)})
+    except Exception as e:
+        print("Error in /recommend_ai/batch:", e)
+        return jsonify({"error": str(e)}), 500
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+# Same pipeline as /ai, streamed as Server-Sent Events:
+# shortlist -> token* -> outfit (or error), then done
+@bp.route("/ai/stream", methods=["POST"])
+@token_required
+def recommend_ai_stream():
+    data = request.json
+    try:
+        selected_item_id = int(data.get("item_id"))
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid item_id"}), 400
+    mode = data.get("mode", "llm")
+    if mode not in MODES:
+        return jsonify({"error": f"Invalid mode, expected one of {list(MODES)}"}), 400
+
+    def generate():
+        try:
+            for event, payload in stream_recommendation(selected_item_id, mode=mode):
+                yield format_sse(event, payload)
+        except Exception as e:
+            print("Error in /recommend_ai/stream:", e)
+            yield format_sse("error", {"success": False, "message": str(e)})
+        yield format_sse("done", {})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,104 @@
+import numpy as np
+
+from .embedding_matrix import CATEGORIES, CATEGORY_CODES, REMOVED_CODE
+
+# Candidate categories never paired with the selected category (besides its own)
+EXCLUDED_CATEGORIES = {
+    "dress": ("top", "bottom"),  # Rule 1: if selected is dress, exclude top and bottom
+    "top": ("dress",),  # Rule 2: if selected is top or bottom, exclude dress
+    "bottom": ("dress",),
+}
+
+
+def _build_exclusion_table():
+    """(n_codes, n_codes) bool table: [selected_code, candidate_code] -> excluded."""
+    table = np.eye(len(CATEGORIES) + 1, dtype=bool)  # never suggest the same category
+    table[:, REMOVED_CODE] = True  # rows dropped by an incremental update
+    for selected, excluded in EXCLUDED_CATEGORIES.items():
+        for candidate in excluded:
+            table[CATEGORY_CODES[selected], CATEGORY_CODES[candidate]] = True
+    return table
+
+
+EXCLUSION_TABLE = _build_exclusion_table()
+
+
+def excluded_categories(selected_category: str):
+    """Category names a candidate may not belong to, given the selected item's category."""
+    code = CATEGORY_CODES.get(selected_category, CATEGORY_CODES["unknown"])
+    return [CATEGORIES[c] for c in np.flatnonzero(EXCLUSION_TABLE[code, :REMOVED_CODE])]
+
+
+# {selected category: excluded categories}, for the pgvector RPC
+EXCLUSION_RULES = {name: excluded_categories(name) for name in CATEGORIES}
+
+
+def candidate_mask(codes, selected_row: int):
+    """Rows allowed as candidates for the item at `selected_row`."""
+    mask = ~EXCLUSION_TABLE[codes[selected_row]][codes]
+    mask[selected_row] = False
+    return mask
+
+
+def top_n_per_category(scores, codes, mask, n: int):
+    """
+    Pick the `n` best-scoring masked rows within each category code.
+    Returns {code: row indices sorted by descending score}; only codes that
+    have at least one candidate appear.
+    """
+    result = {}
+    if n <= 0:
+        return result
+    for code in np.flatnonzero(np.bincount(codes[mask], minlength=len(CATEGORIES))):
+        rows = np.flatnonzero(mask & (codes == code))
+        group = scores[rows]
+        if rows.size > n:
+            keep = np.argpartition(-group, n - 1)[:n]
+            rows, group = rows[keep], group[keep]
+        result[int(code)] = rows[np.argsort(-group, kind="stable")]
+    return result
+
+
+def candidate_masks(codes, selected_rows):
+    """(N, S) candidate_mask() of every selected row at once."""
+    selected_rows = np.asarray(selected_rows, dtype=np.int64)
+    masks = ~EXCLUSION_TABLE[codes[selected_rows]][:, codes].T
+    masks[selected_rows, np.arange(len(selected_rows))] = False
+    return masks
+
+
+def top_n_per_category_many(scores, codes, masks, n: int):
+    """
+    top_n_per_category() for S seeds at once, from (N, S) scores and masks:
+    one argpartition per category code over all seed columns.
+    Returns one {code: row indices sorted by descending score} per seed.
+    """
+    results = [{} for _ in range(scores.shape[1])]
+    if n <= 0:
+        return results
+    for code in np.flatnonzero(np.bincount(codes, minlength=len(CATEGORIES))[:REMOVED_CODE]):
+        rows = np.flatnonzero(codes == code)
+        valid = masks[rows]
+        counts = valid.sum(axis=0)
+        if not counts.any():
+            continue
+        group = np.where(valid, scores[rows], -np.inf)
+        k = min(n, rows.size)
+        if rows.size > k:
+            keep = np.argpartition(-group, k - 1, axis=0)[:k]
+        else:
+            keep = np.broadcast_to(np.arange(rows.size)[:, None], group.shape)
+        order = np.argsort(-np.take_along_axis(group, keep, axis=0), axis=0, kind="stable")
+        top = rows[np.take_along_axis(keep, order, axis=0)]  # (k, S), masked rows sort last
+        for seed in np.flatnonzero(counts):
+            results[seed][int(code)] = top[:min(k, counts[seed]), seed]
+    return results
+
+
+def without_picked(items, picked_ids):
+    """
+    Shortlist items not in picked_ids (ids already shown in an earlier outfit),
+    or all of them when every one was: a category is never left empty.
+    """
+    fresh = [item for item in items if item["id"] not in picked_ids]
+    return fresh or items
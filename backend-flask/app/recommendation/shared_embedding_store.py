@@ -0,0 +1,280 @@
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import threading
+from time import time
+
+import numpy as np
+
+from .embedding_matrix import EmbeddingMatrix, embedding_precision
+
+# Directory on a tmpfs shared by every gunicorn worker; "off" (or empty) disables the tier
+DEFAULT_DIR = "/dev/shm/ootd-embed-cache" if os.path.isdir("/dev/shm") else ""
+SHARED_DIR = os.getenv("SHARED_EMBED_CACHE_DIR", DEFAULT_DIR)
+if SHARED_DIR.lower() in ("off", "0", "false", "no"):
+    SHARED_DIR = ""
+SHARED_MAX_BYTES = int(os.getenv("SHARED_EMBED_CACHE_MAX_BYTES", 256 * 1024 * 1024))  # 256 MB
+GENERATION_SLOTS = 4096  # users hash into slots; a collision only costs an extra refetch
+# The generations file holds one block of embedding generations, then one of wardrobe versions
+_COUNTER_BLOCKS = 2
+
+_MAGIC = b"OOTDEMB1"
+_HEADER_BYTES = 4096  # magic, length and JSON header, zero padded; arrays start after it
+_ALIGN = 64
+_ARRAYS = ("ids", "codes", "vectors", "scales", "id_order", "pending_ids")
+
+
+def _align(n):
+    return -(-n // _ALIGN) * _ALIGN
+
+
+def _user_key(user_id):
+    digest = hashlib.blake2b(str(user_id).encode("utf-8"), digest_size=8).digest()
+    return digest.hex(), int.from_bytes(digest, "little") % GENERATION_SLOTS
+
+
+class SharedEmbeddingStore:
+    """
+    Cross-worker tier under EMBED_CACHE: one file per user on a tmpfs holding the
+    normalized EmbeddingMatrix arrays, which every worker maps read-only and
+    wraps as NumPy views (no copy, no per-worker decode).
+
+    Invalidation uses a small shared `generations` file, one uint64 counter per
+    slot (plus a second block of per-slot wardrobe versions for the outfit cache). A writer captures the user's generation before it fetches from
+    Supabase and stores it in the file header; readers only accept a file whose
+    generation still matches, so a matrix built from data fetched before an
+    invalidation is never served. Files are replaced atomically (rename), and a
+    worker still holding an older mapping keeps a valid view until it drops it.
+    """
+
+    def __init__(self, directory, max_bytes=SHARED_MAX_BYTES, ttl=60 * 60):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._state = None  # (pid, lock fd, generations view, versions view), reopened after a fork
+        self._open_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    # --- generations ---
+    def _generations(self):
+        state = self._state
+        if state is not None and state[0] == os.getpid():
+            return state
+        with self._open_lock:
+            if self._state is None or self._state[0] != os.getpid():
+                self._state = self._open()
+            return self._state
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        lock_fd = os.open(os.path.join(self.directory, "lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        path = os.path.join(self.directory, "generations")
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size < _COUNTER_BLOCKS * GENERATION_SLOTS * 8:
+                    os.ftruncate(fd, _COUNTER_BLOCKS * GENERATION_SLOTS * 8)  # zero-filled
+            finally:
+                fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            counters = np.frombuffer(mmap.mmap(fd, _COUNTER_BLOCKS * GENERATION_SLOTS * 8), dtype=np.uint64)
+        finally:
+            os.close(fd)
+        return os.getpid(), lock_fd, counters[:GENERATION_SLOTS], counters[GENERATION_SLOTS:]
+
+    def generation(self, user_id):
+        """Current generation of the user's slot (None when the tier is off)."""
+        if not self.enabled:
+            return None
+        try:
+            _, _, generations, _ = self._generations()
+        except OSError as e:
+            self._disable(e)
+            return None
+        return int(generations[_user_key(user_id)[1]])
+
+    def invalidate(self, user_id, expected=None):
+        """
+        Bump the user's generation: every worker's copy becomes stale at once.
+        With `expected`, returns the new generation if the slot was still at
+        `expected` (nobody else changed the user in between), else None.
+        """
+        if not self.enabled:
+            return None
+        key, slot = _user_key(user_id)
+        bumped = None
+        try:
+            _, lock_fd, generations, _ = self._generations()
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            try:
+                if expected is not None and int(generations[slot]) == expected:
+                    bumped = expected + 1
+                generations[slot] += 1
+            finally:
+                fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self._disable(e)
+            return None
+        return bumped
+
+    # --- wardrobe versions ---
+    def wardrobe_version(self, user_id):
+        """Shared version of the user's wardrobe for the outfit cache (None when the tier is off)."""
+        if not self.enabled:
+            return None
+        try:
+            _, _, _, versions = self._generations()
+        except OSError as e:
+            self._disable(e)
+            return None
+        return int(versions[_user_key(user_id)[1]])
+
+    def bump_wardrobe_version(self, user_id):
+        """Any save/delete/image change: outfits cached by every worker become stale."""
+        if not self.enabled:
+            return
+        try:
+            _, lock_fd, _, versions = self._generations()
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            try:
+                versions[_user_key(user_id)[1]] += 1
+            finally:
+                fcntl.flock(lock_fd, fcntl.LOCK_UN)
+        except OSError as e:
+            self._disable(e)
+
+    # --- matrices ---
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.emb")
+
+    def get(self, user_id, generation):
+        """The user's matrix as read-only views into shared memory, or None."""
+        if not self.enabled or generation is None:
+            return None
+        key, _ = _user_key(user_id)
+        try:
+            with open(self._path(key), "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):  # ValueError: empty file mid-write
+            self.misses += 1
+            return None
+
+        try:
+            if buffer[:len(_MAGIC)] != _MAGIC:
+                raise ValueError("bad magic")
+            header_len = int.from_bytes(buffer[len(_MAGIC):len(_MAGIC) + 4], "little")
+            header = json.loads(buffer[len(_MAGIC) + 4:len(_MAGIC) + 4 + header_len])
+        except ValueError:
+            header = None
+        # Survives restarts, so a copy written at another EMBEDDING_PRECISION is ignored too
+        if (header is None or header["user_id"] != str(user_id) or header["generation"] != generation
+                or header["precision"] != embedding_precision() or time() - header["created"] >= self.ttl):
+            self.misses += 1
+            return None
+
+        arrays = {}
+        for name, (offset, dtype, shape) in header["arrays"].items():
+            count = int(np.prod(shape))
+            # An empty trailing array may start past the end of the file
+            array = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset) if count else np.empty(0, dtype=dtype)
+            arrays[name] = array.reshape(shape)
+        self.hits += 1
+        matrix = EmbeddingMatrix(
+            ids=arrays["ids"], codes=arrays["codes"], vectors=arrays["vectors"], scales=arrays.get("scales"),
+            precision=header["precision"], pending_ids=arrays["pending_ids"], id_order=arrays["id_order"],
+        )
+        matrix.watermark = header.get("watermark")
+        matrix.synced_at = header.get("synced_at", header["created"])
+        return matrix
+
+    def put(self, user_id, matrix, generation):
+        """
+        Write the matrix unless the user was invalidated since `generation` was read.
+        Returns the shared (view-backed) matrix, or None if it wasn't stored.
+        """
+        if not self.enabled or generation is None or self.generation(user_id) != generation:
+            return None
+        key, _ = _user_key(user_id)
+        arrays = {name: getattr(matrix, name) for name in _ARRAYS if getattr(matrix, name) is not None}
+
+        layout, offset = {}, _HEADER_BYTES
+        for name, array in arrays.items():
+            layout[name] = [offset, array.dtype.str, list(array.shape)]
+            offset = _align(offset + array.nbytes)
+        header = json.dumps({
+            "user_id": str(user_id), "generation": generation, "created": time(),
+            "precision": matrix.precision, "arrays": layout,
+            "watermark": matrix.watermark, "synced_at": matrix.synced_at,
+        }).encode("utf-8")
+        if len(_MAGIC) + 4 + len(header) > _HEADER_BYTES:
+            return None
+
+        tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(_MAGIC + len(header).to_bytes(4, "little") + header)
+                for name, array in arrays.items():
+                    f.seek(layout[name][0])
+                    f.write(np.ascontiguousarray(array).data)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"⚠️ Shared embedding cache write failed: {e}", flush=True)
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return None
+        self.writes += 1
+        self._evict()
+        return self.get(user_id, generation)
+
+    def _evict(self):
+        """Drop the oldest files while the store is over its byte budget."""
+        try:
+            files = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".emb")]
+        except OSError:
+            return
+        stats = []
+        for entry in files:
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # removed by another worker since the scan
+            stats.append((stat.st_mtime, stat.st_size, entry.path))
+        stats.sort()
+        total = sum(size for _, size, _ in stats)
+        for _, size, path in stats:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            total -= size
+
+    def _disable(self, error):
+        print(f"⚠️ Shared embedding cache disabled ({self.directory}): {error}", flush=True)
+        self.directory = ""
+
+    def stats(self) -> dict:
+        entries, total = 0, 0
+        if self.enabled:
+            try:
+                for entry in os.scandir(self.directory):
+                    if entry.name.endswith(".emb"):
+                        entries += 1
+                        total += entry.stat().st_size
+            except OSError:
+                pass
+        return {"entries": entries, "bytes": total, "hits": self.hits, "misses": self.misses, "writes": self.writes}
@@ -0,0 +1,185 @@
+import os
+import threading
+from bisect import bisect_left
+from contextlib import nullcontext
+from contextvars import ContextVar
+from time import perf_counter
+
+from flask import Response, g, has_request_context, request
+
+from app.auth.auth_utils import admin_required
+
+# TRACING_ENABLED=0 turns span() into a shared no-op context manager
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1").lower() not in ("0", "false", "no")
+# Also print one per-request stage breakdown line (TRACE_LOG=0 to silence)
+TRACE_LOG = os.getenv("TRACE_LOG", "1").lower() not in ("0", "false", "no")
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # seconds
+METRIC_PREFIX = "ootd"
+
+_NOOP = nullcontext()
+# Route and stage totals of an ASGI request, which has no Flask request context
+_ASYNC_ROUTE = ContextVar("trace_route", default=None)
+_ASYNC_STAGES = ContextVar("trace_stages", default=None)
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Per (route, stage) latency histograms and per (route, status) request counts."""
+
+    def __init__(self):
+        self._histograms = {}
+        self._requests = {}
+        self._lock = threading.Lock()
+
+    def observe(self, route, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.get((route, stage))
+            if histogram is None:
+                histogram = self._histograms[(route, stage)] = Histogram()
+            histogram.observe(seconds)
+
+    def count_request(self, route, status):
+        with self._lock:
+            self._requests[(route, status)] = self._requests.get((route, status), 0) + 1
+
+    def render(self, gauges=None, counters=None):
+        """
+        Prometheus text exposition format. gauges / counters: {metric name: number}
+        appended as-is; counter names get the `_total` suffix.
+        """
+        name = f"{METRIC_PREFIX}_stage_duration_seconds"
+        lines = [f"# HELP {name} Time spent per pipeline stage, by route.", f"# TYPE {name} histogram"]
+        with self._lock:
+            for (route, stage), h in sorted(self._histograms.items()):
+                labels = f'route="{route}",stage="{stage}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), h.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{labels}}} {h.total:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {h.count}")
+
+            name = f"{METRIC_PREFIX}_requests_total"
+            lines += [f"# HELP {name} Finished requests, by route and status.", f"# TYPE {name} counter"]
+            for (route, status), count in sorted(self._requests.items()):
+                lines.append(f'{name}{{route="{route}",status="{status}"}} {count}')
+
+        for metric, value in (gauges or {}).items():
+            lines.append(f"# TYPE {METRIC_PREFIX}_{metric} gauge")
+            lines.append(f"{METRIC_PREFIX}_{metric} {value}")
+        for metric, value in (counters or {}).items():
+            lines.append(f"# TYPE {METRIC_PREFIX}_{metric}_total counter")
+            lines.append(f"{METRIC_PREFIX}_{metric}_total {value}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+
+def current_route():
+    if has_request_context():
+        return request.endpoint or "unknown"
+    return _ASYNC_ROUTE.get() or "background"  # embedding jobs, startup
+
+
+class _Span:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = perf_counter() - self.started
+        METRICS.observe(current_route(), self.stage, elapsed)
+        if has_request_context():
+            stages = g.setdefault("trace_stages", {})
+        else:
+            stages = _ASYNC_STAGES.get()
+        if stages is not None:
+            stages[self.stage] = stages.get(self.stage, 0.0) + elapsed
+        return False
+
+
+def span(stage):
+    """`with span("llm"): ...` times a stage into the current route's histogram."""
+    if not TRACING_ENABLED:
+        return _NOOP
+    return _Span(stage)
+
+
+def record_request(route, status, elapsed, stages):
+    """Stage "request", the status count and the per-request log line."""
+    METRICS.observe(route, "request", elapsed)
+    METRICS.count_request(route, status)
+    if TRACE_LOG and stages:
+        parts = " | ".join(f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in stages.items())
+        print(f"⏱️ {route}: {parts} | total {elapsed * 1000:.1f}ms", flush=True)
+
+
+def start_async_request(route):
+    """Label spans of the current ASGI request with `route`; returns the tokens for finish_async_request()."""
+    return _ASYNC_ROUTE.set(route), _ASYNC_STAGES.set({}), perf_counter()
+
+
+def finish_async_request(tokens, status):
+    route_token, stages_token, started = tokens
+    if TRACING_ENABLED:
+        record_request(_ASYNC_ROUTE.get(), status, perf_counter() - started, _ASYNC_STAGES.get())
+    _ASYNC_ROUTE.reset(route_token)
+    _ASYNC_STAGES.reset(stages_token)
+
+
+def init_app(app, runtime=None):
+    """
+    Whole-request timing per route (stage "request") and GET /metrics
+    (X-Admin-Token header must match ADMIN_TOKEN; 404 when unset).
+    runtime: callable returning (gauges, counters), each {metric name: number}
+    (cache sizes and queue depth; cache hits and misses, ...).
+    """
+
+    @app.route("/metrics")
+    @admin_required
+    def metrics():
+        gauges, counters = runtime() if runtime else (None, None)
+        return Response(METRICS.render(gauges, counters), mimetype="text/plain; version=0.0.4")
+
+    if not TRACING_ENABLED:
+        return
+
+    @app.before_request
+    def start_request_timer():
+        g.trace_started = perf_counter()
+
+    @app.teardown_request
+    def record_flask_request(exc):
+        if g.pop("trace_streamed", False):
+            return  # stream_with_context tears down again once the body has been sent
+        started = g.pop("trace_started", None)
+        if started is None or request.endpoint in (None, "metrics", "health"):
+            return
+        status = 500 if exc else getattr(g, "trace_status", 200)
+        record_request(request.endpoint, status, perf_counter() - started, g.pop("trace_stages", None))
+
+    @app.after_request
+    def remember_status(response):
+        g.trace_status = response.status_code
+        g.trace_streamed = response.is_streamed
+        return response
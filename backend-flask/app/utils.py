@@ -1,105 +1,64 @@
 
-import requests
-import os
-import time
-from flask import g
+from contextvars import ContextVar
+
+from flask import g, has_app_context
+from app.embedding_provider import get_embedding_provider
+from app.embedding_memo import EMBEDDING_MEMO, normalize_embedding_text
+from app.tracing import span
+
+# Set by the async routes, which have no Flask request context
+CURRENT_USER_ID = ContextVar("current_user_id", default=None)
+
 
 # Helper to get current user_id from token (set in g.user_id by token_required)
 def get_current_user_id():
-    return getattr(g, "user_id", None)
+    if has_app_context():
+        user_id = getattr(g, "user_id", None)
+        if user_id is not None:
+            return user_id
+    return CURRENT_USER_ID.get()
 
 
 
 def generate_embedding(embedding_text):
     """
-    Generate 384-dimensional embedding using Hugging Face Inference API (FREE).
+    Generate a 384-dimensional all-MiniLM-L6-v2 embedding with the configured
+    provider (EMBEDDING_PROVIDER: Hugging Face Inference API by default, or local ONNX).
+    Texts seen before (after normalization) are served from EMBEDDING_MEMO.
     Returns a list of floats.
     """
-    HF_API_KEY = os.getenv("HUGGING_FACE_API_KEY")
-    if not HF_API_KEY:
-        raise ValueError("HUGGING_FACE_API_KEY not set in environment")
-    
-    # Correct endpoint for feature extraction (embeddings)
-    API_URL = "https://router.huggingface.co/hf-inference/models/sentence-transformers/all-MiniLM-L6-v2/pipeline/feature-extraction"
+    return generate_embeddings([embedding_text])[0]
+
+
+def cached_embedding(embedding_text):
+    """Memoized embedding for this text with the current provider, or None (never calls the model)."""
+    provider = get_embedding_provider()
+    return EMBEDDING_MEMO.get_many([embedding_text], f"{provider.name}:{provider.model_id}")[0]
+
+
+def generate_embeddings(embedding_texts):
+    """Batched generate_embedding(): one provider call for every text not memoized yet, same order."""
+    if not embedding_texts:
+        return []
+    provider = get_embedding_provider()
+    model_id = f"{provider.name}:{provider.model_id}"
+
+    embeddings = EMBEDDING_MEMO.get_many(embedding_texts, model_id)
+    # One provider input per distinct normalized text
+    missing = {}
+    for text, embedding in zip(embedding_texts, embeddings):
+        if embedding is None:
+            missing.setdefault(normalize_embedding_text(text), text)
+    if missing:
+        texts = list(missing.values())
+        with span("embedding_provider"):
+            vectors = provider.embed(texts)
+        EMBEDDING_MEMO.put_many(texts, model_id, vectors)
+        generated = dict(zip(missing, vectors))
+        embeddings = [
+            e if e is not None else generated[normalize_embedding_text(t)]
+            for t, e in zip(embedding_texts, embeddings)
+        ]
 
-    
-    headers = {
-        "Authorization": f"Bearer {HF_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
-        "inputs": embedding_text,
-        "options": {
-            "wait_for_model": True  # Wait if model is loading (cold start)
-        }
-    }
-    
-    
-    
-    max_retries = 3
-    retry_delay = 2  # seconds
-    
-    for attempt in range(max_retries):
-        try:
-            response = requests.post(
-                API_URL,
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
-            
-            # Check for rate limiting or model loading
-            if response.status_code == 503:
-                error_data = response.json()
-                if "loading" in str(error_data).lower():
-                    wait_time = error_data.get("estimated_time", 20)
-                    time.sleep(wait_time)
-                    continue
-            
-            response.raise_for_status()
-            
-            # Parse response
-            result = response.json()
-            # HF returns different formats, handle both:
-            if isinstance(result, list):
-                # Format 1: [[embedding]] (nested list)
-                if len(result) > 0 and isinstance(result[0], list):
-                    embedding = result[0]  # Extract from nested list
-                # Format 2: [embedding] (flat list)
-                elif len(result) > 0 and isinstance(result[0], (int, float)):
-                    embedding = result  # Already flat
-                else:
-                    raise ValueError(f"Unexpected response format: {result[:2]}...")
-            else:
-                raise ValueError(f"Response is not a list: {type(result)}")
-            
-            # Verify dimensions (all-MiniLM-L6-v2 = 384 dims)
-            if len(embedding) != 384:
-                raise ValueError(f"Expected 384 dimensions, got {len(embedding)}")
-            
-            print(f"✅ Embedding generated: {len(embedding)} dimensions", flush=True)
-            return embedding
-            
-        except requests.exceptions.Timeout:
-            print(f"⚠️ Request timeout (attempt {attempt + 1}/{max_retries})", flush=True)
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
-            else:
-                raise Exception("HF API timeout after multiple retries")
-                
-        except requests.exceptions.HTTPError as e:
-            print(f"❌ HTTP error: {e.response.status_code} - {e.response.text}", flush=True)
-            if attempt < max_retries - 1 and e.response.status_code in [503, 429]:
-                time.sleep(retry_delay * (attempt + 1))  # Exponential backoff
-            else:
-                raise
-                
-        except Exception as e:
-            print(f"❌ Unexpected error: {str(e)}", flush=True)
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
-            else:
-                raise
-    
-    raise Exception("Failed to generate embedding after all retries")
\ No newline at end of file
+    print(f"✅ {len(embeddings)} embeddings ({len(missing)} generated by {provider.name})", flush=True)
+    return embeddings
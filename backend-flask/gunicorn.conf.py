@@ -1,9 +1,15 @@
 import os
 
 # Worker configuration
+# (workers share users' embedding matrices and wardrobe versions through SHARED_EMBED_CACHE_DIR
+# on /dev/shm; keep that tier on when raising workers, or cached outfits go stale across them)
 workers = 1
 threads = 2
 worker_class = 'gthread'
+# SERVER_MODE=asgi: one event loop serves the async routes, Flask routes get `threads` threads
+if os.getenv("SERVER_MODE", "wsgi").lower() == "asgi":
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    os.environ.setdefault("WSGI_THREADS", str(threads))
 
 # Timeouts
 timeout = 300
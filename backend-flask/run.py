@@ -1,9 +1,20 @@
 import os
 from app import create_app
 
-app = create_app()
+# SERVER_MODE=asgi serves the I/O-bound routes as coroutines (see app/asgi.py)
+SERVER_MODE = os.environ.get("SERVER_MODE", "wsgi").lower()
+
+if SERVER_MODE == "asgi":
+    from app.asgi import create_asgi_app
+    app = create_asgi_app()
+else:
+    app = create_app()
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 10000))  # ✅ Changed to 10000 (Render's default)
     debug_mode = os.environ.get("FLASK_ENV") != "production"  # ✅ Only debug in dev
-    app.run(host="0.0.0.0", port=port, debug=debug_mode)
\ No newline at end of file
+    if SERVER_MODE == "asgi":
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=port, lifespan="on")
+    else:
+        app.run(host="0.0.0.0", port=port, debug=debug_mode)
@@ -0,0 +1,45 @@
+"""
+Fill clothes.embedding_b64 for rows saved before the binary column existed.
+
+    python scripts/backfill_embedding_b64.py [--batch 200]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app import create_app  # noqa: E402
+from app.cloth.db_service import get_supabase  # noqa: E402
+from app.embedding_codec import decode_embedding_rows, encode_embedding_b64  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=int, default=200)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        supabase = get_supabase()
+        total = 0
+        while True:
+            rows = (
+                supabase.table("clothes")
+                .select("id, embedding")
+                .is_("embedding_b64", None)
+                .not_.is_("embedding", None)
+                .limit(args.batch)
+                .execute()
+            ).data or []
+            if not rows:
+                break
+            matrix = decode_embedding_rows(rows)
+            for row, vector in zip(rows, matrix):
+                supabase.table("clothes").update({"embedding_b64": encode_embedding_b64(vector)}).eq("id", row["id"]).execute()
+            total += len(rows)
+            print(f"Backfilled {total} rows", flush=True)
+
+
+if __name__ == "__main__":
+    main()
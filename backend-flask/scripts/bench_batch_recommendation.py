@@ -0,0 +1,55 @@
+"""
+Similarity stage of the batch endpoint: one shortlist_from_matrix() per seed
+item (what calling /ai once per item did) versus shortlist_many_from_matrix(),
+one (N, S) matmul and one top-N pass per category for all seeds. The batch
+also needs one details query instead of one per seed.
+
+    python scripts/bench_batch_recommendation.py --items 500 2000 10000 --seeds 7 20
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.embedding_codec import EMBEDDING_DIM  # noqa: E402
+from app.recommendation.embedding_matrix import EmbeddingMatrix  # noqa: E402
+from app.recommendation.embedding_service import shortlist_from_matrix, shortlist_many_from_matrix  # noqa: E402
+
+CATEGORIES = ["top", "bottom", "shoes", "outerwear", "accessory", "dress"]
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, nargs="+", default=[500, 2000, 10000])
+    parser.add_argument("--seeds", type=int, nargs="+", default=[7, 20])
+    parser.add_argument("--precision", default="float32", choices=["float32", "float16", "int8"])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f"{'items':>6} {'seeds':>6} {'per-item ms':>12} {'batch ms':>9} {'speedup':>8}")
+    for n in args.items:
+        matrix = EmbeddingMatrix.from_embeddings(
+            list(range(1, n + 1)), [CATEGORIES[i % len(CATEGORIES)] for i in range(n)],
+            rng.standard_normal((n, EMBEDDING_DIM)).astype(np.float32), precision=args.precision,
+        )
+        for s in args.seeds:
+            seeds = [int(i) for i in rng.choice(np.arange(1, n + 1), size=s, replace=False)]
+            loop_ms = timed(lambda: [shortlist_from_matrix(matrix, item_id) for item_id in seeds], args.repeat)
+            batch_ms = timed(lambda: shortlist_many_from_matrix(matrix, seeds), args.repeat)
+            print(f"{n:>6} {s:>6} {loop_ms:>12.2f} {batch_ms:>9.2f} {loop_ms / batch_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
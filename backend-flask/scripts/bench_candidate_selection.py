@@ -0,0 +1,79 @@
+"""
+Candidate selection latency vs wardrobe size: the previous list/dict/sort
+implementation against the NumPy mask + argpartition engine.
+
+    python scripts/bench_candidate_selection.py
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.embedding_codec import EMBEDDING_DIM  # noqa: E402
+from app.recommendation.embedding_matrix import CATEGORIES, EmbeddingMatrix  # noqa: E402
+from app.recommendation.selection import candidate_mask, top_n_per_category  # noqa: E402
+
+TOP_N = 3
+
+
+def select_old(ids, categories, norms, selected_item_id):
+    # Previous implementation (minus the DB call), kept as the baseline
+    selected_idx = ids.index(selected_item_id)
+    selected_vec = norms[selected_idx]
+    selected_cat = categories[selected_idx]
+
+    def should_exclude_category(selected_category, candidate_category):
+        if selected_category == 'dress' and candidate_category in ['top', 'bottom']:
+            return True
+        if selected_category in ['top', 'bottom'] and candidate_category == 'dress':
+            return True
+        return False
+
+    candidate_indices = [
+        i for i in range(len(ids))
+        if ids[i] != selected_item_id
+        and categories[i] != selected_cat
+        and not should_exclude_category(selected_cat, categories[i])
+    ]
+    sims = np.dot(norms[candidate_indices], selected_vec)
+    grouped = {}
+    for i, idx in enumerate(candidate_indices):
+        grouped.setdefault(categories[idx], []).append({"id": ids[idx], "sim": sims[i]})
+    return {
+        cat: [x["id"] for x in sorted(items, key=lambda x: x["sim"], reverse=True)[:TOP_N]]
+        for cat, items in grouped.items()
+    }
+
+
+def select_new(matrix, selected_item_id):
+    row = matrix.row_of(selected_item_id)
+    sims = matrix.scores(matrix.vector(row))
+    top = top_n_per_category(sims, matrix.codes, candidate_mask(matrix.codes, row), TOP_N)
+    return {CATEGORIES[code]: matrix.ids[rows].tolist() for code, rows in top.items()}
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'items':>7}{'old ms':>10}{'new ms':>10}")
+    for n in (100, 500, 1000, 5000, 20000):
+        embeddings = rng.standard_normal((n, EMBEDDING_DIM)).astype(np.float32)
+        ids = list(range(1, n + 1))
+        categories = [CATEGORIES[i] for i in rng.integers(0, len(CATEGORIES) - 1, n)]
+        matrix = EmbeddingMatrix.from_embeddings(ids, categories, embeddings, precision="float32")
+        norms = matrix.vectors
+        selected = ids[n // 2]
+
+        old = select_old(ids, categories, norms, selected)
+        new = select_new(matrix, selected)
+        assert {k: set(v) for k, v in old.items()} == {k: set(v) for k, v in new.items()}
+
+        t_old = min(timeit.repeat(lambda: select_old(ids, categories, norms, selected), number=1, repeat=20)) * 1000
+        t_new = min(timeit.repeat(lambda: select_new(matrix, selected), number=1, repeat=20)) * 1000
+        print(f"{n:>7}{t_old:>10.2f}{t_new:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Micro-benchmark for decoding a user's embeddings on a cold cache.
+
+Compares the previous per-row `ast.literal_eval` path with the vectorized
+pgvector-text parser and the base64 binary column.
+
+    python scripts/bench_embedding_codec.py --items 300 --repeat 20
+"""
+import argparse
+import ast
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.embedding_codec import EMBEDDING_DIM, decode_embedding_rows, encode_embedding_b64  # noqa: E402
+
+
+def make_rows(n):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((n, EMBEDDING_DIM)).astype(np.float32)
+    # pgvector renders float4 values with up to 9 significant digits
+    text_rows = [
+        {"id": i, "category": "top", "embedding": "[" + ",".join(f"{x:.9g}" for x in v) + "]"}
+        for i, v in enumerate(vectors)
+    ]
+    b64_rows = [{"id": i, "category": "top", "embedding_b64": encode_embedding_b64(v)} for i, v in enumerate(vectors)]
+    return vectors, text_rows, b64_rows
+
+
+def decode_literal_eval(rows):
+    # The original implementation, kept here as the baseline
+    embeddings_list = [np.array(ast.literal_eval(row["embedding"]), dtype=np.float32) for row in rows]
+    return np.stack(embeddings_list, axis=0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    vectors, text_rows, b64_rows = make_rows(args.items)
+
+    assert np.allclose(decode_literal_eval(text_rows), vectors)
+    assert np.allclose(decode_embedding_rows(text_rows), vectors)
+    assert np.array_equal(decode_embedding_rows(b64_rows), vectors)
+
+    text_bytes = sum(len(r["embedding"]) for r in text_rows)
+    b64_bytes = sum(len(r["embedding_b64"]) for r in b64_rows)
+    print(f"{args.items} items x {EMBEDDING_DIM} dims")
+    print(f"payload: text {text_bytes / 1024:.0f} KiB, base64 {b64_bytes / 1024:.0f} KiB")
+
+    cases = [
+        ("ast.literal_eval (old)", lambda: decode_literal_eval(text_rows)),
+        ("vectorized text", lambda: decode_embedding_rows(text_rows)),
+        ("base64 binary", lambda: decode_embedding_rows(b64_rows)),
+    ]
+    baseline = None
+    for label, fn in cases:
+        best = min(timeit.repeat(fn, number=1, repeat=args.repeat)) * 1000
+        baseline = baseline or best
+        print(f"{label:<24} {best:8.2f} ms  ({baseline / best:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+TTL refresh of one user's embedding cache: a full refetch (every row's
+embedding as JSON, decoded into a new matrix) versus EMBEDDING_SYNC=delta
+(only rows changed since the watermark, merged into the cached matrix).
+
+Payload sizes are the JSON bodies PostgREST would return; times are the
+decode/merge work on this machine (network time not included).
+
+    python scripts/bench_embedding_delta_sync.py --items 500 2000 --changed 0 5 50
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.embedding_codec import EMBEDDING_DIM, decode_embedding_rows, format_vector_text  # noqa: E402
+from app.recommendation.embedding_matrix import EmbeddingMatrix  # noqa: E402
+from app.recommendation.embedding_service import merge_embedding_changes  # noqa: E402
+
+CATEGORIES = ["top", "bottom", "shoes", "outerwear", "accessory"]
+
+
+def make_rows(ids, rng):
+    vectors = rng.standard_normal((len(ids), EMBEDDING_DIM)).astype(np.float32)
+    return [
+        {"id": int(i), "category": CATEGORIES[int(i) % len(CATEGORIES)], "embedding": format_vector_text(v)}
+        for i, v in zip(ids, vectors)
+    ]
+
+
+def rebuild(rows):
+    return EmbeddingMatrix.from_embeddings([r["id"] for r in rows], [r["category"] for r in rows], decode_embedding_rows(rows))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, nargs="+", default=[500, 2000])
+    parser.add_argument("--changed", type=int, nargs="+", default=[0, 5, 50])
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f"{'items':>6} {'changed':>8} {'full KB':>9} {'full ms':>8} {'delta KB':>9} {'delta ms':>9}")
+    for n in args.items:
+        rows = make_rows(range(1, n + 1), rng)
+        cached = rebuild(rows)
+        full_kb = len(json.dumps(rows)) / 1024
+        started = time.perf_counter()
+        rebuild(rows)
+        full_ms = (time.perf_counter() - started) * 1000
+
+        for k in args.changed:
+            # Half edits of existing items, half new ones
+            changed = make_rows(list(range(1, k // 2 + 1)) + list(range(n + 1, n + 1 + k - k // 2)), rng)
+            delta_kb = (len(json.dumps(changed)) + len(json.dumps({"count": n}))) / 1024
+            started = time.perf_counter()
+            merge_embedding_changes(cached, changed)
+            delta_ms = (time.perf_counter() - started) * 1000
+            print(f"{n:>6} {k:>8} {full_kb:>9.0f} {full_ms:>8.1f} {delta_kb:>9.1f} {delta_ms:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
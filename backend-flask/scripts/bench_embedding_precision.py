@@ -0,0 +1,66 @@
+"""
+Memory per 1,000 cached items and top-N ranking agreement for each
+EMBEDDING_PRECISION, against the previous cache layout (raw + normalized
+float32 matrices, Python lists of ids and categories).
+
+    python scripts/bench_embedding_precision.py --items 1000 --queries 200
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.embedding_codec import EMBEDDING_DIM  # noqa: E402
+from app.recommendation.embedding_cache import entry_nbytes  # noqa: E402
+from app.recommendation.embedding_matrix import CATEGORIES, PRECISIONS, EmbeddingMatrix  # noqa: E402
+
+TOP_N = 3
+
+
+def make_wardrobe(n):
+    rng = np.random.default_rng(0)
+    # Clustered vectors, closer to real sentence embeddings than pure noise
+    centers = rng.standard_normal((20, EMBEDDING_DIM))
+    embeddings = (centers[rng.integers(0, 20, n)] + 0.6 * rng.standard_normal((n, EMBEDDING_DIM))).astype(np.float32)
+    ids = list(range(1, n + 1))
+    categories = [CATEGORIES[i] for i in rng.integers(0, len(CATEGORIES) - 1, n)]
+    return ids, categories, embeddings
+
+
+def top_n(scores, n):
+    return set(np.argsort(-scores, kind="stable")[:n].tolist())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    ids, categories, embeddings = make_wardrobe(args.items)
+    norms = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    old_bytes = entry_nbytes({"ids": ids, "embeddings": embeddings, "norms": norms, "categories": categories})
+    per_k = 1000 / args.items
+
+    print(f"{args.items} items x {EMBEDDING_DIM} dims, top-{TOP_N} agreement over {args.queries} queries")
+    print(f"{'layout':<22}{'KiB / 1k items':>16}{'saved':>10}{'top-N match':>14}")
+    print(f"{'old (raw + norms)':<22}{old_bytes * per_k / 1024:>16.0f}{'-':>10}{'-':>14}")
+
+    baseline = EmbeddingMatrix.from_embeddings(ids, categories, embeddings, precision="float32")
+    rng = np.random.default_rng(1)
+    queries = rng.integers(0, args.items, args.queries)
+    for precision in PRECISIONS:
+        matrix = EmbeddingMatrix.from_embeddings(ids, categories, embeddings, precision=precision)
+        matches = 0
+        for q in queries:
+            query = baseline.vector(q)
+            matches += top_n(matrix.scores(query), TOP_N + 1) == top_n(baseline.scores(query), TOP_N + 1)
+        saved = 1 - matrix.nbytes / old_bytes
+        print(f"{precision:<22}{matrix.nbytes * per_k / 1024:>16.0f}{saved:>10.0%}{matches / len(queries):>14.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark for outbound HTTP calls against a local stub server.
+
+Compares the previous module-level `requests.post` (a new connection per call)
+with the shared pooled client in app/http_client.py. The stub adds a fixed
+delay to every *new* connection to stand in for the TCP + TLS handshake to
+OpenRouter / Hugging Face, and counts how many connections were opened.
+
+    python scripts/bench_http_client.py --requests 50 --handshake-ms 40
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.http_client import post_with_retries  # noqa: E402
+
+RESPONSE = json.dumps({"choices": [{"message": {"content": '{"shoes": 2}'}}]}).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # as real servers do
+        self.server.connections += 1
+        time.sleep(self.server.handshake_delay)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    connections = 0
+    handshake_delay = 0.0
+
+
+def run(label, server, url, n, post):
+    server.connections = 0
+    payload = {"model": "stub", "messages": [{"role": "user", "content": "x" * 2000}]}
+    started = time.perf_counter()
+    for _ in range(n):
+        post(url, payload)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<22} {elapsed * 1000 / n:8.2f} ms/request   {server.connections:4d} connections")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--handshake-ms", type=float, default=40, help="simulated connect + TLS cost per new connection")
+    args = parser.parse_args()
+
+    server = StubServer(("127.0.0.1", 0), StubHandler)
+    server.handshake_delay = args.handshake_ms / 1000
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/api/v1/chat/completions"
+
+    print(f"{args.requests} sequential POSTs, {args.handshake_ms:.0f} ms simulated handshake\n")
+    run("requests.post", server, url, args.requests,
+        lambda u, p: requests.post(u, json=p, timeout=30).json())
+    run("shared http_client", server, url, args.requests,
+        lambda u, p: post_with_retries(u, json=p).json())
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
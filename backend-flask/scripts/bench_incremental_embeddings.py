@@ -0,0 +1,72 @@
+"""
+Cost of keeping a user's cached EmbeddingMatrix current after a save/delete:
+rebuilding it from every Supabase row (what clear_user_embeddings led to on
+the next recommendation, minus the fetch itself) versus patching one row.
+
+    python scripts/bench_incremental_embeddings.py --items 500 2000 10000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.embedding_codec import EMBEDDING_DIM, decode_embedding_rows, format_vector_text  # noqa: E402
+from app.recommendation.embedding_matrix import EmbeddingMatrix  # noqa: E402
+
+CATEGORIES = ["top", "bottom", "shoes", "outerwear", "accessory"]
+
+
+def make_rows(n, rng):
+    return [
+        {"id": i + 1, "category": CATEGORIES[i % len(CATEGORIES)], "embedding": format_vector_text(v)}
+        for i, v in enumerate(rng.standard_normal((n, EMBEDDING_DIM)).astype(np.float32))
+    ]
+
+
+def rebuild(rows):
+    return EmbeddingMatrix.from_embeddings([r["id"] for r in rows], [r["category"] for r in rows], decode_embedding_rows(rows))
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, nargs="+", default=[500, 2000, 10000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f"{'items':>6} {'rebuild us':>11} {'upsert us':>10} {'delete us':>10} {'category us':>12}")
+    for n in args.items:
+        rows = make_rows(n, rng)
+        matrix = rebuild(rows)
+        vectors = rng.standard_normal((args.repeat, EMBEDDING_DIM)).astype(np.float32)
+        rebuild_us = timed(lambda: rebuild(rows), max(1, args.repeat // 50))
+
+        state = {"m": matrix.with_row(n + 1, "top", vectors[0]), "i": 0}  # first append copies into a spare buffer
+
+        def upsert():
+            state["i"] += 1
+            state["m"] = state["m"].with_row(n + 1 + state["i"], "shoes", vectors[state["i"] % args.repeat])
+
+        def delete():
+            state["i"] -= 1
+            state["m"] = state["m"].without_row(n + 1 + state["i"])
+
+        upsert_us = timed(upsert, args.repeat)
+        delete_us = timed(delete, args.repeat)
+        category_us = timed(lambda: state["m"].with_category(1, "bottom"), args.repeat)
+        print(f"{n:>6} {rebuild_us:>11.0f} {upsert_us:>10.1f} {delete_us:>10.1f} {category_us:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
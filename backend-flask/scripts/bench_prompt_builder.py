@@ -0,0 +1,140 @@
+"""
+Prompt size (and optionally LLM parse success) of the compact prompt builder
+versus the previous free-text `+=` prompt.
+
+Offline it compares characters and estimated tokens for synthetic shortlists of
+growing size. With --live N and OPEN_ROUTER_API_KEY set, it also sends N
+requests per builder to OpenRouter and counts answers that parse to a JSON
+object whose ids all come from the shortlist.
+
+    python scripts/bench_prompt_builder.py --top-n 3 5 10
+    python scripts/bench_prompt_builder.py --top-n 3 --live 10
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.recommendation.prompt_builder import PROMPT_TOKEN_BUDGET, build_outfit_prompt, estimate_tokens  # noqa: E402
+
+CATEGORIES = ["bottom", "shoes", "outerwear", "accessory"]
+NAMES = ["wide leg trousers", "chunky loafers", "oversized wool coat", "gold hoop earrings", "pleated midi skirt",
+         "white leather sneakers", "cropped denim jacket", "canvas tote bag", "tailored shorts", "suede ankle boots"]
+COLOURS = ["black", "white", "navy", "camel", "light blue", "olive green", "burgundy", "cream"]
+STYLES = ["casual", "minimal", "smart", "street", "boho", "classic", "sporty", "vintage"]
+
+
+def legacy_prompt(shortlist, selected_item):
+    # The previous llm_service.build_outfit_prompt, kept here as the baseline
+    style_names = [cs['styles']['name'] for cs in selected_item.get('clothes_styles', [])]
+    prompt = f"You are a fashion stylist. Create a complete outfit based on:\n"
+    prompt += f"- {selected_item['name']}, color: {selected_item['colour']}, style: {', '.join(style_names)}\n\n"
+    prompt += "Here are the candidates:\n"
+    for category, items in shortlist.items():
+        for item in items:
+            if item['id'] == selected_item['id']:
+                continue
+            item_styles = ", ".join([cs['styles']['name'] for cs in item.get("clothes_styles", [])])
+            prompt += f"- {item['type']} (id: {item['id']}): {item['name']}, color: {item['colour']}, styles: {item_styles}\n"
+    prompt += (
+        "\nInstructions:"
+        "\n- Pick exactly **1 item per category** from the candidates list ONLY."
+        "\n- You must return the **id** value of each chosen item (not its name)."
+        "\n- Do NOT invent or mention any items not listed in the candidates."
+        f"\n- Do NOT include the base category ('{category}') in your outfit."
+        "\n- If no perfect match, pick the closest style or color match."
+        "\n- Return the outfit as a single JSON object with keys for each category, plus two extra keys: 'style_phrase' and 'style_flair'."
+        "\n- After the outfit JSON, do NOT add explanations or commentary."
+        "\n- Example output format (must return cloth IDs integer, not names text):"
+        '\n  {"shoes": 2, "accessory": 10, "jacket": 26, "style_phrase": "formal minimalist", "style_flair": "Perfect for a laid-back lunch event."}'
+    )
+    return prompt
+
+
+def make_item(rng, item_id, category):
+    styles = rng.sample(STYLES, 2)
+    return {
+        "id": item_id, "type": category, "category": category,
+        "name": rng.choice(NAMES), "colour": rng.choice(COLOURS),
+        "styles": styles, "clothes_styles": [{"styles": {"name": s}} for s in styles],
+    }
+
+
+def make_shortlist(top_n, seed=0):
+    rng = random.Random(seed)
+    selected = make_item(rng, 1, "top")
+    shortlist, similarities, next_id = {}, {}, 2
+    for category in CATEGORIES:
+        shortlist[category] = []
+        for rank in range(top_n):
+            shortlist[category].append(make_item(rng, next_id, category))
+            similarities[next_id] = 0.9 - 0.05 * rank
+            next_id += 1
+    return selected, shortlist, similarities
+
+
+def is_valid_answer(content, shortlist):
+    try:
+        answer = json.loads(content.strip().removeprefix("```json").removesuffix("```").strip())
+    except (json.JSONDecodeError, AttributeError):
+        return False
+    if not isinstance(answer, dict):
+        return False
+    allowed = {item["id"] for items in shortlist.values() for item in items}
+    ids = [v for k, v in answer.items() if k not in ("style_phrase", "style_flair")]
+    return bool(ids) and all(isinstance(v, int) and v in allowed for v in ids)
+
+
+def run_live(selected, shortlist, similarities, n):
+    from app.recommendation import llm_service
+    from app.http_client import post_with_retries, default_timeout
+
+    def ask(prompt, json_mode):
+        llm_service.LLM_JSON_MODE = json_mode
+        headers, body = llm_service._openrouter_request(prompt)
+        response = post_with_retries(llm_service.OPENROUTER_URL, headers=headers, content=body,
+                                     timeout=default_timeout(read=60))
+        return response.json()["choices"][0]["message"]["content"]
+
+    for label, prompt, json_mode in (
+        ("legacy", legacy_prompt(shortlist, selected), False),
+        ("compact", build_outfit_prompt(shortlist, selected, similarities)[0], True),
+    ):
+        ok = 0
+        for _ in range(n):
+            try:
+                ok += is_valid_answer(ask(prompt, json_mode), shortlist)
+            except Exception as e:
+                print(f"  {label}: request failed: {e}")
+        print(f"{label:<8} parse success {ok}/{n}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top-n", type=int, nargs="+", default=[3, 5, 10])
+    parser.add_argument("--live", type=int, default=0, help="LLM requests per builder (needs OPEN_ROUTER_API_KEY)")
+    args = parser.parse_args()
+
+    print(f"token budget {PROMPT_TOKEN_BUDGET}, {len(CATEGORIES)} categories\n")
+    print(f"{'top-n':>5} {'legacy chars':>13} {'~tokens':>8} {'compact chars':>14} {'~tokens':>8} {'kept':>5} {'build us':>9}")
+    for top_n in args.top_n:
+        selected, shortlist, similarities = make_shortlist(top_n)
+        old = legacy_prompt(shortlist, selected)
+        new, stats = build_outfit_prompt(shortlist, selected, similarities)
+        build_us = timeit.timeit(lambda: build_outfit_prompt(shortlist, selected, similarities), number=200) / 200 * 1e6
+        print(f"{top_n:>5} {len(old):>13} {estimate_tokens(old):>8} {len(new):>14} {stats['estimated_tokens']:>8} "
+              f"{stats['candidates']:>2}/{top_n * len(CATEGORIES):<2} {build_us:>9.1f}")
+
+    if args.live:
+        if not os.getenv("OPEN_ROUTER_API_KEY"):
+            sys.exit("--live needs OPEN_ROUTER_API_KEY")
+        print()
+        run_live(*make_shortlist(args.top_n[0]), args.live)
+
+
+if __name__ == "__main__":
+    main()
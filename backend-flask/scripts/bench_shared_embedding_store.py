@@ -0,0 +1,90 @@
+"""
+Cold-worker cost of one user's embeddings: decode from Supabase rows (what
+every worker did on its own) versus attaching to the shared-memory store that
+another worker already filled.
+
+Each of --workers processes loads the same wardrobe and reports the load time
+and how much private memory (USS) it gained. With the shared store the
+vectors live once in /dev/shm and every worker maps them.
+
+    python scripts/bench_shared_embedding_store.py --items 2000 --workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import psutil
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.embedding_codec import EMBEDDING_DIM, decode_embedding_rows, format_vector_text  # noqa: E402
+from app.recommendation.embedding_matrix import EmbeddingMatrix  # noqa: E402
+from app.recommendation.shared_embedding_store import SharedEmbeddingStore  # noqa: E402
+
+USER = "bench-user"
+
+
+def make_rows(n):
+    rng = np.random.default_rng(0)
+    categories = ["top", "bottom", "shoes", "outerwear", "accessory"]
+    return [
+        {"id": i + 1, "category": categories[i % len(categories)], "embedding": format_vector_text(v)}
+        for i, v in enumerate(rng.standard_normal((n, EMBEDDING_DIM)).astype(np.float32))
+    ]
+
+
+def decode(rows):
+    return EmbeddingMatrix.from_embeddings([r["id"] for r in rows], [r["category"] for r in rows], decode_embedding_rows(rows))
+
+
+def worker(mode, rows, directory, results):
+    process = psutil.Process()
+    before = process.memory_full_info().uss
+    started = time.perf_counter()
+    if mode == "private":
+        matrix = decode(rows)
+    else:
+        store = SharedEmbeddingStore(directory)
+        matrix = store.get(USER, store.generation(USER))
+    elapsed = time.perf_counter() - started
+    matrix.scores(matrix.vector(0))  # touch the pages a recommendation reads
+    results.put((elapsed, process.memory_full_info().uss - before))
+
+
+def run(mode, rows, directory, workers):
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=worker, args=(mode, rows, directory, results)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    samples = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    load_ms = sum(s[0] for s in samples) / len(samples) * 1000
+    uss_mb = sum(s[1] for s in samples) / 2**20
+    print(f"{mode:<8} load {load_ms:8.2f} ms/worker   private memory gained by {workers} workers {uss_mb:7.2f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    rows = make_rows(args.items)
+    matrix = decode(rows)
+    print(f"{args.items} items, matrix {matrix.nbytes / 2**20:.2f} MB\n")
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    with tempfile.TemporaryDirectory(dir=base) as directory:
+        store = SharedEmbeddingStore(directory)
+        store.put(USER, matrix, store.generation(USER))  # filled once by the first worker
+        multiprocessing.set_start_method("fork")
+        run("private", rows, directory, args.workers)
+        run("shared", rows, directory, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+Load test for SERVER_MODE=asgi with stubbed backends.
+
+Fires --requests POST /api/recommendations/ai calls at once, --concurrency at a
+time, against:
+- the ASGI app (create_asgi_app) in-process through httpx.ASGITransport, with
+  Supabase queries replaced by asyncio.sleep stubs;
+- the Flask app on a --threads thread pool (gunicorn's gthread worker), with
+  the same stubs as time.sleep.
+
+The OpenRouter call is not stubbed in-process: OPENROUTER_URL points at a stub
+server on a local socket, reached through the app's own pooled clients
+(get_async_http_client / get_http_client), so HTTP_MAX_CONNECTIONS and the
+5 s pool timeout apply as in production. The stub speaks HTTP/1.1 (no TLS,
+so no h2 via ALPN): each in-flight call holds one pooled connection, where
+OpenRouter's HTTP/2 would multiplex them. Calls that wait too long for a
+connection fall back to the local ranker and aren't counted as LLM outfits.
+
+Every request is for a different (user, item), so none is served from the
+recommendation cache. Reports wall time, latency percentiles, LLM outfits and
+local-ranker fallbacks, how many LLM calls the stub saw in flight at once, and
+the process RSS.
+
+    python scripts/loadtest_asgi.py --requests 500 --concurrency 500
+    python scripts/loadtest_asgi.py --requests 200 --db-ms 30 --llm-ms 1500 --skip-wsgi
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import socket
+import sys
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+warnings.filterwarnings("ignore", message="The HMAC key")  # dev-secret is fine for a local run
+os.environ.setdefault("TRACE_LOG", "0")
+os.environ.setdefault("FLASK_ENV", "production")
+os.environ.setdefault("SUPABASE_URL", "http://supabase.invalid")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "stub")
+
+import httpx  # noqa: E402
+import jwt  # noqa: E402
+import uvicorn  # noqa: E402
+from starlette.applications import Starlette  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+from starlette.routing import Route  # noqa: E402
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app import http_client  # noqa: E402
+from app.asgi import create_asgi_app  # noqa: E402
+from app.auth.auth_utils import SECRET_KEY  # noqa: E402
+from app.memory_logger import rss_bytes  # noqa: E402
+from app.recommendation import async_service, embedding_service, llm_service  # noqa: E402
+
+ITEMS_PER_USER = 30
+CATEGORIES = ["top", "bottom", "shoes", "outerwear", "accessory"]
+DIM = 384
+
+
+def make_wardrobe(user_index):
+    rng = random.Random(user_index)
+    rows = []
+    for n in range(ITEMS_PER_USER):
+        item_id = user_index * 1000 + n + 1
+        rows.append({
+            "id": item_id,
+            "category": CATEGORIES[n % len(CATEGORIES)],
+            "embedding": [rng.uniform(-1, 1) for _ in range(DIM)],
+            "name": f"item {n}", "type": CATEGORIES[n % len(CATEGORIES)], "colour": rng.choice(["black", "white", "navy"]),
+            "image_url": f"https://example.invalid/{item_id}.jpg",
+            "clothes_styles": [{"styles": {"id": 1, "name": "casual"}}],
+        })
+    return rows
+
+
+class Backend:
+    """Synthetic wardrobes, latency stubs for Supabase and a stub OpenRouter server."""
+
+    def __init__(self, users, db_ms, llm_ms):
+        self.wardrobes = [make_wardrobe(u) for u in range(users)]  # user ids are "<run>-<index>"
+        self.items = {row["id"]: row for rows in self.wardrobes for row in rows}
+        self.db_delay = db_ms / 1000
+        self.llm_delay = llm_ms / 1000
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def embeddings(self, user_id):
+        rows = self.wardrobes[int(user_id.rsplit("-", 1)[1])]
+        return [{"id": r["id"], "category": r["category"], "embedding": r["embedding"]} for r in rows]
+
+    def details(self, ids):
+        return [
+            {k: v for k, v in self.items[i].items() if k != "embedding"}
+            for i in ids if i in self.items
+        ]
+
+    @staticmethod
+    def llm_answer(body):
+        # Pick the first candidate of every [category] block of the prompt
+        prompt = json.loads(body)["messages"][0]["content"]
+        answer, category = {}, None
+        for line in prompt.splitlines():
+            header = re.fullmatch(r"\[(\w+)\]", line)
+            if header:
+                category = header.group(1)
+            elif category and category not in answer and re.match(r"\d+\|", line):
+                answer[category] = int(line.split("|", 1)[0])
+        answer.update(style_phrase="easy casual", style_flair="Stub stylist.")
+        return {"choices": [{"message": {"content": json.dumps(answer)}}]}
+
+    async def llm(self, request):
+        self.in_flight += 1  # the stub server runs on one event loop
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.llm_delay)
+            return JSONResponse(self.llm_answer(await request.body()))
+        finally:
+            self.in_flight -= 1
+
+    def serve_llm(self):
+        """Start the stub OpenRouter on a free local port in a thread and point OPENROUTER_URL at it."""
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        app = Starlette(routes=[Route("/api/v1/chat/completions", self.llm, methods=["POST"])])
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning",
+                                               backlog=4096, timeout_keep_alive=60))
+        threading.Thread(target=server.run, daemon=True).start()
+        while not server.started:
+            time.sleep(0.05)
+        llm_service.OPENROUTER_URL = f"http://127.0.0.1:{port}/api/v1/chat/completions"
+
+    # --- async stubs (ASGI mode) ---
+    def install_async(self):
+        from app.utils import get_current_user_id
+
+        async def get_all_cloth_embedding_async():
+            await asyncio.sleep(self.db_delay)
+            return self.embeddings(get_current_user_id())
+
+        async def get_details_for_ids_async(ids, with_image=False):
+            await asyncio.sleep(self.db_delay)
+            return self.details(ids)
+
+        async_service.get_all_cloth_embedding_async = get_all_cloth_embedding_async
+        async_service.get_details_for_ids_async = get_details_for_ids_async
+        http_client._async_client = None  # the production client, created on this run's event loop
+
+    # --- sync stubs (Flask on threads) ---
+    def install_sync(self):
+        from app.utils import get_current_user_id
+
+        def get_all_cloth_embedding():
+            time.sleep(self.db_delay)
+            return self.embeddings(get_current_user_id())
+
+        def get_details_for_ids(ids, with_image=False):
+            time.sleep(self.db_delay)
+            return self.details(ids)
+
+        embedding_service.get_all_cloth_embedding = get_all_cloth_embedding
+        embedding_service.get_details_for_ids = get_details_for_ids
+        http_client._client = None  # the production client
+
+
+def request_plan(n, run):
+    """(token, item_id) per request, each a distinct (user, item) pair no earlier run has cached."""
+    users = -(-n // ITEMS_PER_USER)
+    plan = []
+    for i in range(n):
+        user, item = divmod(i, ITEMS_PER_USER)
+        token = jwt.encode({"sub": f"{run}-{user}", "exp": int(time.time()) + 3600}, SECRET_KEY, algorithm="HS256")
+        plan.append((token, user * 1000 + item + 1))
+    return users, plan
+
+
+def summarize(label, latencies, wall, sources, backend, rss_before):
+    latencies = sorted(latencies)
+    pct = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000  # noqa: E731
+    print(f"{label:<6} {len(latencies):>5} req  llm {sources.get('llm', 0):>5}  local {sources.get('local', 0):>5}  "
+          f"wall {wall:6.2f}s  {len(latencies) / wall:7.1f} req/s  "
+          f"p50 {pct(0.5):7.0f}ms  p99 {pct(0.99):7.0f}ms  peak LLM in flight {backend.peak_in_flight:>4}  "
+          f"RSS {rss_before / 2**20:.0f}->{rss_bytes() / 2**20:.0f} MB")
+
+
+async def run_asgi(asgi_app, plan, concurrency):
+    limit = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=asgi_app)
+    latencies, sources = [], {}
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+        async def one(token, item_id):
+            async with limit:
+                started = time.perf_counter()
+                response = await client.post("/api/recommendations/ai", json={"item_id": item_id},
+                                             headers={"Authorization": f"Bearer {token}"})
+                latencies.append(time.perf_counter() - started)
+                source = response.json().get("source") if response.status_code == 200 else response.status_code
+                sources[source] = sources.get(source, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(token, item_id) for token, item_id in plan))
+        result = latencies, time.perf_counter() - started, sources
+    await http_client.close_async_http_client()
+    return result
+
+
+def run_wsgi(flask_app, plan, threads):
+    latencies = []
+
+    def one(token, item_id):
+        with flask_app.test_client() as client:
+            response = client.post("/api/recommendations/ai", json={"item_id": item_id},
+                                   headers={"Authorization": f"Bearer {token}"})
+        # From submission: includes the time queued for a free thread, as under gthread
+        latencies.append(time.perf_counter() - started)
+        return response.get_json().get("source") if response.status_code == 200 else response.status_code
+
+    started = time.perf_counter()
+    sources = {}
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for source in pool.map(lambda args: one(*args), plan):
+            sources[source] = sources.get(source, 0) + 1
+    return latencies, time.perf_counter() - started, sources
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=500, help="ASGI requests in flight at once")
+    parser.add_argument("--threads", type=int, default=2, help="WSGI baseline threads (gunicorn.conf.py)")
+    parser.add_argument("--db-ms", type=float, default=40, help="latency of each stubbed Supabase query")
+    parser.add_argument("--llm-ms", type=float, default=800, help="latency of the stubbed OpenRouter call")
+    parser.add_argument("--skip-wsgi", action="store_true")
+    args = parser.parse_args()
+
+    users, plan = request_plan(args.requests, "asgi")
+    backend = Backend(users, args.db_ms, args.llm_ms)
+    asgi_app = create_asgi_app()
+    backend.serve_llm()
+    print(f"{args.requests} requests over {users} users, Supabase {args.db_ms:.0f}ms/query, LLM {args.llm_ms:.0f}ms, "
+          f"LLM pool {http_client._limits().max_connections} connections\n")
+
+    quiet = io.StringIO()  # the pipeline's per-request prints
+    rss_before = rss_bytes()
+    backend.install_async()
+    with contextlib.redirect_stdout(quiet):
+        result = asyncio.run(run_asgi(asgi_app, plan, args.concurrency))
+    summarize("asgi", *result, backend, rss_before)
+
+    if args.skip_wsgi:
+        return
+    _, plan = request_plan(args.requests, "wsgi")
+    embedding_service.EMBED_CACHE.clear()
+    backend.peak_in_flight = 0
+    rss_before = rss_bytes()
+    backend.install_sync()
+    with contextlib.redirect_stdout(quiet):
+        result = run_wsgi(asgi_app.state.flask_app, plan, args.threads)
+    summarize(f"wsgi/{args.threads}", *result, backend, rss_before)
+
+
+if __name__ == "__main__":
+    main()
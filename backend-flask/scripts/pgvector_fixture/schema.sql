@@ -0,0 +1,35 @@
+-- The slice of the Supabase schema the backend reads and writes, with the same
+-- keys and unique constraints, for the local fixture only (Supabase already has
+-- these tables and roles).
+create extension if not exists vector;
+
+create role anon nologin;
+
+create table public.styles (
+    id bigserial primary key,
+    name text not null unique
+);
+
+create table public.clothes (
+    id bigserial primary key,
+    user_id uuid not null,
+    name text not null,
+    type text,
+    category text,
+    colour text,
+    image_url text,
+    embedding vector(384),
+    created_at timestamptz not null default now(),
+    unique (user_id, name)  -- saves match an existing item by name
+);
+
+create table public.clothes_styles (
+    cloth_id bigint not null references public.clothes (id) on delete cascade,
+    style_id bigint not null references public.styles (id) on delete cascade,
+    primary key (cloth_id, style_id)
+);
+
+-- PostgREST runs every request as anon here (no JWT secret configured)
+grant usage on schema public to anon;
+grant all on all tables in schema public to anon;
+grant all on all sequences in schema public to anon;
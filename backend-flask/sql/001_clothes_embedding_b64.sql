@@ -0,0 +1,8 @@
+-- Compact binary copy of clothes.embedding (raw little-endian float32, base64 text).
+-- Read/written by the backend when EMBEDDING_STORAGE=binary; the pgvector column
+-- stays the source of truth for server-side similarity search.
+alter table public.clothes
+    add column if not exists embedding_b64 text;
+
+-- Optional backfill is done from the backend (see scripts/backfill_embedding_b64.py)
+-- because Postgres has no built-in float4 -> bytes cast for pgvector values.
@@ -0,0 +1,102 @@
+-- Create or update a cloth, its styles and (optionally) its embedding in one
+-- transaction / one PostgREST round trip. Returns the hydrated row:
+-- {id, name, type, colour, category, image_url, styles: [names], has_embedding}
+--
+-- Matching follows the previous multi-call path: by id (must belong to the
+-- user), else by (user_id, name), else a new row. The junction rows are only
+-- replaced when at least one style is given. A null p_embedding keeps the
+-- stored vector (the background embedding job fills it in later).
+create or replace function public.upsert_cloth_with_styles(
+    p_user_id uuid,
+    p_cloth_id bigint,
+    p_name text,
+    p_type text,
+    p_category text,
+    p_colour text,
+    p_style_ids bigint[] default '{}',
+    p_style_names text[] default '{}',
+    p_embedding text default null,
+    p_embedding_b64 text default null
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_cloth_id bigint := p_cloth_id;
+    v_style_names text[];
+    v_style_ids bigint[];
+begin
+    -- 1. New style names (existing names just resolve to their id)
+    select coalesce(array_agg(distinct lower(trim(n))), '{}')
+      into v_style_names
+      from unnest(coalesce(p_style_names, '{}')) as n
+     where trim(n) <> '';
+
+    insert into public.styles (name)
+    select unnest(v_style_names)
+    on conflict (name) do nothing;
+
+    select coalesce(array_agg(distinct s.id), '{}')
+      into v_style_ids
+      from public.styles s
+     where s.id = any(coalesce(p_style_ids, '{}'))
+        or s.name = any(v_style_names);
+
+    -- 2. Cloth row
+    if v_cloth_id is null then
+        select c.id into v_cloth_id
+          from public.clothes c
+         where c.user_id = p_user_id and c.name = p_name
+         limit 1
+           for update;
+    end if;
+
+    if v_cloth_id is null then
+        insert into public.clothes (user_id, name, type, category, colour, embedding, embedding_b64)
+        values (p_user_id, p_name, p_type, p_category, p_colour, p_embedding::vector, p_embedding_b64)
+        returning id into v_cloth_id;
+    else
+        update public.clothes c
+           set name = p_name,
+               type = p_type,
+               category = p_category,
+               colour = p_colour,
+               embedding = coalesce(p_embedding::vector, c.embedding),
+               embedding_b64 = case when p_embedding is null then c.embedding_b64 else p_embedding_b64 end
+         where c.id = v_cloth_id and c.user_id = p_user_id;
+        if not found then
+            raise exception 'Cloth % not found or not yours', v_cloth_id using errcode = 'P0002';
+        end if;
+    end if;
+
+    -- 3. Junction table
+    if array_length(v_style_ids, 1) > 0 then
+        delete from public.clothes_styles cs
+         where cs.cloth_id = v_cloth_id and cs.style_id <> all(v_style_ids);
+        insert into public.clothes_styles (cloth_id, style_id)
+        select v_cloth_id, unnest(v_style_ids)
+        on conflict do nothing;
+    end if;
+
+    -- 4. Hydrated row for the frontend
+    return (
+        select jsonb_build_object(
+            'id', c.id,
+            'name', c.name,
+            'type', c.type,
+            'colour', c.colour,
+            'category', c.category,
+            'image_url', c.image_url,
+            'styles', coalesce((
+                select jsonb_agg(s.name order by s.name)
+                  from public.clothes_styles cs
+                  join public.styles s on s.id = cs.style_id
+                 where cs.cloth_id = c.id
+            ), '[]'::jsonb),
+            'has_embedding', c.embedding is not null
+        )
+          from public.clothes c
+         where c.id = v_cloth_id
+    );
+end;
+$$;
@@ -0,0 +1,17 @@
+-- Keyset pagination for GET /api/clothes?cursor=...: pages are read in
+-- (category, id) order straight from this index.
+create index if not exists clothes_user_category_id_idx
+    on public.clothes (user_id, category, id);
+
+-- Per-category counts for the closet filters, in one round trip.
+create or replace function public.count_clothes_by_category(p_user_id uuid)
+returns table (category text, count bigint)
+language sql
+stable
+as $$
+    select c.category, count(*)
+      from public.clothes c
+     where c.user_id = p_user_id
+     group by c.category
+     order by c.category;
+$$;
@@ -0,0 +1,25 @@
+-- Change tracking for the embedding cache's delta sync (EMBEDDING_SYNC=delta):
+-- a refresh only reads rows whose updated_at is past the cached watermark, and
+-- compares the user's row count to spot deletes.
+alter table public.clothes
+    add column if not exists updated_at timestamptz not null default now();
+
+create or replace function public.clothes_touch_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+drop trigger if exists clothes_touch_updated_at on public.clothes;
+create trigger clothes_touch_updated_at
+    before update on public.clothes
+    for each row
+    when (old.* is distinct from new.*)
+    execute function public.clothes_touch_updated_at();
+
+create index if not exists clothes_user_updated_at_idx
+    on public.clothes (user_id, updated_at);
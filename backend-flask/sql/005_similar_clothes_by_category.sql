@@ -0,0 +1,81 @@
+-- Server-side shortlist for SIMILARITY_BACKEND=pgvector: the top-N cosine
+-- neighbours of one item in every compatible category, computed next to the
+-- data instead of shipping the user's whole embedding set to the backend.
+-- Needs pgvector >= 0.8 (iterative index scans).
+create extension if not exists vector;
+
+-- HNSW over cosine distance. A user/category filter discards most of what one
+-- graph probe returns, so the function turns on iterative scans, which keep
+-- walking the graph until each category has its N rows. Small wardrobes are
+-- usually planned on clothes_user_category_id_idx (003) with an exact sort.
+create index if not exists clothes_embedding_hnsw_idx
+    on public.clothes using hnsw (embedding vector_cosine_ops);
+
+-- p_exclusions: {selected category: [categories never suggested with it]},
+-- sent by the backend from its exclusion table so the rules live in one place
+-- (categories it doesn't know use the "unknown" entry). Returns
+-- {selected: {category, has_embedding} | null,
+--  candidates: [{id, category, similarity}] grouped by category, best first,
+--  pending_ids: [ids whose embedding hasn't been computed yet]}
+create or replace function public.similar_clothes_by_category(
+    p_user_id uuid,
+    p_item_id bigint,
+    p_exclusions jsonb default '{}',
+    p_per_category int default 3
+)
+returns jsonb
+language sql
+stable
+set hnsw.iterative_scan = 'relaxed_order'
+as $$
+    with selected as (
+        select c.category, c.embedding
+          from public.clothes c
+         where c.id = p_item_id and c.user_id = p_user_id
+    ),
+    excluded as (
+        select array(
+                   select jsonb_array_elements_text(
+                       coalesce(p_exclusions -> s.category, p_exclusions -> 'unknown', '[]'::jsonb))
+               ) || s.category as categories  -- never the selected item's own category
+          from selected s
+    ),
+    categories as (
+        select distinct c.category
+          from public.clothes c
+         cross join excluded e
+         where c.user_id = p_user_id
+           and c.category <> all(e.categories)
+    ),
+    candidates as (
+        select n.id, cat.category, n.similarity
+          from selected s
+         cross join categories cat
+         cross join lateral (
+             select c.id, 1 - (c.embedding <=> s.embedding) as similarity
+               from public.clothes c
+              where c.user_id = p_user_id
+                and c.category = cat.category
+                and c.embedding is not null
+              order by c.embedding <=> s.embedding
+              limit p_per_category
+         ) n
+         where s.embedding is not null
+    )
+    select jsonb_build_object(
+        'selected', (
+            select jsonb_build_object('category', s.category, 'has_embedding', s.embedding is not null)
+              from selected s
+        ),
+        'candidates', coalesce((
+            select jsonb_agg(jsonb_build_object('id', c.id, 'category', c.category, 'similarity', c.similarity)
+                             order by c.category, c.similarity desc)
+              from candidates c
+        ), '[]'::jsonb),
+        'pending_ids', coalesce((
+            select jsonb_agg(c.id order by c.id)
+              from public.clothes c
+             where c.user_id = p_user_id and c.embedding is null
+        ), '[]'::jsonb)
+    );
+$$;
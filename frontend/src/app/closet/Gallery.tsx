@@ -7,13 +7,13 @@ import { AddUpdateClothPayload, ClothItem, StyleTag } from "@/types";
 import {
 	addUpdateCloth,
 	deleteCloth,
-	getPageClothesByType,
+	getClothesPageByCursor,
 } from "@/utils/api/clothes";
 import { useAlert } from "@/contexts/AlertContext";
 import Image from "next/image";
 import { useLoader } from "@/contexts/FullLoaderContext";
 
-const ITEM_LIMIT = 3;
+const ITEM_LIMIT = 24;
 
 export const clothingTypes = [
 	{ type: "top", category: "top" },
@@ -50,6 +50,7 @@ export default function Gallery({
 	const [page, setPage] = useState(0);
 	const [isLoading, setIsLoading] = useState(false);
 	const [hasMore, setHasMore] = useState(true);
+	const nextCursorRef = useRef<string | null>(null);
 
 	const [selectedClothIndex, setSelectedClothIndex] = useState<number | null>(
 		null,
@@ -64,17 +65,18 @@ export default function Gallery({
 			setPage(0);
 			setHasMore(true);
 
-			const offset = 0;
+			nextCursorRef.current = null;
 
-			const data = await getPageClothesByType(
+			const data = await getClothesPageByCursor(
 				selectedCategory,
 				ITEM_LIMIT,
-				offset,
+				null,
 			);
 
 			if (!cancelled) {
-				setFetchItems(data);
-				setHasMore(data.length > 0);
+				setFetchItems(data.items);
+				nextCursorRef.current = data.next_cursor;
+				setHasMore(Boolean(data.next_cursor));
 				setIsLoading(false);
 			}
 		};
@@ -92,19 +94,20 @@ export default function Gallery({
 		const callFetchMoreData = async () => {
 			setIsLoading(true);
 
-			const offset = page * ITEM_LIMIT;
-			const data = await getPageClothesByType(
+			const data = await getClothesPageByCursor(
 				selectedCategory,
 				ITEM_LIMIT,
-				offset,
+				nextCursorRef.current,
 			);
 
-			if (!data || data.length === 0) {
+			nextCursorRef.current = data?.next_cursor ?? null;
+			if (!data?.next_cursor) {
 				setHasMore(false);
-			} else {
+			}
+			if (data?.items?.length) {
 				setFetchItems((prev) => {
 					const existingIds = new Set(prev.map((item) => item.id));
-					const filteredData = data.filter(
+					const filteredData = data.items.filter(
 						(item: ClothItem) => !existingIds.has(item.id),
 					);
 					return [...prev, ...filteredData];
@@ -1,5 +1,6 @@
 
 import { apiClient } from "@utils/api/apiClient";
+import { ClothItem } from "@/types";
 
 
 export const getPageClothesByType = async (
@@ -11,6 +12,26 @@ export const getPageClothesByType = async (
     return res;
 }
 
+export type ClothesPage = {
+    items: ClothItem[];
+    next_cursor: string | null;
+    counts?: Record<string, number>;
+};
+
+// Keyset pagination: pass null for the first page, then the previous page's next_cursor
+export const getClothesPageByCursor = async (
+    selectedCategory: string,
+    limit: number,
+    cursor: string | null
+): Promise<ClothesPage> => {
+    const params = new URLSearchParams({
+        type: selectedCategory,
+        limit: String(limit),
+        cursor: cursor ?? "",
+    });
+    return apiClient.get(`/clothes?${params.toString()}`);
+}
+
 export const getStyleTags = async () => {
     return apiClient.get("/clothes/style-tags"); // automatically sends bearer token if set
 }
@@ -23,8 +44,9 @@ export const getRandomClothes = async () => {
 
 
 
-export async function fetchRecommendations(itemId: number) {
-    const data = await apiClient.post("/recommendations/ai", { item_id: itemId });
+// different=true asks for another outfit for the same item (served from cached alternates when available)
+export async function fetchRecommendations(itemId: number, different = false) {
+    const data = await apiClient.post("/recommendations/ai", { item_id: itemId, different });
     return data;
 }
 